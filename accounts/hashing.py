@@ -0,0 +1,129 @@
+"""
+password hashing service. hashes are computed inline, or in a process pool of
+PASSWORD_HASHING_WORKERS processes so signup and login bursts queue there
+instead of taking the CPU of the request workers. the hashers read their cost
+parameters from PASSWORD_HASHER_PARAMS, tuned with the bench_hashing command,
+and a hash made with other parameters is upgraded at the next login
+"""
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+def get_params(algorithm):
+    return getattr(settings, 'PASSWORD_HASHER_PARAMS', {}).get(algorithm, {})
+
+
+class TunedHasherMixin:
+    """
+    cost parameters from PASSWORD_HASHER_PARAMS[algorithm], read once into plain
+    attributes: a pickled hasher works in a process without django settings
+    """
+    params = ()
+
+    def __init__(self):
+        for name, value in get_params(self.algorithm).items():
+            if name not in self.params:
+                raise ImproperlyConfigured(f'Unknown {self.algorithm} parameter {name!r}.')
+            setattr(self, name, value)
+
+
+class ScryptPasswordHasher(TunedHasherMixin, hashers.ScryptPasswordHasher):
+    """
+    uses 128 * work_factor * block_size bytes, past 32MiB maxmem must allow it
+    """
+    params = ('work_factor', 'block_size', 'parallelism', 'maxmem')
+
+
+class Argon2PasswordHasher(TunedHasherMixin, hashers.Argon2PasswordHasher):
+    """
+    needs the argon2-cffi package, put it first in PASSWORD_HASHERS to use it
+    """
+    params = ('time_cost', 'memory_cost', 'parallelism')
+
+
+class HashingPool:
+    """
+    runs hasher methods inline, or in worker processes when `workers` (default
+    PASSWORD_HASHING_WORKERS) is set. a hasher only needs its parameters, it's
+    pickled to the worker and settings aren't read there
+    """
+
+    def __init__(self, workers=None):
+        self._workers = workers
+        self._executor = None
+        self._lock = Lock()
+
+    @property
+    def workers(self):
+        return self._workers if self._workers is not None else getattr(settings, 'PASSWORD_HASHING_WORKERS', 0)
+
+    def get_executor(self):
+        if not self.workers:
+            return None
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def run(self, method, *args):
+        executor = self.get_executor()
+        if executor is None:
+            return method(*args)
+        return executor.submit(method, *args).result()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+pool = HashingPool()
+
+
+@receiver(setting_changed)
+def reset_hashing(setting, **kwargs):
+    if setting == 'PASSWORD_HASHING_WORKERS':
+        pool.shutdown()
+    elif setting == 'PASSWORD_HASHER_PARAMS':
+        hashers.get_hashers.cache_clear()
+        hashers.get_hashers_by_algorithm.cache_clear()
+
+
+def make_password(password, hasher='default'):
+    """
+    django's make_password, hashed by the pool
+    """
+    if password is None:
+        return hashers.make_password(None)
+    hasher = hashers.get_hasher(hasher)
+    return pool.run(hasher.encode, password, hasher.salt())
+
+
+def check_password(password, encoded, setter=None, preferred='default'):
+    """
+    django's check_password, verified by the pool. `setter` gets the password
+    when its hash is correct but not made by the preferred hasher and parameters
+    """
+    if password is None or not hashers.is_password_usable(encoded):
+        return False
+    preferred = hashers.get_hasher(preferred)
+    try:
+        hasher = hashers.identify_hasher(encoded)
+    except ValueError:
+        return False
+
+    hasher_changed = hasher.algorithm != preferred.algorithm
+    must_update = hasher_changed or preferred.must_update(encoded)
+    is_correct = pool.run(hasher.verify, password, encoded)
+    if not is_correct and not hasher_changed and must_update:
+        hasher.harden_runtime(password, encoded)
+    if setter and is_correct and must_update:
+        setter(password)
+    return is_correct
@@ -0,0 +1,69 @@
+import os
+import time
+
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, get_hasher
+from django.core.management.base import BaseCommand
+
+from accounts.hashing import Argon2PasswordHasher, HashingPool, ScryptPasswordHasher
+
+PASSWORD = 'benchmark password'
+
+
+def candidates():
+    """
+    (name, hasher) for the configured hasher and parameters around it
+    """
+    yield 'configured', get_hasher('default')
+    yield 'pbkdf2 (django default)', PBKDF2PasswordHasher()
+    for work_factor in (2 ** 13, 2 ** 14, 2 ** 15, 2 ** 16):
+        hasher = ScryptPasswordHasher()
+        hasher.work_factor, hasher.maxmem = work_factor, 256 * work_factor * hasher.block_size
+        yield f'scrypt n=2**{work_factor.bit_length() - 1}', hasher
+    for time_cost, memory_cost in ((2, 65536), (3, 65536), (2, 102400)):
+        hasher = Argon2PasswordHasher()
+        hasher.time_cost, hasher.memory_cost, hasher.parallelism = time_cost, memory_cost, 1
+        yield f'argon2 t={time_cost} m={memory_cost // 1024}MiB', hasher
+
+
+class Command(BaseCommand):
+    help = ('Time one password hash with the configured and candidate hasher parameters, then the signup '
+            '(hash) and login (verify) throughput of the configured hasher with 1 to --workers processes')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hashes', type=int, default=40, help='hashes per throughput run')
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--target-ms', type=float, default=50, help='hash time to pick parameters for')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.MIGRATE_HEADING('one hash'))
+        for name, hasher in candidates():
+            try:
+                salt = hasher.salt()
+                start = time.perf_counter()
+                hasher.encode(PASSWORD, salt)
+                ms = (time.perf_counter() - start) * 1000
+            except ValueError as error:
+                # argon2-cffi isn't installed
+                self.stdout.write(f'{name:<26} unavailable: {error}')
+                continue
+            mark = '  <= target' if ms <= options['target_ms'] else ''
+            self.stdout.write(f'{name:<26} {ms:>8.1f} ms{mark}')
+
+        hasher = get_hasher('default')
+        encoded = hasher.encode(PASSWORD, hasher.salt())
+        runs = (('signup', hasher.encode, (PASSWORD, hasher.salt())), ('login', hasher.verify, (PASSWORD, encoded)))
+        self.stdout.write(self.style.MIGRATE_HEADING(f'throughput, {hasher.algorithm}'))
+        workers = 1
+        while workers <= options['workers']:
+            pool = HashingPool(workers=workers)
+            executor = pool.get_executor()
+            # start the processes before timing
+            list(executor.map(hasher.verify, [PASSWORD] * workers, [encoded] * workers))
+            for name, method, args in runs:
+                start = time.perf_counter()
+                list(executor.map(method, *([arg] * options['hashes'] for arg in args)))
+                rate = options['hashes'] / (time.perf_counter() - start)
+                cores = min(workers, os.cpu_count())
+                self.stdout.write(f'{name:<6} {workers:>3} processes {rate:>8.1f}/s  {rate / cores:>7.1f}/s per core')
+            pool.shutdown()
+            workers *= 2
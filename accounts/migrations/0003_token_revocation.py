@@ -0,0 +1,27 @@
+# Generated by Django 4.0.3 on 2026-10-18 17:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_account_avatar_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevokedToken',
+            fields=[
+                ('jti', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('expires', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TokenEpoch',
+            fields=[
+                ('user_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('not_before', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.0.3 on 2026-10-18 17:51
+
+import core.fields
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+
+def lowercase_emails(apps, schema_editor):
+    # the serializers lowercased emails, accounts made elsewhere may not be
+    apps.get_model('accounts', 'Account').objects.exclude(email='').update(email=Lower('email'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_token_revocation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='account',
+            name='email',
+            field=core.fields.LowerCaseEmailField(blank=True, max_length=254, verbose_name='email address'),
+        ),
+        migrations.RunPython(lowercase_emails, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='account',
+            constraint=models.UniqueConstraint(condition=models.Q(('email', ''), _negated=True), fields=('email',), name='account_email_unique'),
+        ),
+    ]
@@ -1,6 +1,10 @@
+from core.fields import LowerCaseEmailField
 from core.utils import avatar_upload
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import Q
+
+from . import hashing
 
 
 class Account(AbstractUser):
@@ -8,7 +12,51 @@ class Account(AbstractUser):
 
     gender = models.CharField(max_length=6, blank=True, choices=GENDER_CHOICES)
     avatar = models.ImageField(upload_to=avatar_upload, default='avatars/default.png')
+    # content hash of the avatar, names its renditions
+    avatar_digest = models.CharField(max_length=40, blank=True, editable=False)
+    # stored lowercased, the unique index serves case insensitive lookups
+    email = LowerCaseEmailField('email address', blank=True)
 
+    class Meta(AbstractUser.Meta):
+        constraints = [
+            models.UniqueConstraint(fields=['email'], condition=~Q(email=''), name='account_email_unique'),
+        ]
 
     def __str__(self):
         return self.username
+
+    def set_password(self, raw_password):
+        self.password = hashing.make_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        def setter(raw_password):
+            self.set_password(raw_password)
+            # an upgraded hash of the same password isn't a password change
+            self._password = None
+            self.save(update_fields=['password'])
+
+        return hashing.check_password(raw_password, self.password, setter)
+
+
+class TokenEpoch(models.Model):
+    """
+    tokens of the user issued before `not_before` are revoked. no foreign key,
+    the row outlives a deleted account until its tokens have expired
+    """
+    user_id = models.BigIntegerField(primary_key=True)
+    not_before = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.user_id} {self.not_before}'
+
+
+class RevokedToken(models.Model):
+    """
+    a single revoked token, kept until it expires
+    """
+    jti = models.CharField(max_length=255, primary_key=True)
+    expires = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.jti
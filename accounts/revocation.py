@@ -0,0 +1,79 @@
+"""
+revoked JWTs: single tokens by jti and per user "issued before" epochs. every
+process keeps a copy of both tables, a check is a set and a dict lookup. the
+copy is reloaded every TOKEN_REVOCATION_REFRESH seconds, revocations made by
+another process apply within that delay and the ones of this process at once
+"""
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .models import RevokedToken, TokenEpoch
+
+
+class RevocationList:
+
+    def __init__(self):
+        self._epochs = {}
+        self._revoked = frozenset()
+        self._loaded_at = None
+        self._lock = Lock()
+
+    @property
+    def refresh_interval(self):
+        return getattr(settings, 'TOKEN_REVOCATION_REFRESH', 30)
+
+    def load(self):
+        epochs = {user_id: not_before.timestamp()
+                  for user_id, not_before in TokenEpoch.objects.values_list('user_id', 'not_before')}
+        revoked = frozenset(RevokedToken.objects.filter(expires__gt=timezone.now()).values_list('jti', flat=True))
+        # replaced whole, readers never see a half loaded copy
+        self._epochs, self._revoked = epochs, revoked
+        self._loaded_at = monotonic()
+
+    def refresh(self):
+        if self._loaded_at is not None and monotonic() - self._loaded_at < self.refresh_interval:
+            return
+        # one thread reloads while the others keep the current copy, revocations
+        # made meanwhile wait for the reload and are applied on top of it
+        if self._lock.acquire(blocking=self._loaded_at is None):
+            try:
+                self.load()
+            finally:
+                self._lock.release()
+
+    def clear(self):
+        self._epochs, self._revoked, self._loaded_at = {}, frozenset(), None
+
+    def is_revoked(self, token):
+        self.refresh()
+        if token.get(api_settings.JTI_CLAIM) in self._revoked:
+            return True
+        not_before = self._epochs.get(token.get(api_settings.USER_ID_CLAIM))
+        return not_before is not None and token.get('iat', 0) < not_before
+
+    def revoke_user(self, user_id):
+        """
+        revoke every token of the user issued until now
+        """
+        now = timezone.now()
+        TokenEpoch.objects.update_or_create(user_id=user_id, defaults={'not_before': now})
+        # tokens issued before the older epochs have all expired by now
+        lifetime = max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME)
+        TokenEpoch.objects.filter(not_before__lt=now - lifetime).delete()
+        with self._lock:
+            self._epochs = {**self._epochs, user_id: now.timestamp()}
+
+    def revoke_token(self, token):
+        jti = token[api_settings.JTI_CLAIM]
+        RevokedToken.objects.get_or_create(jti=jti, defaults={'expires': datetime_from_epoch(token['exp'])})
+        RevokedToken.objects.filter(expires__lte=timezone.now()).delete()
+        with self._lock:
+            self._revoked = self._revoked | {jti}
+
+
+revocations = RevocationList()
@@ -1,46 +1,99 @@
-from django.contrib.auth.hashers import make_password
+from functools import reduce
+from operator import or_
+
+from core.authentication import ACCOUNT_CLAIMS, add_account_claims
+from core.images import RenditionsField
+from core.metrics import TimedSerializerMixin
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 from rest_framework.serializers import (CharField, HyperlinkedIdentityField,
-                                        ModelSerializer, ValidationError)
+                                        ModelSerializer, Serializer, ValidationError)
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
 
 from .models import Account
+from .revocation import revocations
 
 
-class AccountSerializer(ModelSerializer):
+class AccountSerializer(TimedSerializerMixin, ModelSerializer):
     user_detail_url = HyperlinkedIdentityField(view_name='account-detail', read_only=True, lookup_field='id')
+    avatar_renditions = RenditionsField('avatar', source='avatar_digest')
 
     class Meta:
         model = Account
-        exclude = ('groups', 'user_permissions', 'password',)
+        exclude = ('groups', 'user_permissions', 'password', 'avatar_digest',)
 
 
-class AccountUpdateSerializer(ModelSerializer):
+class UniqueAccountFieldsMixin:
+    """
+    the username and email are checked for duplicates in one query over their
+    unique indexes, the account being updated excluded. the unique constraints
+    catch an account saved meanwhile
+    """
+    unique_fields = {
+        'username': 'an account with this username already exists',
+        'email': 'an account with this email already exists',
+    }
+
+    def validate_email(self, value):
+        return value.lower()
+
+    def get_conflicts(self, attrs):
+        values = {name: attrs[name] for name in self.unique_fields if attrs.get(name)}
+        if not values:
+            return {}
+        queryset = Account.objects.filter(reduce(or_, (Q(**{name: value}) for name, value in values.items())))
+        if self.instance is not None:
+            queryset = queryset.exclude(pk=self.instance.pk)
+        conflicts = {}
+        for row in queryset.values(*values)[:len(values)]:
+            for name, value in values.items():
+                if row[name] == value:
+                    conflicts[name] = [self.unique_fields[name]]
+        return conflicts
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        conflicts = self.get_conflicts(attrs)
+        if conflicts:
+            raise ValidationError(conflicts)
+        return attrs
+
+    def save(self, **kwargs):
+        try:
+            with transaction.atomic():
+                return super().save(**kwargs)
+        except IntegrityError:
+            conflicts = self.get_conflicts(self.validated_data)
+            if not conflicts:
+                raise
+            raise ValidationError(conflicts)
+
+
+class AccountUpdateSerializer(UniqueAccountFieldsMixin, ModelSerializer):
     username = CharField(required=False)
 
     class Meta:
         model = Account
         fields = ('username', 'email', 'first_name', 'last_name', 'avatar', 'gender')
 
-    def validate_username(self, value):
-        if Account.objects.filter(username=value).exists():
-            raise ValidationError('an account with this username already exists')
-        return value
-
-    def validate_email(self, value):
-        lower_email = value.lower()
-        if Account.objects.filter(email__iexact=lower_email).exists():
-            raise ValidationError('an account with this email already exists')
-        return lower_email
 
-
-class AccountCreateSerializer(ModelSerializer):
+class AccountCreateSerializer(UniqueAccountFieldsMixin, ModelSerializer):
     password = CharField(write_only=True, required=True)
 
     class Meta:
         model = Account
         fields = ('id', 'username', 'email', 'password')
+        # without the UniqueValidator's own query
+        extra_kwargs = {'username': {'validators': [UnicodeUsernameValidator()]}}
 
     def create(self, validated_data):
         account = Account(**validated_data)
+        # hashed once the account is known to be valid
+        account.set_password(validated_data['password'])
         account.is_staff = True
         account.save()
         return account
@@ -48,13 +101,7 @@ class AccountCreateSerializer(ModelSerializer):
     def validate_password(self, value):
         if len(value) < 6:
             raise ValidationError('password must be more than 6 character.')
-        return make_password(value)
-        
-    def validate_email(self, value):
-        lower_email = value.lower()
-        if Account.objects.filter(email__iexact=lower_email).exists():
-            raise ValidationError('an account with this email already exists')
-        return lower_email
+        return value
 
 
 class PasswordChangeSerializer(ModelSerializer):
@@ -67,8 +114,8 @@ class PasswordChangeSerializer(ModelSerializer):
         fields = ('old_password', 'password1', 'password2')
 
     def validate_old_password(self, value):
-        account = self.context['request'].user
-        if not account.check_password(value):
+        # the account IsOwner checked, request.user only holds token claims
+        if not self.instance.check_password(value):
             raise ValidationError("Old password is not correct")
         return value
 
@@ -82,3 +129,49 @@ class PasswordChangeSerializer(ModelSerializer):
         instance.save()
         return instance
 
+
+
+class AccountTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    tokens carrying the account claims JWTClaimsAuthentication trusts,
+    an access token gets them from its refresh token
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        return add_account_claims(super().get_token(user), user)
+
+
+class AccountTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    a revoked refresh token gets no new access token, nor one of an inactive
+    account or claiming other flags than the account has now. the access
+    token claims are read from the account row
+    """
+
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs['refresh'])
+        if revocations.is_revoked(refresh):
+            raise TokenError('Token is revoked')
+        account = Account.objects.filter(**{api_settings.USER_ID_FIELD: refresh[api_settings.USER_ID_CLAIM]},
+                                         is_active=True).first()
+        if account is None:
+            raise TokenError('Account is inactive or deleted')
+        if any(refresh.get(claim) != getattr(account, claim) for claim in ACCOUNT_CLAIMS):
+            raise TokenError('Token claims are out of date')
+        data = super().validate(attrs)
+        data['access'] = str(add_account_claims(refresh.access_token, account))
+        return data
+
+
+class TokenRevokeSerializer(Serializer):
+    refresh = CharField(write_only=True)
+
+    def validate_refresh(self, value):
+        try:
+            return RefreshToken(value)
+        except TokenError as error:
+            raise ValidationError(error.args[0])
+
+    def save(self, **kwargs):
+        revocations.revoke_token(self.validated_data['refresh'])
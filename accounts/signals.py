@@ -0,0 +1,46 @@
+from core.authentication import ACCOUNT_CLAIMS
+from core.images import mark_upload, process_upload
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Account
+from .revocation import revocations
+
+
+@receiver(pre_save, sender=Account)
+def mark_avatar_upload(sender, instance, **kwargs):
+    mark_upload(instance, 'avatar')
+
+
+@receiver(post_save, sender=Account)
+def render_avatar(sender, instance, **kwargs):
+    process_upload(instance, 'avatar', 'avatar_digest')
+
+
+# the fields copied into the tokens, and is_active: a token claiming another value is revoked
+TOKEN_FIELDS = ('is_active', *ACCOUNT_CLAIMS)
+
+
+def token_fields(instance):
+    # None when deferred
+    return tuple(instance.__dict__.get(field) for field in TOKEN_FIELDS)
+
+
+@receiver(post_init, sender=Account)
+def remember_token_fields(sender, instance, **kwargs):
+    instance._token_fields = token_fields(instance)
+
+
+@receiver(post_save, sender=Account)
+def revoke_changed_account_tokens(sender, instance, created, **kwargs):
+    # set_password() keeps the raw password until the save, a hash upgrade at login doesn't
+    password_changed = instance._password is not None
+    fields = token_fields(instance)
+    if not created and (password_changed or instance._token_fields != fields):
+        revocations.revoke_user(instance.pk)
+    instance._token_fields = fields
+
+
+@receiver(post_delete, sender=Account)
+def revoke_deleted_account_tokens(sender, instance, **kwargs):
+    revocations.revoke_user(instance.pk)
@@ -1,10 +1,30 @@
 import json
-
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from accounts.hashing import HashingPool, ScryptPasswordHasher
+from accounts.revocation import revocations
+from core.testing import QueryBudgetMixin
+from core.throttling import MemoryBucketStore, SQLiteBucketStore, get_store, throttle_stats
+from core.authentication import VerifiedTokenCache, verified_tokens
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from django.urls import reverse
+from PIL import Image
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
 
-from .models import Account
+from .models import Account, TokenEpoch
+from .serializers import AccountCreateSerializer
 
 superuser_data = {'username': 'adminuser', 'password': 'adminuserpass'}
 staffuser1_data = {'username': 'staff1', 'password': 'staff1pass'}
@@ -54,10 +74,28 @@ class AccountListTestCase(APITestCaseWithSetUp):
         response = self.client.get(accounts_list_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_pagination(self):
+        response = self.client.get(accounts_list_url, {'page_size': 2})
+        response_data = json.loads(response.content)
+        self.assertEqual(len(response_data['results']), 2)
+        response = self.client.get(response_data['next'])
+        self.assertEqual([account['username'] for account in json.loads(response.content)['results']], ['staff2'])
+
+    def test_ndjson_export(self):
+        response = self.client.get(accounts_list_url, HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        page = json.loads(self.client.get(accounts_list_url).content)['results']
+        self.assertEqual([json.loads(line) for line in lines], page)
+
     def test_staffuser(self):
         self.client.force_authenticate(user=self.staffuser)
         response = self.client.get(accounts_list_url)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.get(accounts_list_url, {'format': 'ndjson'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
     def test_unauthorized(self):
         self.client.force_authenticate(user=None)
@@ -89,6 +127,28 @@ class AccountDetailTestCase(APITestCaseWithSetUp):
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+class AccountQueryBudgetTestCase(QueryBudgetMixin, APITestCaseWithSetUp):
+
+    def setUp(self):
+        super().setUp()
+        # the revocation list reload isn't part of the requests measured
+        revocations.load()
+
+    def test_reads(self):
+        # the token's claims authenticate, no account query
+        response = self.assertQueryBudget(2, accounts_list_url, duplicates=2)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.assertQueryBudget(1, account_detail_url, duplicates=2)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_update(self):
+        # the account, the username and email check in one query, the update. a new
+        # username would also revoke the account's tokens
+        data = {'username': superuser_data['username'], 'first_name': 'first'}
+        response = self.assertQueryBudget(6, account_update_url, 'put', data=data, duplicates=2)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
 class AccountUpdateTestCase(APITestCaseWithSetUp):
 
     def test_account_update_by_superuser(self):
@@ -164,3 +224,321 @@ class AccountPasswordChangeTestCase(APITestCaseWithSetUp):
         data = {'old_password': 'some_wrong_psw', 'password1': 'newpassword', 'password2': 'newpassword'}
         response = self.client.put(url, data)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AccountAvatarRenditionsTestCase(APITestCaseWithSetUp):
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def test_avatar_upload_renditions(self):
+        output = BytesIO()
+        Image.new('RGB', (800, 800)).save(output, 'JPEG')
+        url = reverse('account-update', kwargs={'id': self.staffuser.id})
+        self.client.force_authenticate(user=self.staffuser)
+        self.client.put(url, {'avatar': SimpleUploadedFile('me.jpg', output.getvalue())}, format='multipart')
+
+        response = self.client.get(reverse('account-detail', kwargs={'id': self.staffuser.id}))
+        renditions = json.loads(response.content)['avatar_renditions']
+        self.assertEqual(set(renditions), {'thumbnail', 'medium', 'webp'})
+
+
+class TokenClaimsAuthenticationTestCase(APITestCaseWithSetUp):
+
+    def account_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        return response, [query['sql'] for query in context.captured_queries if 'accounts_account' in query['sql']]
+
+    def test_claims(self):
+        access = AccessToken(self.client.post(reverse('token_obtain_pair'), staffuser1_data).data['access'])
+        self.assertEqual((access['username'], access['is_staff'], access['is_superuser']), ('staff1', False, False))
+        refresh = self.client.post(reverse('token_obtain_pair'), superuser_data).data['refresh']
+        access = AccessToken(self.client.post(reverse('token_refresh'), {'refresh': refresh}).data['access'])
+        self.assertTrue(access['is_superuser'])
+
+    def test_no_account_query(self):
+        # the catalog only needs is_superuser, it comes from the token
+        response, queries = self.account_queries(reverse('author-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(queries, [])
+        # the owner check reuses the account the view loaded
+        response, queries = self.account_queries(reverse('account-detail', kwargs={'id': self.superuser.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 1)
+
+    def test_object_permissions_read_the_account(self):
+        Account.objects.filter(id=self.superuser.id).update(is_superuser=False)
+        url = reverse('account-detail', kwargs={'id': self.staffuser.id})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        Account.objects.filter(id=self.superuser.id).update(is_superuser=True, is_active=False)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_password_change_by_owner_token(self):
+        access = self.client.post(reverse('token_obtain_pair'), staffuser1_data).data['access']
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + access)
+        url = reverse('account-change-password', kwargs={'id': self.staffuser.id})
+        data = {'old_password': staffuser1_data['password'], 'password1': 'newpassword', 'password2': 'newpassword'}
+        self.assertEqual(self.client.put(url, data).status_code, status.HTTP_200_OK)
+        self.staffuser.refresh_from_db()
+        self.assertTrue(self.staffuser.check_password('newpassword'))
+
+    def test_verified_token_cache(self):
+        verified_tokens.clear()
+        self.client.get(accounts_list_url)
+        self.client.get(accounts_list_url)
+        self.assertEqual(len(verified_tokens), 1)
+        access = self.client.post(reverse('token_obtain_pair'), superuser_data).data['access']
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + access[:-2] + ('AA' if access[-2:] != 'AA' else 'BB'))
+        self.assertEqual(self.client.get(accounts_list_url).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(len(verified_tokens), 1)
+
+        cache = VerifiedTokenCache(max_size=2)
+        for key in ('a', 'b', 'c'):
+            cache.set(key, key)
+        cache.get('b')
+        cache.set('d', 'd')
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (None, 'b', None))
+
+
+class TokenRevocationTestCase(APITestCaseWithSetUp):
+
+    def setUp(self):
+        revocations.clear()
+        super().setUp()
+        self.tokens = self.client.post(reverse('token_obtain_pair'), staffuser1_data).data
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens['access'])
+        self.url = reverse('account-detail', kwargs={'id': self.staffuser.id})
+
+    def refresh(self):
+        return self.client.post(reverse('token_refresh'), {'refresh': self.tokens['refresh']})
+
+    def test_password_change(self):
+        data = {'old_password': staffuser1_data['password'], 'password1': 'newpassword', 'password2': 'newpassword'}
+        response = self.client.put(reverse('account-change-password', kwargs={'id': self.staffuser.id}), data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.refresh().status_code, status.HTTP_401_UNAUTHORIZED)
+        # a token issued afterwards is valid
+        credentials = {'username': 'staff1', 'password': 'newpassword'}
+        access = self.client.post(reverse('token_obtain_pair'), credentials).data['access']
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + access)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+    def test_deleted_and_deactivated_accounts(self):
+        staffuser2_tokens = self.client.post(reverse('token_obtain_pair'), staffuser2_data).data
+        self.staffuser.is_active = False
+        self.staffuser.save()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + staffuser2_tokens['access'])
+        self.staffuser2.delete()
+        self.assertEqual(self.client.get(accounts_list_url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_demoted_superuser(self):
+        admin_tokens = self.client.post(reverse('token_obtain_pair'), superuser_data).data
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + admin_tokens['access'])
+        self.assertEqual(self.client.get(accounts_list_url).status_code, status.HTTP_200_OK)
+        self.superuser.is_superuser = False
+        self.superuser.save()
+        # the tokens claiming the old flags are revoked, a new one has the current flags
+        self.assertEqual(self.client.get(accounts_list_url).status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.post(reverse('token_refresh'), {'refresh': admin_tokens['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        access = self.client.post(reverse('token_obtain_pair'), superuser_data).data['access']
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + access)
+        self.assertEqual(self.client.get(accounts_list_url).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.post(reverse('author-list'), {'name': 'author'}).status_code,
+                         status.HTTP_403_FORBIDDEN)
+
+    def test_refresh_reads_the_account(self):
+        response = self.refresh()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(AccessToken(response.data['access'])['username'], 'staff1')
+        # a change that skips the signals, or a revocation not loaded yet by this process
+        Account.objects.filter(pk=self.staffuser.pk).update(is_staff=True)
+        self.assertEqual(self.refresh().status_code, status.HTTP_401_UNAUTHORIZED)
+        Account.objects.filter(pk=self.staffuser.pk).update(is_staff=False, is_active=False)
+        self.assertEqual(self.refresh().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_renamed_account(self):
+        self.staffuser.username = 'renamed'
+        self.staffuser.save()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_unrelated_change(self):
+        self.staffuser.first_name = 'first'
+        self.staffuser.save()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+    def test_logout(self):
+        response = self.client.post(reverse('token_revoke'), {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.credentials()
+        self.assertEqual(self.refresh().status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.post(reverse('token_revoke'), {'refresh': 'not a token'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_checks_run_no_query(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        self.assertFalse([query for query in context.captured_queries if 'token' in query['sql']])
+
+    def test_revocations_of_other_processes(self):
+        self.client.get(self.url)
+        TokenEpoch.objects.create(user_id=self.staffuser.id, not_before=timezone.now())
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        with override_settings(TOKEN_REVOCATION_REFRESH=0):
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PasswordHashingTestCase(APITestCase):
+
+    def setUp(self):
+        revocations.clear()
+        self.account = Account.objects.create_user(**staffuser1_data)
+
+    def login(self):
+        return self.client.post(reverse('token_obtain_pair'), staffuser1_data)
+
+    def test_scrypt_with_configured_parameters(self):
+        self.assertTrue(self.account.password.startswith('scrypt$16384$'))
+        response = self.client.post(account_create_url, {'username': 'new', 'password': 'newpass'})
+        self.assertTrue(Account.objects.get(id=response.data['id']).password.startswith('scrypt$'))
+        self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+
+    def test_upgrade_at_login(self):
+        Account.objects.filter(id=self.account.id).update(
+            password=make_password(staffuser1_data['password'], hasher='pbkdf2_sha256'))
+        access = self.login().data['access']
+        self.account.refresh_from_db()
+        self.assertTrue(self.account.password.startswith('scrypt$16384$'))
+        with override_settings(PASSWORD_HASHER_PARAMS={'scrypt': {'work_factor': 2 ** 12}}):
+            self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+        self.account.refresh_from_db()
+        self.assertTrue(self.account.password.startswith('scrypt$4096$'))
+        # an upgraded hash isn't a password change, the tokens stay valid
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + access)
+        response = self.client.get(reverse('account-detail', kwargs={'id': self.account.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_wrong_password(self):
+        self.assertEqual(self.client.post(reverse('token_obtain_pair'), staffuser2_data).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+        self.assertFalse(self.account.check_password('wrong password'))
+
+    @override_settings(PASSWORD_HASHING_WORKERS=1, PASSWORD_HASHER_PARAMS={'scrypt': {'work_factor': 2 ** 10}})
+    def test_process_pool(self):
+        self.account.set_password('pooled password')
+        self.assertTrue(self.account.password.startswith('scrypt$1024$'))
+        self.assertTrue(self.account.check_password('pooled password'))
+        pool = HashingPool(workers=1)
+        self.addCleanup(pool.shutdown)
+        hasher = ScryptPasswordHasher()
+        self.assertTrue(pool.run(hasher.verify, 'pooled password', self.account.password))
+        self.assertTrue(pool.run(PBKDF2PasswordHasher().verify, 'x', make_password('x', hasher='pbkdf2_sha256')))
+
+    def test_bench_hashing_command(self):
+        output = StringIO()
+        with override_settings(PASSWORD_HASHER_PARAMS={'scrypt': {'work_factor': 2 ** 10}}):
+            call_command('bench_hashing', hashes=2, workers=1, stdout=output)
+        self.assertIn('scrypt n=2**14', output.getvalue())
+        self.assertIn('login    1 processes', output.getvalue())
+
+
+class UniqueAccountFieldsTestCase(APITestCaseWithSetUp):
+
+    def setUp(self):
+        super().setUp()
+        Account.objects.filter(id=self.staffuser.id).update(email='staff1@example.com')
+
+    def test_one_query(self):
+        data = {'username': 'staff1', 'email': 'Staff1@Example.com', 'password': 'somepassword'}
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(account_create_url, data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data), {'username', 'email'})
+        self.assertEqual(len([query for query in context.captured_queries if 'accounts_account' in query['sql']]), 1)
+
+    def test_create_and_update(self):
+        data = {'username': 'new', 'email': 'New@Example.com', 'password': 'somepassword'}
+        response = self.client.post(account_create_url, data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Account.objects.get(username='new').email, 'new@example.com')
+
+        url = reverse('account-update', kwargs={'id': self.staffuser.id})
+        # the account's own username and email don't collide with its row
+        response = self.client.put(url, {'username': 'staff1', 'email': 'STAFF1@example.com'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.put(url, {'email': 'NEW@example.com'})
+        self.assertEqual(response.data, {'email': ['an account with this email already exists']})
+
+    def test_constraint_catches_races(self):
+        serializer = AccountCreateSerializer(data={'username': 'racer', 'email': 'racer@example.com',
+                                                   'password': 'somepassword'})
+        self.assertTrue(serializer.is_valid())
+        Account.objects.create_user(username='other', email='RACER@example.com')
+        with self.assertRaises(ValidationError) as context:
+            serializer.save()
+        self.assertEqual(set(context.exception.detail), {'email'})
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Account.objects.create_user(username='third', email='Racer@Example.com')
+        # blank emails aren't unique
+        Account.objects.create_user(username='blank1')
+        Account.objects.create_user(username='blank2')
+
+
+@override_settings(THROTTLE_ENABLED=True, THROTTLE_RATES={'login': '10/min', 'login_username': '2/min', 'signup': '1/hour'})
+class ThrottlingTestCase(APITestCase):
+
+    def setUp(self):
+        get_store().clear()
+        throttle_stats.reset_stats()
+        Account.objects.create_user(**staffuser1_data)
+
+    def test_login_per_username(self):
+        wrong = {'username': 'staff1', 'password': 'wrong password'}
+        for _ in range(2):
+            self.assertEqual(self.client.post(reverse('token_obtain_pair'), wrong).status_code,
+                             status.HTTP_401_UNAUTHORIZED)
+        response = self.client.post(reverse('token_obtain_pair'), staffuser1_data)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn(int(response['Retry-After']), range(1, 31))
+        # the bucket is per username and address, the user still logs in from another one
+        response = self.client.post(reverse('token_obtain_pair'), staffuser1_data, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # another username can log in from the same address
+        Account.objects.create_user(**staffuser2_data)
+        self.assertEqual(self.client.post(reverse('token_obtain_pair'), staffuser2_data).status_code,
+                         status.HTTP_200_OK)
+        self.assertEqual(throttle_stats.stats()['login_username'], {'allowed': 4, 'throttled': 1})
+
+    def test_signup_per_address(self):
+        response = self.client.post(account_create_url, {'username': 'first', 'password': 'somepassword'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post(account_create_url, {'username': 'second', 'password': 'somepassword'},
+                                    HTTP_X_FORWARDED_FOR='10.0.0.1')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        response = self.client.post(account_create_url, {'username': 'second', 'password': 'somepassword'},
+                                    REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_token_buckets(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'throttle.sqlite3')
+        # two stores on one file are two worker processes sharing their buckets
+        for first, second in ((MemoryBucketStore(),) * 2, (SQLiteBucketStore(path), SQLiteBucketStore(path))):
+            with self.subTest(first.__class__.__name__):
+                self.assertEqual([first.consume('key', 2, 60, now=0), second.consume('key', 2, 60, now=0)], [0, 0])
+                self.assertEqual(first.consume('key', 2, 60, now=0), 30)
+                # a request refills every 30 seconds, a denied one doesn't take it
+                self.assertEqual(second.consume('key', 2, 60, now=15), 15)
+                self.assertEqual(second.consume('key', 2, 60, now=30), 0)
+                self.assertEqual(first.consume('other', 2, 60, now=30), 0)
@@ -1,5 +1,5 @@
 from django.urls import path
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from rest_framework_simplejwt.views import TokenRefreshView
 from .views import (
     AccountListAPIView,
     AccountDetailAPIView,
@@ -7,11 +7,14 @@ from .views import (
     PasswordChangeAPIView,
     AccountCreateAPIView,
     AccountDeleteAPIView,
+    TokenObtainPairAPIView,
+    TokenRevokeAPIView,
 )
 
 urlpatterns = [
-    path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('token/', TokenObtainPairAPIView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('token/revoke/', TokenRevokeAPIView.as_view(), name='token_revoke'),
     path('', AccountListAPIView.as_view(), name='accounts'),
     path('create/', AccountCreateAPIView.as_view(), name='account-create'),
     path('<int:id>/', AccountDetailAPIView.as_view(), name='account-detail'),
@@ -1,21 +1,41 @@
 from core.permissions import IsAdmin, IsAdminOrOwner, IsOwner, AllowAny
+from core.throttling import LoginThrottle
+from core.fastpath import FastRepresentation
+from core.renderers import STREAMING_RENDERER_CLASSES, StreamingRenderer, stream_representations, streaming_response
 from django.shortcuts import get_object_or_404
 from rest_framework import status
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
+from rest_framework_simplejwt.views import TokenObtainPairView
 
 from .models import Account
-from .serializers import (AccountCreateSerializer, AccountSerializer,
-                          AccountUpdateSerializer, PasswordChangeSerializer)
+from .revocation import revocations
+from .serializers import (AccountCreateSerializer, AccountSerializer, AccountUpdateSerializer,
+                          PasswordChangeSerializer, TokenRevokeSerializer)
 
 
 class AccountListAPIView(APIView):
     permission_classes = [IsAdmin]
+    pagination_class = api_settings.DEFAULT_PAGINATION_CLASS
+    renderer_classes = STREAMING_RENDERER_CLASSES
 
     def get(self, request):
-        accounts = Account.objects.all()        
-        serializer = AccountSerializer(accounts, many=True, context={'request': request})
-        return Response(data=serializer.data, status=status.HTTP_200_OK)
+        accounts = Account.objects.all()
+        if isinstance(request.accepted_renderer, StreamingRenderer):
+            # every account, unpaginated, ?format=ndjson or ?format=json-stream
+            serializer = AccountSerializer(context={'request': request})
+            representation = FastRepresentation(serializer)
+            items = stream_representations(accounts.order_by('id'), serializer,
+                                           representation=representation if representation.supported else None)
+            return streaming_response(request.accepted_renderer, items)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(accounts, request, view=self)
+        if page is None:
+            serializer = AccountSerializer(accounts, many=True, context={'request': request})
+            return Response(data=serializer.data, status=status.HTTP_200_OK)
+        serializer = AccountSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
 
 
 class AccountDetailAPIView(APIView):
@@ -30,6 +50,7 @@ class AccountDetailAPIView(APIView):
 
 class AccountCreateAPIView(APIView):
     permission_classes = [AllowAny]
+    throttle_scope = 'signup'
 
     def post(self, request):
         serializer = AccountCreateSerializer(data=request.data, context={'request': request})
@@ -77,3 +98,27 @@ class AccountDeleteAPIView(APIView):
         account.delete()
 
         return Response({"detail": "account deleted successfully"}, status=status.HTTP_204_NO_CONTENT)
+
+
+class TokenRevokeAPIView(APIView):
+    """
+    logout: revokes the posted refresh token and the access token of the request
+    """
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        serializer = TokenRevokeSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        serializer.save()
+        if request.auth is not None:
+            revocations.revoke_token(request.auth)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class TokenObtainPairAPIView(TokenObtainPairView):
+    """
+    login, throttled per address and per username
+    """
+    throttle_scope = 'login'
+    throttle_classes = [*api_settings.DEFAULT_THROTTLE_CLASSES, LoginThrottle]
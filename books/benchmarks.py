@@ -0,0 +1,368 @@
+"""
+helpers for the catalog benchmark commands: a synthetic catalog, the query
+shapes the viewsets issue, their EXPLAIN QUERY PLAN, timings of queries and
+serialization and concurrent load on the WSGI and ASGI handlers
+"""
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from decimal import Decimal
+from io import BytesIO
+
+try:
+    import resource
+except ImportError:
+    # windows
+    resource = None
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Max
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+
+from accounts.hashing import make_password
+from accounts.models import Account
+from accounts.serializers import AccountTokenObtainPairSerializer
+from core.fastpath import FastRepresentation
+from core.pagination import KeysetPagination
+from .models import Author, Book, Genre
+from .views import BookViewSet
+
+BENCHMARK_PASSWORD = 'benchmark password'
+NO_CACHE = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+LANGUAGES = ('english', 'french', 'german', 'spanish', 'italian', 'persian')
+GENRES_INDEX = 'book_genres_genre_book_idx'
+
+
+def generate_catalog(books=10000, authors=500, genres=30, genres_per_book=2, accounts=0, batch_size=2000, seed=0):
+    """
+    bulk create a random catalog, nothing is indexed for search or cached.
+    the `accounts` share the password BENCHMARK_PASSWORD, hashed once
+    """
+    rng = random.Random(seed)
+    if accounts:
+        password = make_password(BENCHMARK_PASSWORD)
+        Account.objects.bulk_create([
+            Account(username=f'benchmark_user_{i}', email=f'benchmark_user_{i}@example.com', password=password,
+                    first_name=f'first name {i}', last_name=f'last name {i}', gender=rng.choice(('Male', 'Female')))
+            for i in range(accounts)
+        ], batch_size=batch_size)
+    author_objs = Author.objects.bulk_create(
+        [Author(name=f'benchmark author {i}') for i in range(authors)], batch_size=batch_size)
+    genre_objs = Genre.objects.bulk_create(
+        [Genre(title=f'benchmark genre {i}') for i in range(genres)], batch_size=batch_size)
+    through = Book.genres.through
+    for start in range(0, books, batch_size):
+        batch = Book.objects.bulk_create([
+            Book(
+                title=f'benchmark book {i}',
+                author=rng.choice(author_objs),
+                description=f'description of benchmark book {i}',
+                pages=rng.randint(50, 1200),
+                language=rng.choice(LANGUAGES),
+                published_year=rng.randint(1800, 2021),
+                price=Decimal(rng.randint(0, 9999)) / 100,
+            )
+            for i in range(start, min(start + batch_size, books))
+        ])
+        through.objects.bulk_create([
+            through(book_id=book.id, genre_id=genre.id)
+            for book in batch for genre in rng.sample(genre_objs, min(genres_per_book, len(genre_objs)))
+        ])
+
+
+@contextmanager
+def rolled_back():
+    """
+    run a block in a transaction that is always rolled back, SQLite DDL included
+    """
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+@contextmanager
+def baseline_indexes():
+    """
+    the schema before the index plan of migration 0006: no plan indexes and a
+    plain index on the author foreign key. rolled back on exit
+    """
+    with rolled_back(), connection.cursor() as cursor:
+        for index in Book._meta.indexes:
+            cursor.execute(f'DROP INDEX IF EXISTS {index.name}')
+        cursor.execute(f'DROP INDEX IF EXISTS {GENRES_INDEX}')
+        cursor.execute('CREATE INDEX benchmark_book_author_idx ON books_book (author_id)')
+        yield
+
+
+def view_queryset(action, **kwargs):
+    # the queryset exactly as BookViewSet builds it for the action
+    return BookViewSet(action=action, kwargs=kwargs, request=None, format_kwarg=None).get_queryset()
+
+
+def catalog_queries(page_size=20):
+    """
+    {name: callable} running the queries behind the catalog endpoints
+    """
+    ordering = ('-created', '-id')
+    middle = Book.objects.order_by(*ordering).values_list('created', 'id')[Book.objects.count() // 2]
+    author = Author.objects.only('slug').order_by('id').first()
+    genre = Genre.objects.only('slug').order_by('id').first()
+
+    def page(queryset, position=None):
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(KeysetPagination.build_position_filter(ordering, position))
+        return lambda: list(queryset[:page_size + 1])
+
+    def validators(queryset):
+        # the aggregate of core.conditional.get_validators
+        return lambda: queryset.order_by().aggregate(last_modified=Max('updated'), count=Count('pk'))
+
+    books = view_queryset('list')
+    return {
+        'list, first page': page(books),
+        'list, middle page': page(books, middle),
+        'list validators': validators(Book.objects.all()),
+        'author_books': page(view_queryset('author_books', slug=author.slug)),
+        'author_books validators': validators(Book.objects.filter(author__slug=author.slug)),
+        'genre_books': page(view_queryset('genre_books', slug=genre.slug)),
+        'language filter': page(books.filter(language='french')),
+        'published_year filter': page(books.filter(published_year=1999)),
+        'price range': page(books.filter(price__gte=10, price__lt=12)),
+    }
+
+
+def explain(run):
+    """
+    EXPLAIN QUERY PLAN of every query `run` executes, as lists of lines
+    """
+    with CaptureQueriesContext(connection) as context:
+        run()
+    plans = []
+    with connection.cursor() as cursor:
+        for query in context.captured_queries:
+            cursor.execute(f'EXPLAIN QUERY PLAN {query["sql"]}')
+            plans.append([row[-1] for row in cursor.fetchall()])
+    return plans
+
+
+def best_time(run, repeat=5):
+    """
+    fastest of `repeat` runs in milliseconds
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def serialization_runs(serializer_class, queryset, context):
+    """
+    (serializer, fast path) callables rendering `queryset` to JSON both ways
+    """
+    renderer = JSONRenderer()
+
+    def serializer():
+        return renderer.render(serializer_class(queryset.all(), many=True, context=context).data)
+
+    def fast_path():
+        representation = FastRepresentation(serializer_class(context=context))
+        return renderer.render(representation.to_representation(representation.values(queryset.all())))
+    return serializer, fast_path
+
+
+@contextmanager
+def benchmark_database(name=None):
+    """
+    a throwaway migrated database for benchmarks that commit, like the test
+    runner's. SQLite's is in memory and shared by every thread of the process,
+    or the file `name` when journaling and locking matter
+    """
+    test_settings = connection.settings_dict['TEST']
+    old_test_name = test_settings['NAME']
+    if name is not None:
+        test_settings['NAME'] = str(name)
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        test_settings['NAME'] = old_test_name
+
+
+def write_load(stop, rows=200, interval=0.01):
+    """
+    admin style writes until the `stop` event is set: a transaction updating
+    `rows` books every `interval` seconds. returns the write latencies in ms
+    """
+    ids = list(Book.objects.order_by('id').values_list('id', flat=True))
+    latencies = []
+    try:
+        while not stop.is_set():
+            batch = random.sample(ids, min(rows, len(ids)))
+            start = time.perf_counter()
+            with transaction.atomic():
+                Book.objects.filter(id__in=batch).update(pages=F('pages') + 1)
+            latencies.append((time.perf_counter() - start) * 1000)
+            stop.wait(interval)
+    finally:
+        connection.close()
+    return latencies
+
+
+def load_settings(cache=False):
+    """
+    settings overrides for load from one address on localhost: no throttling,
+    no query guard, a development tool, and no response cache unless `cache`
+    """
+    overrides = {'THROTTLE_ENABLED': False, 'QUERY_GUARD_ENABLED': False, 'DEBUG': False,
+                 'ALLOWED_HOSTS': ['localhost']}
+    if not cache:
+        overrides['CACHES'] = {'default': NO_CACHE, 'catalog': NO_CACHE}
+    return overrides
+
+
+def wsgi_load(application, paths, requests, concurrency, host='localhost', method='GET', body=b'', headers=None):
+    """
+    `requests` requests to urls cycling through `paths` from `concurrency` threads,
+    like a threaded WSGI server. returns (seconds, latencies in ms, statuses)
+    """
+    extra = {}
+    for name, value in (headers or {}).items():
+        name = name.upper().replace('-', '_')
+        extra[name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{name}'] = value
+    if body:
+        extra['CONTENT_LENGTH'] = str(len(body))
+
+    def get(path):
+        path, _, query = path.partition('?')
+        environ = {
+            'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+            'SERVER_NAME': host, 'SERVER_PORT': '80', 'HTTP_HOST': host, 'SERVER_PROTOCOL': 'HTTP/1.1',
+            'wsgi.url_scheme': 'http', 'wsgi.input': BytesIO(body), 'wsgi.errors': BytesIO(),
+            'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False, **extra,
+        }
+        statuses = []
+        start = time.perf_counter()
+        response = application(environ, lambda status, headers, exc_info=None: statuses.append(int(status[:3])))
+        try:
+            for _ in response:
+                pass
+        finally:
+            response.close()
+        return (time.perf_counter() - start) * 1000, statuses[0]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(get, (paths[i % len(paths)] for i in range(requests))))
+    return time.perf_counter() - start, [ms for ms, _ in results], [status for _, status in results]
+
+
+def asgi_load(application, paths, requests, concurrency, host='localhost'):
+    """
+    the same load on an ASGI application, `concurrency` requests in flight
+    on one event loop
+    """
+    async def get(path, semaphore):
+        path, _, query = path.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+            'root_path': '', 'headers': [(b'host', host.encode())], 'client': ('127.0.0.1', 0),
+            'server': (host, 80),
+        }
+        statuses = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+
+        async with semaphore:
+            start = time.perf_counter()
+            await application(scope, receive, send)
+            return (time.perf_counter() - start) * 1000, statuses[0]
+
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(*(get(paths[i % len(paths)], semaphore) for i in range(requests)))
+
+    start = time.perf_counter()
+    results = asyncio.run(run())
+    return time.perf_counter() - start, [ms for ms, _ in results], [status for _, status in results]
+
+
+def latency_summary(seconds, latencies):
+    """
+    requests per second and the median and 95th percentile latency in ms
+    """
+    percentiles = statistics.quantiles(latencies, n=20) if len(latencies) > 1 else latencies * 19
+    return len(latencies) / seconds, statistics.median(latencies), percentiles[18]
+
+
+def latency_percentiles(latencies, points=(50, 95, 99)):
+    """
+    {'p50': ms, ...} of the latencies
+    """
+    percentiles = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return {f'p{point}': percentiles[point - 1] for point in points}
+
+
+def peak_rss_mb():
+    """
+    the peak resident set size of the process so far, None where it can't be read
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def bench_scenarios(superuser, account):
+    """
+    (name, method, url, body, headers, share of the requests) covering the url
+    surface of books and accounts. `superuser` reads the account list, `account`
+    its own detail, both with a JWT. the search index must be built
+    """
+    book = Book.objects.only('slug').order_by('id').first()
+    author = Author.objects.only('slug').order_by('id').first()
+    genre = Genre.objects.only('slug').order_by('id').first()
+    admin = {'Authorization': f'Bearer {AccountTokenObtainPairSerializer.get_token(superuser).access_token}'}
+    owner = {'Authorization': f'Bearer {AccountTokenObtainPairSerializer.get_token(account).access_token}'}
+    refresh = str(AccountTokenObtainPairSerializer.get_token(account))
+    json_type = {'Content-Type': 'application/json'}
+
+    def get(name, url, headers=None):
+        return name, 'GET', url, b'', headers, 1
+
+    return [
+        get('book list', reverse('book-list')),
+        get('book list, filtered', reverse('book-list') + '?language=french&ordering=-price'),
+        get('book list, sparse', reverse('book-list') + '?fields=title,slug,price'),
+        get('book detail', reverse('book-detail', kwargs={'slug': book.slug})),
+        get('author list', reverse('author-list')),
+        get('author detail', reverse('author-detail', kwargs={'slug': author.slug})),
+        get('author books', reverse('author-books', kwargs={'slug': author.slug})),
+        get('genre list', reverse('genre-list')),
+        get('genre detail', reverse('genre-detail', kwargs={'slug': genre.slug})),
+        get('genre books', reverse('genre-books', kwargs={'slug': genre.slug})),
+        get('search', reverse('search') + '?q=benchmark+book+1'),
+        get('account list', reverse('accounts'), admin),
+        get('account detail', reverse('account-detail', kwargs={'id': account.id}), owner),
+        ('token refresh', 'POST', reverse('token_refresh'), json.dumps({'refresh': refresh}).encode(), json_type, 1),
+        # a login is a password hash, a few of them take as long as the reads
+        ('login', 'POST', reverse('token_obtain_pair'),
+         json.dumps({'username': account.username, 'password': BENCHMARK_PASSWORD}).encode(), json_type, 0.05),
+    ]
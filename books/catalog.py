@@ -0,0 +1,213 @@
+"""
+streaming bulk import and export of the book catalog as CSV or JSON lines
+"""
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from core.cache import invalidate_model
+from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator
+from django.db import models, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import search
+from .models import Author, Book, Genre
+
+COLUMNS = ('title', 'author', 'description', 'pages', 'language', 'published_year', 'price', 'genres', 'cover', 'pdf')
+# book fields written by the importer, besides the author
+BOOK_FIELDS = ('title', 'description', 'pages', 'language', 'published_year', 'price', 'cover', 'pdf')
+GENRES_SEPARATOR = '|'
+# checked with the validators of their model field, the files are paths of stored files
+VALIDATED_FIELDS = ('title', 'description', 'pages', 'language', 'published_year', 'price')
+POSITIVE_FIELDS = (models.PositiveIntegerField, models.PositiveSmallIntegerField, models.PositiveBigIntegerField)
+
+
+def read_rows(file, file_format):
+    if file_format == 'csv':
+        for row in csv.DictReader(file):
+            genres = row.get('genres') or ''
+            row['genres'] = [genre for genre in genres.split(GENRES_SEPARATOR) if genre.strip()]
+            yield row
+    else:
+        for line in file:
+            if line.strip():
+                yield line
+
+
+def lower(value):
+    return str(value).strip().lower() if value not in (None, '') else None
+
+
+def parse_row(row):
+    """
+    a clean book dict normalized like the model fields do it, or ValueError
+    """
+    if isinstance(row, str):
+        row = json.loads(row)
+    if not isinstance(row, dict):
+        raise ValueError('a row must be an object')
+    title, author = lower(row.get('title')), lower(row.get('author'))
+    if not title or not author:
+        raise ValueError('title and author are required')
+    try:
+        price = Decimal(str(row.get('price') or 0))
+        pages = int(row.get('pages') or 10)
+        published_year = int(row['published_year']) if row.get('published_year') not in (None, '') else None
+    except (InvalidOperation, ValueError, TypeError):
+        raise ValueError('invalid number')
+    book = {
+        'title': title,
+        'slug': slugify(title),
+        'author': author,
+        'description': lower(row.get('description')),
+        'pages': pages,
+        'language': lower(row.get('language')) or 'english',
+        'published_year': published_year,
+        'price': price,
+        'genres': [lower(genre) for genre in row.get('genres') or [] if lower(genre)],
+        'cover': row.get('cover') or Book._meta.get_field('cover').default,
+        'pdf': row.get('pdf') or '',
+    }
+    # the bulk queries skip the model validation, a bad value would fail the whole batch or be stored as is
+    validate(Author, 'name', author)
+    for genre in book['genres']:
+        validate(Genre, 'title', genre)
+    for field in VALIDATED_FIELDS:
+        validate(Book, field, book[field])
+    return book
+
+
+def validate(model, field_name, value):
+    field = model._meta.get_field(field_name)
+    try:
+        field.run_validators(value)
+        # SQLite has no integer ranges, the positive fields rely on a CHECK constraint
+        if isinstance(field, POSITIVE_FIELDS) and value is not None:
+            MinValueValidator(0)(value)
+    except ValidationError as error:
+        raise ValueError(f'{field_name}: {" ".join(error.messages)}')
+
+
+class CatalogImporter:
+    """
+    imports books in batches: authors and genres are resolved or created in one
+    query each, books are bulk created or updated by slug and their genres are
+    replaced through the through table
+    """
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.created = self.updated = 0
+        self.errors = []
+
+    def run(self, rows):
+        batch = []
+        for number, row in enumerate(rows, start=1):
+            try:
+                batch.append(parse_row(row))
+            except ValueError as error:
+                self.errors.append((number, str(error)))
+            if len(batch) >= self.batch_size:
+                self.import_batch(batch)
+                batch = []
+        if batch:
+            self.import_batch(batch)
+        for model in (Author, Genre, Book):
+            invalidate_model(model)
+
+    @staticmethod
+    def resolve(model, name_field, names):
+        """
+        {slug: id} of the named objects, creating the missing ones
+        """
+        by_slug = {slugify(name): name for name in names}
+        existing = dict(model.objects.filter(slug__in=by_slug).values_list('slug', 'id'))
+        missing = [model(**{name_field: name, 'slug': slug}) for slug, name in by_slug.items() if slug not in existing]
+        if missing:
+            model.objects.bulk_create(missing)
+            existing.update({obj.slug: obj.id for obj in missing})
+            if model is Author:
+                search.index_authors(obj.id for obj in missing)
+            else:
+                search.index_genres(obj.id for obj in missing)
+        return existing
+
+    @transaction.atomic
+    def import_batch(self, batch):
+        # the last row wins when a title shows up twice
+        rows = {row['slug']: row for row in batch}
+        authors = self.resolve(Author, 'name', {row['author'] for row in rows.values()})
+        genres = self.resolve(Genre, 'title', {genre for row in rows.values() for genre in row['genres']})
+
+        existing = Book.objects.only('id', 'slug').in_bulk(list(rows), field_name='slug')
+        now = timezone.now()
+        new_books, changed_books = [], []
+        for slug, row in rows.items():
+            book = existing.get(slug) or Book(slug=slug)
+            book.author_id = authors[slugify(row['author'])]
+            for field in BOOK_FIELDS:
+                setattr(book, field, row[field])
+            if book.pk:
+                book.updated = now
+                changed_books.append(book)
+            else:
+                new_books.append(book)
+
+        Book.objects.bulk_create(new_books, batch_size=self.batch_size)
+        Book.objects.bulk_update(changed_books, (*BOOK_FIELDS, 'author', 'updated'), batch_size=self.batch_size)
+
+        through = Book.genres.through
+        books = new_books + changed_books
+        through.objects.filter(book_id__in=[book.id for book in changed_books]).delete()
+        through.objects.bulk_create([
+            through(book_id=book.id, genre_id=genres[slugify(genre)])
+            for book in books for genre in rows[book.slug]['genres']
+        ], batch_size=self.batch_size, ignore_conflicts=True)
+
+        search.index_books(book.id for book in books)
+        self.created += len(new_books)
+        self.updated += len(changed_books)
+
+
+def export_rows(chunk_size=2000):
+    """
+    every book as a dict of COLUMNS, read in id ordered chunks of `chunk_size`
+    """
+    last_id = 0
+    while True:
+        chunk = list(
+            Book.objects.filter(id__gt=last_id).order_by('id')
+            .values('id', 'author__name', *BOOK_FIELDS)[:chunk_size])
+        if not chunk:
+            return
+        genres = {}
+        for book_id, title in (Book.genres.through.objects.filter(book_id__in=[book['id'] for book in chunk])
+                               .order_by('genre__title').values_list('book_id', 'genre__title')):
+            genres.setdefault(book_id, []).append(title)
+        for book in chunk:
+            yield {
+                'title': book['title'],
+                'author': book['author__name'],
+                'description': book['description'],
+                'pages': book['pages'],
+                'language': book['language'],
+                'published_year': book['published_year'],
+                'price': str(book['price']),
+                'genres': genres.get(book['id'], []),
+                'cover': book['cover'],
+                'pdf': book['pdf'],
+            }
+        last_id = chunk[-1]['id']
+
+
+def write_rows(rows, file, file_format):
+    if file_format == 'csv':
+        writer = csv.DictWriter(file, fieldnames=COLUMNS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(dict(row, genres=GENRES_SEPARATOR.join(row['genres'])))
+    else:
+        for row in rows:
+            file.write(json.dumps(row) + '\n')
@@ -0,0 +1,97 @@
+from core.pagination import KeysetPagination
+from django.db.models import Count
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.serializers import (CharField, ChoiceField, DecimalField, IntegerField, ListField, Serializer,
+                                        SlugField)
+
+from .models import Book
+
+
+class CommaSeparatedListField(ListField):
+    """
+    ?name=a,b and ?name=a&name=b both give ['a', 'b']
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = [data]
+        if isinstance(data, (list, tuple)):
+            data = [part.strip() for item in data for part in str(item).split(',') if part.strip()]
+        return super().to_internal_value(data)
+
+
+class BookFilterParamsSerializer(Serializer):
+    language = CommaSeparatedListField(child=CharField(max_length=100), required=False, max_length=10)
+    published_year = IntegerField(required=False, min_value=0)
+    published_year_min = IntegerField(required=False, min_value=0)
+    published_year_max = IntegerField(required=False, min_value=0)
+    price_min = DecimalField(max_digits=6, decimal_places=2, required=False, min_value=0)
+    price_max = DecimalField(max_digits=6, decimal_places=2, required=False, min_value=0)
+    genre = CommaSeparatedListField(child=SlugField(), required=False, max_length=20)
+    genre_match = ChoiceField(choices=('any', 'all'), default='any')
+
+    def validate(self, attrs):
+        for low, high in (('published_year_min', 'published_year_max'), ('price_min', 'price_max')):
+            if low in attrs and high in attrs and attrs[low] > attrs[high]:
+                raise ValidationError({low: [f'Must not be greater than {high}.']})
+        return attrs
+
+
+class BookFilter(BaseFilterBackend):
+    """
+    ?language=english,french  ?published_year=1999 or ?published_year_min=&published_year_max=
+    ?price_min=&price_max=  ?genre=a,b with ?genre_match=any (default) or all.
+    the params are validated first, every filter is served by an index
+    """
+    params_serializer_class = BookFilterParamsSerializer
+
+    def filter_queryset(self, request, queryset, view):
+        serializer = self.params_serializer_class(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        lookups = {
+            'language__in': params.get('language'),
+            'published_year': params.get('published_year'),
+            'published_year__gte': params.get('published_year_min'),
+            'published_year__lte': params.get('published_year_max'),
+            'price__gte': params.get('price_min'),
+            'price__lte': params.get('price_max'),
+        }
+        queryset = queryset.filter(**{lookup: value for lookup, value in lookups.items() if value is not None})
+        if params.get('genre'):
+            queryset = queryset.filter(id__in=self.genre_book_ids(params['genre'], params['genre_match']))
+        return queryset
+
+    @staticmethod
+    def genre_book_ids(slugs, match):
+        # subqueries on the (genre_id, book_id) index, a join would repeat books
+        book_ids = Book.genres.through.objects.filter(genre__slug__in=slugs).values('book_id')
+        if match == 'all':
+            book_ids = book_ids.annotate(matched=Count('genre_id', distinct=True)).filter(matched=len(set(slugs)))
+        return book_ids.values('book_id')
+
+
+class BookOrderingFilter(BaseFilterBackend):
+    """
+    ?ordering=price or ?ordering=-published_year among the view's `ordering_fields`,
+    the id breaks ties so keyset pagination stays exact. defaults to `pagination_ordering`
+    """
+    ordering_param = 'ordering'
+
+    def get_ordering(self, request, view):
+        param = request.query_params.get(self.ordering_param)
+        if not param:
+            return None
+        field = param.strip()
+        if field.lstrip('-') not in getattr(view, 'ordering_fields', ()):
+            raise ValidationError({self.ordering_param: [f'"{param}" is not a valid ordering.']})
+        return field, '-id' if field.startswith('-') else 'id'
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = self.get_ordering(request, view)
+        if ordering is None:
+            return queryset
+        nullable = KeysetPagination.get_nullable(queryset.model, ordering)
+        return queryset.order_by(*KeysetPagination.order_expressions(ordering, nullable))
@@ -0,0 +1,130 @@
+import json
+import platform
+import subprocess
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.test import override_settings
+from django.urls import resolve
+
+from accounts.models import Account
+from books import search
+from books.benchmarks import (bench_scenarios, benchmark_database, generate_catalog, latency_percentiles,
+                              load_settings, peak_rss_mb, wsgi_load)
+from core.metrics import registry
+
+
+def git_revision():
+    """
+    (branch, commit) of the checkout, Nones outside a git repository
+    """
+    try:
+        return tuple(
+            subprocess.run(['git', *args], capture_output=True, text=True, check=True,
+                           cwd=settings.BASE_DIR).stdout.strip()
+            for args in (('rev-parse', '--abbrev-ref', 'HEAD'), ('rev-parse', 'HEAD'))
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+class Command(BaseCommand):
+    help = ('Generate a catalog with accounts on a throwaway in-memory database and load the books and accounts '
+            'endpoints through the WSGI handler: req/s, p50/p95/p99 latency, queries per request and peak RSS '
+            'per endpoint, written to JSON with --output to compare branches with --compare')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=5000)
+        parser.add_argument('--authors', type=int, help='default a tenth of the books')
+        parser.add_argument('--genres', type=int, default=30)
+        parser.add_argument('--accounts', type=int, default=200)
+        parser.add_argument('--requests', type=int, default=500, help='requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--scenario', action='append', help='only the endpoints whose name contains this')
+        parser.add_argument('--cache', action='store_true', help='keep the response cache on')
+        parser.add_argument('--output', help='write the results to this JSON file')
+        parser.add_argument('--compare', help='a JSON file of an earlier run to compare with')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as file:
+                    baseline = {result['name']: result for result in json.load(file)['results']}
+            except (OSError, ValueError, KeyError) as error:
+                raise CommandError(f'can\'t read {options["compare"]}: {error}')
+
+        with benchmark_database():
+            start = time.perf_counter()
+            generate_catalog(books=options['books'], authors=options['authors'] or max(options['books'] // 10, 1),
+                             genres=options['genres'], accounts=max(options['accounts'], 1))
+            search.rebuild_index()
+            superuser = Account.objects.create_superuser('benchmark_admin', password='benchmark admin password')
+            scenarios = bench_scenarios(superuser, Account.objects.filter(is_superuser=False).order_by('id')[0])
+            self.stdout.write(f'generated the catalog in {time.perf_counter() - start:.1f} s')
+            if options['scenario']:
+                scenarios = [scenario for scenario in scenarios
+                             if any(text in scenario[0] for text in options['scenario'])]
+
+            with override_settings(**load_settings(options['cache'])):
+                application = get_wsgi_application()
+                results = [self.run(application, scenario, options) for scenario in scenarios]
+
+        for result in results:
+            self.write_result(result, baseline)
+        if options['output']:
+            branch, commit = git_revision()
+            report = {
+                'branch': branch, 'commit': commit, 'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'python': platform.python_version(), 'django': django.get_version(),
+                'options': {name: options[name] for name in ('books', 'authors', 'genres', 'accounts', 'requests',
+                                                             'concurrency', 'cache')},
+                'peak_rss_mb': peak_rss_mb(),
+                'results': results,
+            }
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'results written to {options["output"]}'))
+
+    def run(self, application, scenario, options):
+        name, method, url, body, headers, share = scenario
+        requests = max(int(options['requests'] * share), 1)
+        load = dict(method=method, body=body, headers=headers)
+        # warm up, the first requests build url resolvers and serializers
+        wsgi_load(application, [url], 2, 1, **load)
+        seconds, latencies, statuses = wsgi_load(application, [url], requests, options['concurrency'], **load)
+
+        # the queries are counted on a few more requests, sampled by the metrics middleware
+        route = resolve(url.partition('?')[0]).view_name
+        registry.reset()
+        with override_settings(METRICS_ENABLED=True, METRICS_SAMPLE_RATE=1):
+            wsgi_load(application, [url], 5, 1, **load)
+        metrics = registry.snapshot().get(route, {})
+
+        return {
+            'name': name, 'method': method, 'url': url, 'route': route, 'requests': requests,
+            'concurrency': options['concurrency'],
+            'errors': sum(status >= 400 for status in statuses),
+            'requests_per_second': requests / seconds,
+            **latency_percentiles(latencies),
+            'queries_per_request': metrics['queries'] / metrics['sampled'] if metrics.get('sampled') else None,
+            'peak_rss_mb': peak_rss_mb(),
+        }
+
+    def write_result(self, result, baseline):
+        queries = result['queries_per_request']
+        line = (f'{result["name"]:<20} {result["requests_per_second"]:>8.0f} req/s  p50 {result["p50"]:>7.1f}  '
+                f'p95 {result["p95"]:>7.1f}  p99 {result["p99"]:>7.1f} ms  '
+                f'{"-" if queries is None else f"{queries:.1f}":>5} queries')
+        if result['peak_rss_mb'] is not None:
+            line += f'  {result["peak_rss_mb"]:>6.0f} MB'
+        before = (baseline or {}).get(result['name'])
+        if before:
+            change = result['requests_per_second'] / before['requests_per_second'] - 1
+            line += f'  {change:+.0%} req/s, p95 {before["p95"]:.1f} -> {result["p95"]:.1f} ms'
+        self.stdout.write(line)
+        if result['errors']:
+            self.stderr.write(self.style.ERROR(f'{result["name"]}: {result["errors"]} requests failed'))
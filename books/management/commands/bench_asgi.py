@@ -0,0 +1,47 @@
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.test import override_settings
+
+from books.benchmarks import asgi_load, benchmark_database, generate_catalog, latency_summary, load_settings, wsgi_load
+from books.models import Author, Book, Genre
+
+
+class Command(BaseCommand):
+    help = ('Load the catalog read endpoints with concurrent requests as sync views under WSGI, sync views '
+            'under ASGI and the async views under ASGI, on a throwaway in-memory database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=2000)
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--cache', action='store_true', help='keep the response cache on')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            generate_catalog(books=options['books'], authors=max(options['books'] // 10, 1))
+            book = Book.objects.only('slug').order_by('id').first()
+            author = Author.objects.only('slug').order_by('id').first()
+            genre = Genre.objects.only('slug').order_by('id').first()
+            paths = ['books/', f'books/{book.slug}/', f'author/{author.slug}/books/',
+                     f'genre/{genre.slug}/books/', 'authors/', 'genres/']
+
+            with override_settings(**load_settings(options['cache'])):
+                wsgi, asgi = get_wsgi_application(), get_asgi_application()
+                runs = (
+                    ('sync views, WSGI', wsgi_load, wsgi, '/api/'),
+                    ('sync views, ASGI', asgi_load, asgi, '/api/'),
+                    ('async views, ASGI', asgi_load, asgi, '/api/async/'),
+                )
+                for name, load, application, prefix in runs:
+                    urls = [prefix + path for path in paths]
+                    # warm up, the first requests build url resolvers and serializers
+                    load(application, urls, len(urls), 1)
+                    seconds, latencies, statuses = load(application, urls, options['requests'],
+                                                        options['concurrency'])
+                    failed = sum(status != 200 for status in statuses)
+                    if failed:
+                        self.stderr.write(self.style.ERROR(f'{name}: {failed} requests failed'))
+                    rate, median, p95 = latency_summary(seconds, latencies)
+                    self.stdout.write(f'{name:<18} {rate:>8.0f} req/s  median {median:>8.1f} ms  '
+                                      f'p95 {p95:>8.1f} ms')
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from books.benchmarks import best_time, generate_catalog, rolled_back, serialization_runs
+from books.models import Author, Book, Genre
+from books.serializers import AuthorSerializer, BookListSerializer, BookSerializer, GenreSerializer
+from books.views import book_read_queryset
+
+
+class Command(BaseCommand):
+    help = ('Compare the throughput of the DRF serializers and the values() fast path on a generated '
+            'catalog that is rolled back afterwards')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        host = next((host for host in settings.ALLOWED_HOSTS if host not in ('*',) and not host.startswith('.')),
+                    'localhost')
+        context = {'request': Request(RequestFactory(HTTP_HOST=host).get('/api/books/')), 'format': None}
+        with rolled_back():
+            generate_catalog(books=options['books'], authors=max(options['books'] // 10, 1))
+            cases = (
+                ('BookListSerializer', BookListSerializer, Book.objects.order_by('id')),
+                ('BookSerializer', BookSerializer, book_read_queryset(Book.objects.order_by('id'))),
+                ('AuthorSerializer', AuthorSerializer, Author.objects.order_by('id')),
+                ('GenreSerializer', GenreSerializer, Genre.objects.order_by('id')),
+            )
+            for name, serializer_class, queryset in cases:
+                rows = queryset.count()
+                serializer, fast_path = serialization_runs(serializer_class, queryset, context)
+                if serializer() != fast_path():
+                    self.stderr.write(self.style.ERROR(f'{name}: the outputs differ'))
+                slow_ms = best_time(serializer, options['repeat'])
+                fast_ms = best_time(fast_path, options['repeat'])
+                self.stdout.write(
+                    f'{name:<20} {rows:>7} rows  serializer {rows / slow_ms * 1000:>9.0f} rows/s  '
+                    f'fast path {rows / fast_ms * 1000:>9.0f} rows/s  x{slow_ms / fast_ms:.1f}')
@@ -0,0 +1,86 @@
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test import override_settings
+
+from books.benchmarks import (benchmark_database, generate_catalog, latency_percentiles, latency_summary,
+                              load_settings, wsgi_load, write_load)
+from books.models import Author, Book, Genre
+
+
+class Command(BaseCommand):
+    help = ('Read throughput of the catalog endpoints on a SQLite file with django\'s defaults (rollback journal, '
+            'a connection per request) and with WAL, SQLITE_PRAGMAS and persistent connections, alone and while a '
+            'thread writes books in transactions')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=5000)
+        parser.add_argument('--requests', type=int, default=600)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--write-rows', type=int, default=200, help='books updated per write transaction')
+        parser.add_argument('--write-interval', type=float, default=0.01, help='seconds between writes')
+
+    def handle(self, *args, **options):
+        modes = (
+            ('defaults', {'journal_mode': 'DELETE'}, 0),
+            # the throwaway file of the benchmark can be switched to WAL
+            ('tuned', {'journal_mode': 'WAL', **getattr(settings, 'SQLITE_PRAGMAS', {})},
+             settings.DATABASES['default'].get('CONN_MAX_AGE', 0)),
+        )
+        old_max_age = connection.settings_dict['CONN_MAX_AGE']
+        with tempfile.TemporaryDirectory() as directory, benchmark_database(Path(directory) / 'bench.sqlite3'):
+            generate_catalog(books=options['books'], authors=max(options['books'] // 10, 1))
+            book = Book.objects.only('slug').order_by('id').first()
+            author = Author.objects.only('slug').order_by('id').first()
+            genre = Genre.objects.only('slug').order_by('id').first()
+            urls = ['/api/books/', f'/api/books/{book.slug}/', f'/api/author/{author.slug}/books/',
+                    f'/api/genre/{genre.slug}/books/', '/api/authors/', '/api/genres/']
+
+            try:
+                for name, pragmas, max_age in modes:
+                    connection.close()
+                    connection.settings_dict['CONN_MAX_AGE'] = max_age
+                    with override_settings(SQLITE_PRAGMAS=pragmas, **load_settings()):
+                        with connection.cursor() as cursor:
+                            # the journal mode is kept in the file, the other pragmas are per connection
+                            cursor.execute('PRAGMA journal_mode')
+                            journal_mode = cursor.fetchone()[0]
+                        connection.close()
+                        self.stdout.write(self.style.MIGRATE_HEADING(
+                            f'{name}: journal_mode={journal_mode}, CONN_MAX_AGE={max_age}'))
+                        self.measure(get_wsgi_application(), urls, options)
+            finally:
+                connection.settings_dict['CONN_MAX_AGE'] = old_max_age
+                connection.close()
+
+    def measure(self, application, urls, options):
+        # warm up, the first requests build url resolvers and serializers
+        wsgi_load(application, urls, len(urls), 1)
+        self.write_reads('reads', *wsgi_load(application, urls, options['requests'], options['concurrency']))
+
+        stop = threading.Event()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            writes = executor.submit(write_load, stop, options['write_rows'], options['write_interval'])
+            try:
+                reads = wsgi_load(application, urls, options['requests'], options['concurrency'])
+            finally:
+                stop.set()
+            latencies = writes.result()
+        self.write_reads('reads + writes', *reads)
+        if latencies:
+            percentiles = latency_percentiles(latencies)
+            self.stdout.write(f'{"writes":<15} {len(latencies) / reads[0]:>8.1f} tx/s    p50 {percentiles["p50"]:>8.1f} '
+                              f'ms  p95 {percentiles["p95"]:>8.1f} ms')
+
+    def write_reads(self, name, seconds, latencies, statuses):
+        rate, median, p95 = latency_summary(seconds, latencies)
+        self.stdout.write(f'{name:<15} {rate:>8.0f} req/s  median {median:>8.1f} ms  p95 {p95:>8.1f} ms')
+        failed = sum(status != 200 for status in statuses)
+        if failed:
+            self.stderr.write(self.style.ERROR(f'{name}: {failed} requests failed'))
@@ -0,0 +1,28 @@
+from accounts.models import Account
+from core.cache import invalidate_model
+from core.images import generate_renditions, store_digest
+from django.core.management.base import BaseCommand
+
+from books.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Render the thumbnail/medium/webp renditions of existing book covers and avatars'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='also re-check images that have a digest')
+
+    def handle(self, *args, **options):
+        for model, field_name, digest_field in ((Book, 'cover', 'cover_digest'), (Account, 'avatar', 'avatar_digest')):
+            queryset = model.objects.only('id', field_name, digest_field).order_by('id')
+            if not options['force']:
+                queryset = queryset.filter(**{digest_field: ''})
+            rendered = 0
+            for instance in queryset.iterator(chunk_size=500):
+                digest = generate_renditions(getattr(instance, field_name))
+                if digest != getattr(instance, digest_field):
+                    store_digest(model, instance.pk, digest_field, digest)
+                    rendered += 1
+            if rendered:
+                invalidate_model(model)
+            self.stdout.write(f'{model._meta.verbose_name_plural}: {rendered} updated')
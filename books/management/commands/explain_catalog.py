@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from books.benchmarks import baseline_indexes, best_time, catalog_queries, explain, generate_catalog, rolled_back
+from books.models import Book
+
+
+class Command(BaseCommand):
+    help = ('Show EXPLAIN QUERY PLAN and timings of the catalog queries with and without the index plan. '
+            'with --books the queries run on a generated catalog that is rolled back afterwards')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=0, help='generate a catalog of this many books first')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            if options['books']:
+                self.stdout.write(f'generating {options["books"]} books...')
+                generate_catalog(books=options['books'], authors=max(options['books'] // 50, 1))
+            if not Book.objects.exists():
+                raise CommandError('the catalog is empty, pass --books to generate one')
+
+            with baseline_indexes():
+                before = self.measure(options['repeat'])
+            after = self.measure(options['repeat'])
+
+        for name, (before_ms, before_plans) in before.items():
+            after_ms, after_plans = after[name]
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{name}: {before_ms:.2f} ms -> {after_ms:.2f} ms'))
+            self.write_plans('before', before_plans)
+            self.write_plans('after', after_plans)
+
+    def measure(self, repeat):
+        return {
+            name: (best_time(run, repeat), explain(run))
+            for name, run in catalog_queries().items()
+        }
+
+    def write_plans(self, label, plans):
+        self.stdout.write(f'  {label}:')
+        for plan in plans:
+            for line in plan:
+                self.stdout.write(f'    {line}')
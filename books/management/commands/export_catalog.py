@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from books.catalog import export_rows, write_rows
+
+
+class Command(BaseCommand):
+    help = 'Export every book as CSV or JSON lines, streamed in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-', help="file to write, '-' for stdout")
+        parser.add_argument('--format', choices=('csv', 'jsonl'), help='defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        path = options['output']
+        file_format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        rows = export_rows(chunk_size=options['chunk_size'])
+
+        if path == '-':
+            write_rows(rows, self.stdout, file_format)
+        else:
+            with open(path, 'w', newline='', encoding='utf-8') as file:
+                write_rows(rows, file, file_format)
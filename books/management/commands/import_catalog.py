@@ -0,0 +1,30 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from books.catalog import CatalogImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Bulk import books from a CSV or JSON lines file, existing titles are updated'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="file to import, '-' for stdin")
+        parser.add_argument('--format', choices=('csv', 'jsonl'), help='defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        importer = CatalogImporter(batch_size=options['batch_size'])
+
+        if path == '-':
+            importer.run(read_rows(sys.stdin, file_format))
+        else:
+            with open(path, newline='', encoding='utf-8') as file:
+                importer.run(read_rows(file, file_format))
+
+        for number, error in importer.errors:
+            self.stderr.write(f'row {number}: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{importer.created} books created, {importer.updated} updated, {len(importer.errors)} rows skipped'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from books import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full text search index of books, authors and genres'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError('the search index needs SQLite with FTS5, run migrate first')
+        search.rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('search index rebuilt'))
@@ -0,0 +1,28 @@
+# Generated by Django 4.0.3 on 2026-10-18 17:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='author',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='genre',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,61 @@
+from django.db import migrations
+
+CREATE_INDEX = '''
+    CREATE VIRTUAL TABLE books_search_index USING fts5(
+        title, description, author, genres,
+        tokenize = "unicode61 remove_diacritics 2",
+        prefix = "2 3"
+    )
+'''
+
+# rowid = object id * 4 + kind, 0 for books, 1 for authors and 2 for genres
+POPULATE_INDEX = [
+    '''
+    INSERT INTO books_search_index (rowid, title, description, author, genres)
+    SELECT b.id * 4, b.title, coalesce(b.description, ''), a.name,
+           (SELECT coalesce(group_concat(g.title, ' '), '')
+              FROM books_book_genres bg JOIN books_genre g ON g.id = bg.genre_id
+             WHERE bg.book_id = b.id)
+      FROM books_book b JOIN books_author a ON a.id = b.author_id
+    ''',
+    '''
+    INSERT INTO books_search_index (rowid, title, description, author, genres)
+    SELECT id * 4 + 1, name, coalesce(description, ''), '', '' FROM books_author
+    ''',
+    '''
+    INSERT INTO books_search_index (rowid, title, description, author, genres)
+    SELECT id * 4 + 2, title, coalesce(description, ''), '', '' FROM books_genre
+    ''',
+]
+
+
+def fts5_available(schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return False
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return ('ENABLE_FTS5',) in cursor.fetchall()
+
+
+def create_search_index(apps, schema_editor):
+    if not fts5_available(schema_editor):
+        return
+    schema_editor.execute(CREATE_INDEX)
+    for sql in POPULATE_INDEX:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS books_search_index')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0002_author_updated_book_updated_genre_updated'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
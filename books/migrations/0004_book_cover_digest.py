@@ -0,0 +1,18 @@
+# Generated by Django 4.0.3 on 2026-10-18 17:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0003_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='cover_digest',
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+    ]
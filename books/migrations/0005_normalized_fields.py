@@ -0,0 +1,77 @@
+# Generated by Django 4.0.3 on 2026-10-18 17:16
+
+import core.fields
+from django.db import migrations
+
+
+def clear_none_strings(apps, schema_editor):
+    # the old save() stored str(None).lower()
+    for model_name in ('Author', 'Genre', 'Book'):
+        model = apps.get_model('books', model_name)
+        model.objects.filter(description='none').update(description=None)
+    apps.get_model('books', 'Book').objects.filter(language='none').update(language=None)
+    connection = schema_editor.connection
+    if 'books_search_index' in connection.introspection.table_names():
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE books_search_index SET description = '' WHERE description = 'none'")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0004_book_cover_digest'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='author',
+            name='description',
+            field=core.fields.LowerCaseTextField(blank=True, null=True, verbose_name='about author'),
+        ),
+        migrations.AlterField(
+            model_name='author',
+            name='name',
+            field=core.fields.LowerCaseCharField(max_length=255, unique=True, verbose_name='full name'),
+        ),
+        migrations.AlterField(
+            model_name='author',
+            name='slug',
+            field=core.fields.AutoSlugField(populate_from='name', unique=True),
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='description',
+            field=core.fields.LowerCaseTextField(blank=True, max_length=2000, null=True, verbose_name='about book'),
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='language',
+            field=core.fields.LowerCaseCharField(blank=True, default='English', max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='slug',
+            field=core.fields.AutoSlugField(populate_from='title', unique=True),
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='title',
+            field=core.fields.LowerCaseCharField(max_length=255, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='genre',
+            name='description',
+            field=core.fields.LowerCaseTextField(blank=True, null=True, verbose_name='description'),
+        ),
+        migrations.AlterField(
+            model_name='genre',
+            name='slug',
+            field=core.fields.AutoSlugField(populate_from='title', unique=True),
+        ),
+        migrations.AlterField(
+            model_name='genre',
+            name='title',
+            field=core.fields.LowerCaseCharField(max_length=255, unique=True),
+        ),
+        migrations.RunPython(clear_none_strings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.0.3 on 2026-10-18 17:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# genre_books looks up book ids by genre, (genre_id, book_id) answers it from
+# the index alone. the auto created through model has no Meta to declare it on
+CREATE_GENRE_BOOKS_INDEX = 'CREATE INDEX book_genres_genre_book_idx ON books_book_genres (genre_id, book_id)'
+DROP_GENRE_BOOKS_INDEX = 'DROP INDEX book_genres_genre_book_idx'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0005_normalized_fields'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='author',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='books', to='books.author'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['created', 'id'], name='book_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author', 'created', 'id'], name='book_author_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['language', 'created', 'id'], name='book_language_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['published_year', 'created', 'id'], name='book_year_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['price'], name='book_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['updated'], name='book_updated_idx'),
+        ),
+        migrations.RunSQL(CREATE_GENRE_BOOKS_INDEX, DROP_GENRE_BOOKS_INDEX),
+    ]
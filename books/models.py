@@ -1,57 +1,65 @@
 from django.db import models
-from django.utils.text import slugify
 from django.core.validators import FileExtensionValidator
+from core.fields import AutoSlugField, LowerCaseCharField, LowerCaseTextField, NormalizedQuerySet
 from core.utils import book_cover_upload, pdf_upload, validate_published_year
 
 
 class Author(models.Model):
-    name = models.CharField(max_length=255, verbose_name='full name', unique=True)
-    description = models.TextField(verbose_name='about author', blank=True, null=True)
-    slug = models.SlugField(unique=True)
+    name = LowerCaseCharField(max_length=255, verbose_name='full name', unique=True)
+    description = LowerCaseTextField(verbose_name='about author', blank=True, null=True)
+    slug = AutoSlugField(unique=True, populate_from='name')
+    updated = models.DateTimeField(auto_now=True)
 
-    def save(self, *args, **kwargs):
-        self.name = str(self.name).lower()
-        self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+    objects = NormalizedQuerySet.as_manager()
 
     def __str__(self) -> str:
         return self.name
 
 
 class Genre(models.Model):
-    title = models.CharField(max_length=255, unique=True)
-    description = models.TextField(verbose_name='description', blank=True, null=True)
-    slug = models.SlugField(unique=True)
+    title = LowerCaseCharField(max_length=255, unique=True)
+    description = LowerCaseTextField(verbose_name='description', blank=True, null=True)
+    slug = AutoSlugField(unique=True, populate_from='title')
+    updated = models.DateTimeField(auto_now=True)
 
-    def save(self, *args, **kwargs):
-        self.title = str(self.title).lower()
-        self.slug = slugify(self.title)
-        super().save(*args, **kwargs)
+    objects = NormalizedQuerySet.as_manager()
 
     def __str__(self) -> str:
         return self.title
 
 
 class Book(models.Model):
-    title = models.CharField(max_length=255, unique=True)
-    author = models.ForeignKey(Author, related_name='books', on_delete=models.CASCADE)
-    description = models.TextField(verbose_name='about book', blank=True, null=True, max_length=2000)
+    title = LowerCaseCharField(max_length=255, unique=True)
+    # indexed by book_author_created_idx below
+    author = models.ForeignKey(Author, related_name='books', on_delete=models.CASCADE, db_index=False)
+    description = LowerCaseTextField(verbose_name='about book', blank=True, null=True, max_length=2000)
     pages = models.PositiveIntegerField(default=10)
-    language = models.CharField(max_length=100, blank=True, null=True, default='English')
+    language = LowerCaseCharField(max_length=100, blank=True, null=True, default='English')
     published_year = models.PositiveSmallIntegerField(blank=True, null=True, validators=[validate_published_year])
     price = models.DecimalField(max_digits=6, decimal_places=2, default=0)
     cover = models.ImageField(upload_to=book_cover_upload, default='ebook_pictures/default.png')
-    slug = models.SlugField(unique=True)
+    # content hash of the cover, names its renditions
+    cover_digest = models.CharField(max_length=40, blank=True, editable=False)
+    slug = AutoSlugField(unique=True, populate_from='title')
     pdf = models.FileField(upload_to=pdf_upload, validators=[FileExtensionValidator(['pdf'])])
     genres = models.ManyToManyField(Genre, related_name='books', blank=True)
     created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
 
-    def save(self, *args, **kwargs):
-        self.title = str(self.title).lower()
-        self.description = str(self.description).lower()
-        self.language = str(self.language).lower()
-        self.slug = slugify(self.title)
-        super().save(*args, **kwargs)
+    objects = NormalizedQuerySet.as_manager()
+
+    class Meta:
+        # every list is ordered by (-created, -id) for keyset pagination, so the
+        # equality filters lead and (created, id) follows to skip the sort
+        indexes = [
+            models.Index(fields=['created', 'id'], name='book_created_idx'),
+            models.Index(fields=['author', 'created', 'id'], name='book_author_created_idx'),
+            models.Index(fields=['language', 'created', 'id'], name='book_language_created_idx'),
+            models.Index(fields=['published_year', 'created', 'id'], name='book_year_created_idx'),
+            models.Index(fields=['price'], name='book_price_idx'),
+            # Max('updated') of the ETag/Last-Modified validators
+            models.Index(fields=['updated'], name='book_updated_idx'),
+        ]
 
     def __str__(self) -> str:
         return f'{self.title} by {self.author.name}'
\ No newline at end of file
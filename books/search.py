@@ -0,0 +1,155 @@
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+from .models import Author, Book, Genre
+
+SEARCH_TABLE = 'books_search_index'
+
+# one FTS5 table for the whole catalog, the rowid packs the object id and its kind
+KINDS = {'book': 0, 'author': 1, 'genre': 2}
+KIND_COUNT = 4
+
+# bm25 weights of the title, description, author and genres columns
+RANK = f'bm25({SEARCH_TABLE}, 10.0, 1.0, 5.0, 3.0)'
+
+_available = None
+
+
+def is_available():
+    """
+    FTS5 needs SQLite built with it and the index created by the migrations
+    """
+    global _available
+    if _available is None:
+        if connection.vendor != 'sqlite':
+            _available = False
+        else:
+            _available = SEARCH_TABLE in connection.introspection.table_names()
+    return _available
+
+
+def build_match(text):
+    """
+    every word of the query must match, each one as a prefix: `tolk ring` -> `"tolk"* "ring"*`
+    """
+    words = re.findall(r'\w+', text.lower())
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _ids_placeholder(ids):
+    return ', '.join(['%s'] * len(ids))
+
+
+def _delete(kind, ids):
+    rowids = [pk * KIND_COUNT + KINDS[kind] for pk in ids]
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({_ids_placeholder(rowids)})', rowids)
+
+
+def index_books(ids):
+    ids = list(ids)
+    if not ids or not is_available():
+        return
+    _delete('book', ids)
+    genres_through = Book.genres.through._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f'''
+            INSERT INTO {SEARCH_TABLE} (rowid, title, description, author, genres)
+            SELECT b.id * {KIND_COUNT} + {KINDS['book']}, b.title, coalesce(b.description, ''), a.name,
+                   (SELECT coalesce(group_concat(g.title, ' '), '')
+                      FROM {genres_through} bg JOIN {Genre._meta.db_table} g ON g.id = bg.genre_id
+                     WHERE bg.book_id = b.id)
+              FROM {Book._meta.db_table} b JOIN {Author._meta.db_table} a ON a.id = b.author_id
+             WHERE b.id IN ({_ids_placeholder(ids)})
+        ''', ids)
+
+
+def _index_named(kind, model, name_column, ids):
+    ids = list(ids)
+    if not ids or not is_available():
+        return
+    _delete(kind, ids)
+    with connection.cursor() as cursor:
+        cursor.execute(f'''
+            INSERT INTO {SEARCH_TABLE} (rowid, title, description, author, genres)
+            SELECT id * {KIND_COUNT} + {KINDS[kind]}, {name_column}, coalesce(description, ''), '', ''
+              FROM {model._meta.db_table}
+             WHERE id IN ({_ids_placeholder(ids)})
+        ''', ids)
+
+
+def index_authors(ids):
+    _index_named('author', Author, 'name', ids)
+
+
+def index_genres(ids):
+    _index_named('genre', Genre, 'title', ids)
+
+
+def remove(kind, ids):
+    ids = list(ids)
+    if ids and is_available():
+        _delete(kind, ids)
+
+
+def rebuild_index(batch_size=1000):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+    for model, index in ((Book, index_books), (Author, index_authors), (Genre, index_genres)):
+        ids = list(model.objects.order_by('id').values_list('id', flat=True))
+        for start in range(0, len(ids), batch_size):
+            index(ids[start:start + batch_size])
+
+
+def match_ids(kind, text):
+    """
+    subquery of the ids of `kind` objects matching `text`
+    """
+    return RawSQL(
+        f'SELECT rowid / {KIND_COUNT} FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s AND rowid %% {KIND_COUNT} = %s',
+        (build_match(text), KINDS[kind]))
+
+
+def ranked_ids(kind, text, limit):
+    with connection.cursor() as cursor:
+        cursor.execute(f'''
+            SELECT rowid / {KIND_COUNT} FROM {SEARCH_TABLE}
+             WHERE {SEARCH_TABLE} MATCH %s AND rowid %% {KIND_COUNT} = %s
+             ORDER BY {RANK} LIMIT %s
+        ''', (build_match(text), KINDS[kind], limit))
+        return [row[0] for row in cursor.fetchall()]
+
+
+def ranked(queryset, kind, text, limit, fallback_field):
+    """
+    the best `limit` objects of `queryset` for `text`, by relevance with FTS5
+    or by `fallback_field` icontains when the index isn't available
+    """
+    if not build_match(text):
+        return []
+    if not is_available():
+        return list(queryset.filter(**{f'{fallback_field}__icontains': text})[:limit])
+    ids = ranked_ids(kind, text, limit)
+    objects = queryset.in_bulk(ids)
+    return [objects[pk] for pk in ids if pk in objects]
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    ?search= through the FTS5 index with prefix matching, views set `search_kind`.
+    falls back to SearchFilter icontains lookups on `search_fields`
+    when the index isn't available (not SQLite or no FTS5)
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        kind = getattr(view, 'search_kind', None)
+        if kind is None or not is_available():
+            return super().filter_queryset(request, queryset, view)
+
+        text = request.query_params.get(self.search_param, '')
+        if not build_match(text):
+            return queryset
+        return queryset.filter(id__in=match_ids(kind, text))
@@ -1,8 +1,15 @@
-from rest_framework.serializers import ModelSerializer, HyperlinkedIdentityField
+from core.fieldsets import SparseFieldsSerializerMixin
+from core.images import RenditionsField
+from core.metrics import TimedSerializerMixin
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Concat
+from django.utils import timezone
+from rest_framework.serializers import (HyperlinkedIdentityField, IntegerField, ListField, ListSerializer,
+                                        ModelSerializer, SlugField, ValidationError)
 from .models import Author, Genre, Book
 
 
-class AuthorSerializer(ModelSerializer):
+class AuthorSerializer(TimedSerializerMixin, SparseFieldsSerializerMixin, ModelSerializer):
     author_detail_url = HyperlinkedIdentityField(view_name='author-detail', lookup_field='slug', read_only=True)
     author_books_url = HyperlinkedIdentityField(view_name='author-books', lookup_field='slug', read_only=True)
 
@@ -12,7 +19,7 @@ class AuthorSerializer(ModelSerializer):
         extra_kwargs = {'slug': {'read_only': True}, }
 
 
-class GenreSerializer(ModelSerializer):
+class GenreSerializer(TimedSerializerMixin, SparseFieldsSerializerMixin, ModelSerializer):
     genre_detail_url = HyperlinkedIdentityField(view_name='genre-detail', lookup_field='slug', read_only=True)
     genre_books_url = HyperlinkedIdentityField(view_name='genre-books', lookup_field='slug', read_only=True)
 
@@ -22,14 +29,150 @@ class GenreSerializer(ModelSerializer):
         extra_kwargs = {'slug': {'read_only': True}, }
 
 
-class BookSerializer(ModelSerializer):
+class BookSerializer(TimedSerializerMixin, SparseFieldsSerializerMixin, ModelSerializer):
     book_detail_url = HyperlinkedIdentityField(view_name='book-detail', lookup_field='slug', read_only=True)
+    cover_renditions = RenditionsField('cover', source='cover_digest')
 
     class Meta:
         model = Book
-        fields = '__all__'
+        exclude = ('cover_digest',)
         extra_kwargs = {'slug': {'read_only': True}, }
 
     # def get_pdf(self):
     #     user = self.context['request'].user
 
+
+class BookListSerializer(BookSerializer):
+    """
+    compact representation for book lists, the detail has everything
+    """
+
+    class Meta(BookSerializer.Meta):
+        exclude = None
+        fields = ('id', 'title', 'slug', 'author', 'language', 'published_year', 'price', 'cover', 'cover_renditions',
+                  'book_detail_url')
+
+
+class BookBulkListSerializer(ListSerializer):
+    """
+    validates a list of books with a fixed number of queries and writes them
+    with bulk_create, or bulk_update when the instance is the queryset of books
+    to patch by slug. errors are reported per item, aligned with the input
+    """
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        errors = [{} for _ in items]
+
+        def add_error(index, field, message):
+            errors[index].setdefault(field, []).append(message)
+
+        existing = {}
+        if self.instance is None:
+            # the slug of a new book comes from its title
+            for index, item in enumerate(items):
+                if 'slug' in item:
+                    add_error(index, 'slug', 'This field is only allowed when patching.')
+        else:
+            slugs = [item.get('slug') for item in items]
+            for index, slug in enumerate(slugs):
+                if not slug:
+                    add_error(index, 'slug', 'This field is required.')
+            existing = self.instance.in_bulk([slug for slug in slugs if slug], field_name='slug')
+            seen = set()
+            for index, slug in enumerate(slugs):
+                if slug and slug not in existing:
+                    add_error(index, 'slug', f'No book with slug "{slug}".')
+                elif slug in seen:
+                    add_error(index, 'slug', 'Duplicated slug in this request.')
+                seen.add(slug)
+
+        author_ids = {item['author_id'] for item in items if 'author_id' in item}
+        found_authors = set(Author.objects.filter(id__in=author_ids).values_list('id', flat=True))
+        genre_ids = {genre for item in items for genre in item.get('genres', ())}
+        found_genres = set(Genre.objects.filter(id__in=genre_ids).values_list('id', flat=True))
+
+        # the slugs the books of the payload end up with, a rename or the current slug,
+        # must be unique among them and the other books
+        new_slugs, final_slugs, slug_field = {}, {}, Book._meta.get_field('slug')
+        for index, item in enumerate(items):
+            if 'author_id' in item and item['author_id'] not in found_authors:
+                add_error(index, 'author', f'Invalid pk "{item["author_id"]}" - object does not exist.')
+            for genre in set(item.get('genres', ())) - found_genres:
+                add_error(index, 'genres', f'Invalid pk "{genre}" - object does not exist.')
+            if 'title' in item:
+                slug = slug_field.slugify(item['title'])
+                if slug in new_slugs:
+                    add_error(index, 'title', 'Duplicated title in this request.')
+                new_slugs[slug] = index
+            elif item.get('slug') in existing:
+                final_slugs.setdefault(item['slug'], index)
+        for slug, index in new_slugs.items():
+            if slug in final_slugs:
+                add_error(index, 'title', 'book with this title already exists.')
+        own_ids = [book.id for book in existing.values()]
+        for slug in Book.objects.filter(slug__in=new_slugs).exclude(id__in=own_ids).values_list('slug', flat=True):
+            add_error(new_slugs[slug], 'title', 'book with this title already exists.')
+
+        if any(errors):
+            raise ValidationError(errors)
+        self.existing = existing
+        return items
+
+    @staticmethod
+    def set_genres(books, items):
+        through = Book.genres.through
+        replaced = [book.id for book, item in zip(books, items) if 'genres' in item]
+        through.objects.filter(book_id__in=replaced).delete()
+        through.objects.bulk_create([
+            through(book_id=book.id, genre_id=genre)
+            for book, item in zip(books, items) for genre in set(item.get('genres', ()))
+        ])
+
+    def create(self, validated_data):
+        books = [Book(**{name: value for name, value in item.items() if name != 'genres'}) for item in validated_data]
+        Book.objects.bulk_create(books)
+        self.set_genres(books, validated_data)
+        return books
+
+    def update(self, instance, validated_data):
+        books, fields = [], {'updated'}
+        now = timezone.now()
+        for item in validated_data:
+            book = self.existing[item['slug']]
+            for name, value in item.items():
+                if name not in ('slug', 'genres'):
+                    setattr(book, name, value)
+                    fields.add(name)
+            book.updated = now
+            books.append(book)
+        # the unique indexes are checked row by row within the UPDATE, the books renamed
+        # away from a slug another book of the request takes give it and their title up beforehand
+        slug_field = Book._meta.get_field('slug')
+        taken = {slug_field.slugify(item['title']) for item in validated_data if 'title' in item}
+        vacated = [book.id for slug, book in self.existing.items()
+                   if slug in taken and slug_field.slugify(book.title) != slug]
+        if vacated:
+            suffix = Cast('id', CharField())
+            Book.objects.filter(id__in=vacated).update(title=Concat('title', Value('~'), suffix),
+                                                       slug=Concat(Value('~'), suffix))
+        Book.objects.bulk_update(books, fields)
+        self.set_genres(books, validated_data)
+        return books
+
+
+class BookBulkSerializer(ModelSerializer):
+    """
+    input of the bulk endpoint, relations are plain ids checked in batch by
+    BookBulkListSerializer and files are left to the single book endpoints
+    """
+    slug = SlugField(required=False)
+    author = IntegerField(source='author_id')
+    genres = ListField(child=IntegerField(), required=False)
+
+    class Meta:
+        model = Book
+        fields = ('slug', 'title', 'author', 'description', 'pages', 'language', 'published_year', 'price', 'genres')
+        extra_kwargs = {'title': {'validators': []}}
+        list_serializer_class = BookBulkListSerializer
+
@@ -0,0 +1,127 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from core.cache import invalidate_model
+from core.images import mark_upload, process_upload
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import search
+from .models import Author, Book, Genre
+
+# set while books are deleted in bulk, the caller unindexes them and invalidates once
+bulk_deleting = ContextVar('bulk_deleting', default=False)
+
+
+@contextmanager
+def bulk_delete():
+    token = bulk_deleting.set(True)
+    try:
+        yield
+    finally:
+        bulk_deleting.reset(token)
+
+
+@receiver([post_save, post_delete], sender=Book)
+@receiver([post_save, post_delete], sender=Author)
+@receiver([post_save, post_delete], sender=Genre)
+def invalidate_cached_responses(sender, signal, **kwargs):
+    if not (signal is post_delete and sender is Book and bulk_deleting.get()):
+        invalidate_model(sender)
+
+
+@receiver(post_delete, sender=Genre)
+def invalidate_genre_books(sender, **kwargs):
+    # deleting a genre drops its through rows without an m2m_changed signal
+    invalidate_model(Book)
+
+
+@receiver(m2m_changed, sender=Book.genres.through)
+def invalidate_book_genres(sender, action, **kwargs):
+    if action.startswith('post_'):
+        invalidate_model(Book)
+
+
+@receiver(m2m_changed, sender=Book.genres.through)
+def touch_book_genres(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    genres are part of the book representation, bump `updated`
+    of the books whose genres changed so their validators change too
+    """
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        books = Book.objects.filter(pk=instance.pk)
+    elif reverse and action in ('post_add', 'post_remove'):
+        books = Book.objects.filter(pk__in=pk_set)
+    elif reverse and action == 'pre_clear':
+        books = instance.books.all()
+    else:
+        return
+    books.update(updated=timezone.now())
+
+
+@receiver(pre_delete, sender=Genre)
+def touch_genre_books(sender, instance, **kwargs):
+    instance.books.update(updated=timezone.now())
+
+
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, **kwargs):
+    search.index_books([instance.pk])
+
+
+@receiver(post_save, sender=Author)
+def index_author(sender, instance, **kwargs):
+    search.index_authors([instance.pk])
+    # the author name is indexed with the books
+    search.index_books(instance.books.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Genre)
+def index_genre(sender, instance, **kwargs):
+    search.index_genres([instance.pk])
+    search.index_books(instance.books.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, **kwargs):
+    if not bulk_deleting.get():
+        search.remove('book', [instance.pk])
+
+
+@receiver(post_delete, sender=Author)
+def unindex_author(sender, instance, **kwargs):
+    search.remove('author', [instance.pk])
+
+
+@receiver(pre_delete, sender=Genre)
+def collect_genre_books(sender, instance, **kwargs):
+    instance._indexed_book_ids = list(instance.books.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Genre)
+def unindex_genre(sender, instance, **kwargs):
+    search.remove('genre', [instance.pk])
+    search.index_books(getattr(instance, '_indexed_book_ids', []))
+
+
+@receiver(m2m_changed, sender=Book.genres.through)
+def index_book_genres(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        search.index_books([instance.pk])
+    elif reverse and action in ('post_add', 'post_remove'):
+        search.index_books(pk_set)
+    elif reverse and action == 'pre_clear':
+        instance._indexed_book_ids = list(instance.books.values_list('id', flat=True))
+    elif reverse and action == 'post_clear':
+        search.index_books(getattr(instance, '_indexed_book_ids', []))
+
+
+@receiver(pre_save, sender=Book)
+def mark_cover_upload(sender, instance, **kwargs):
+    mark_upload(instance, 'cover')
+
+
+@receiver(post_save, sender=Book)
+def render_cover(sender, instance, **kwargs):
+    process_upload(instance, 'cover', 'cover_digest')
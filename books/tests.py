@@ -1,10 +1,46 @@
 import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO, StringIO
+from urllib.parse import urlencode
 from accounts.models import Account
+from core.asynchronous import database_sync_to_async
+from core.cache import response_cache
+from core.fastpath import FastRepresentation
+from core.db import check_connections, is_usable
+from core.metrics import registry
+from core.queryguard import QueryBudgetExceeded, query_shape
+from core.renderers import stream_representations
+from core.throttling import get_store
+from core.testing import QueryBudgetMixin
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, connections
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.http import http_date
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.serializers import SerializerMethodField
+from rest_framework.test import APIRequestFactory, APITestCase, APITransactionTestCase
 
+from PIL import Image
+
+from books import search
+from books.benchmarks import (BENCHMARK_PASSWORD, asgi_load, bench_scenarios, catalog_queries, explain,
+                              generate_catalog, latency_percentiles, peak_rss_mb, wsgi_load, write_load)
 from books.models import Author, Book, Genre
+from books.serializers import BookSerializer
+from books.views import book_read_queryset
 
 
 superuser_data = {'username': 'admin_user', 'password': 'admin_user_pass'}
@@ -19,7 +55,7 @@ genre_data2 = {'title': 'other genre', 'description': 'some description about ge
 book_data = {'title': 'book title', 'description': 'some description about book'}
 
 
-class BookViewSetTestCase(APITestCase):
+class BookViewSetTestCase(QueryBudgetMixin, APITestCase):
     
     def setUp(self) -> None:
         # create a superuser        
@@ -33,7 +69,84 @@ class BookViewSetTestCase(APITestCase):
         # Authorization with access token
         self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + admin_auth['access'])
 
-        self.book = Book.objects.create(**book_data)
+        self.author = Author.objects.create(**author_data)
+        self.genre = Genre.objects.create(**genre_data)
+        self.book = Book.objects.create(author=self.author, **book_data)
+        self.book.genres.add(self.genre)
+
+    def create_books(self, count):
+        genre = Genre.objects.create(**genre_data2)
+        for i in range(count):
+            book = Book.objects.create(author=self.author, title=f'book {i}')
+            book.genres.add(self.genre, genre)
+
+    def test_books_list(self):
+        url = reverse('book-list')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_books_list_query_budget(self):
+        self.create_books(10)
+        # authenticated user, validators aggregate, books with their authors, prefetched genres
+        self.assertQueryBudget(4, reverse('book-list'), duplicates=2)
+
+    def test_book_detail_query_budget(self):
+        url = reverse('book-detail', kwargs={'slug': self.book.slug})
+        response = self.assertQueryBudget(4, url, duplicates=2)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content)['genres'], [self.genre.id])
+
+    def test_author_books_query_budget(self):
+        self.create_books(10)
+        url = reverse('author-books', kwargs={'slug': self.author.slug})
+        response = self.assertQueryBudget(4, url, duplicates=2)
+        self.assertEqual(len(json.loads(response.content)['results']), 11)
+
+    def test_genre_books_query_budget(self):
+        self.create_books(10)
+        url = reverse('genre-books', kwargs={'slug': self.genre.slug})
+        response = self.assertQueryBudget(4, url, duplicates=2)
+        self.assertEqual(len(json.loads(response.content)['results']), 11)
+
+    def test_genre_books_without_duplicates(self):
+        other_genre = Genre.objects.create(**genre_data2)
+        self.book.genres.add(other_genre)
+        url = reverse('genre-books', kwargs={'slug': self.genre.slug})
+        response = self.client.get(url)
+        self.assertEqual([book['slug'] for book in json.loads(response.content)['results']], [self.book.slug])
+
+    def test_books_list_cursor_pagination(self):
+        self.create_books(4)
+        expected = list(Book.objects.order_by('-created', '-id').values_list('slug', flat=True))
+        slugs, url = [], reverse('book-list') + '?page_size=2'
+        while url:
+            response_data = json.loads(self.client.get(url).content)
+            slugs += [book['slug'] for book in response_data['results']]
+            url = response_data['next']
+        self.assertEqual(slugs, expected)
+
+    def test_books_list_cursor_previous_page(self):
+        self.create_books(4)
+        first_page = json.loads(self.client.get(reverse('book-list') + '?page_size=2').content)
+        second_page = json.loads(self.client.get(first_page['next']).content)
+        response_data = json.loads(self.client.get(second_page['previous']).content)
+        self.assertEqual(response_data['results'], first_page['results'])
+
+    def test_books_list_invalid_cursor(self):
+        response = self.client.get(reverse('book-list') + '?cursor=invalid')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_books_list_page_number_for_superuser(self):
+        self.create_books(4)
+        response = self.client.get(reverse('book-list') + '?page=2&page_size=2')
+        response_data = json.loads(response.content)
+        self.assertEqual(response_data['count'], 5)
+        self.assertEqual(len(response_data['results']), 2)
+
+    def test_books_list_page_number_ignored_for_staff_user(self):
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.client.get(reverse('book-list') + '?page=2')
+        self.assertNotIn('count', json.loads(response.content))
 
 
 
@@ -203,3 +316,1157 @@ class GenreViewSetTestCase(APITestCase):
         url = reverse('genre-detail', kwargs={'slug': self.genre.slug})
         response = self.client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class CatalogResponseCacheTestCase(QueryBudgetMixin, APITestCase):
+
+    def setUp(self) -> None:
+        self.author = Author.objects.create(**author_data)
+        self.genre = Genre.objects.create(**genre_data)
+        self.book = Book.objects.create(author=self.author, **book_data)
+        response_cache.reset_stats()
+
+    def test_second_request_is_served_from_cache(self):
+        url = reverse('book-list')
+        first = self.client.get(url)
+        # only the validators aggregate
+        second = self.assertQueryBudget(1, url)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(response_cache.stats()['hits'], 1)
+        self.assertEqual(response_cache.stats()['misses'], 1)
+
+    def test_save_invalidates_cache(self):
+        url = reverse('author-detail', kwargs={'slug': self.author.slug})
+        self.client.get(url)
+        self.author.description = 'new description'
+        self.author.save()
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(json.loads(response.content)['description'], 'new description')
+
+    def test_genres_change_invalidates_book_cache(self):
+        url = reverse('book-detail', kwargs={'slug': self.book.slug})
+        self.client.get(url)
+        self.book.genres.add(self.genre)
+        response = self.client.get(url)
+        self.assertEqual(json.loads(response.content)['genres'], [self.genre.id])
+
+    def test_genre_delete_invalidates_book_cache(self):
+        self.book.genres.add(self.genre)
+        url = reverse('book-detail', kwargs={'slug': self.book.slug})
+        self.client.get(url)
+        self.genre.delete()
+        response = self.client.get(url)
+        self.assertEqual(json.loads(response.content)['genres'], [])
+
+    def test_unrelated_write_keeps_cache(self):
+        url = reverse('genre-list')
+        self.client.get(url)
+        Author.objects.create(**author_data2)
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'example.com'])
+    def test_cache_key_includes_host(self):
+        url = reverse('book-list')
+        self.client.get(url)
+        response = self.client.get(url, HTTP_HOST='example.com')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn('http://example.com/', response.content.decode())
+
+
+class ConditionalGetTestCase(QueryBudgetMixin, APITestCase):
+
+    def setUp(self) -> None:
+        self.author = Author.objects.create(**author_data)
+        self.genre = Genre.objects.create(**genre_data)
+        self.book = Book.objects.create(author=self.author, **book_data)
+
+    def test_list_not_modified(self):
+        url = reverse('book-list')
+        response = self.client.get(url)
+        self.assertIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+        # a single aggregate query, nothing serialized
+        response = self.assertQueryBudget(1, url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+    def test_detail_not_modified(self):
+        url = reverse('book-detail', kwargs={'slug': self.book.slug})
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_detail_if_modified_since(self):
+        url = reverse('author-detail', kwargs={'slug': self.author.slug})
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_list_if_modified_since_after_delete(self):
+        url = reverse('book-list')
+        Book.objects.create(author=self.author, title='another book')
+        # the newest book is kept, the max `updated` of the list doesn't move
+        self.book.delete()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(time.time()))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([book['title'] for book in json.loads(response.content)['results']], ['another book'])
+
+    def test_update_changes_etag(self):
+        url = reverse('book-list')
+        etag = self.client.get(url)['ETag']
+        self.book.pages = 20
+        self.book.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_genres_change_changes_etag(self):
+        url = reverse('book-detail', kwargs={'slug': self.book.slug})
+        etag = self.client.get(url)['ETag']
+        self.genre.books.add(self.book)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_delete_changes_etag(self):
+        Book.objects.create(author=self.author, title='other book')
+        url = reverse('author-books', kwargs={'slug': self.author.slug})
+        etag = self.client.get(url)['ETag']
+        self.book.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_query_string_changes_etag(self):
+        url = reverse('book-list')
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, {'page_size': 1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_missing_detail(self):
+        url = reverse('book-detail', kwargs={'slug': 'missing'})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SearchTestCase(APITestCase):
+
+    def setUp(self) -> None:
+        self.author = Author.objects.create(name='j. r. r. tolkien')
+        self.genre = Genre.objects.create(title='fantasy')
+        self.book = Book.objects.create(author=self.author, title='the lord of the rings',
+                                        description='an epic high fantasy novel')
+        self.book.genres.add(self.genre)
+        self.other_book = Book.objects.create(author=Author.objects.create(**author_data),
+                                              title='a book about rings', description='ring theory')
+
+    def search_slugs(self, url_name, text):
+        response = self.client.get(reverse(url_name), {'search': text})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(item['slug'] for item in json.loads(response.content)['results'])
+
+    def test_prefix_search(self):
+        self.assertEqual(self.search_slugs('book-list', 'lor'), [self.book.slug])
+
+    def test_search_all_words(self):
+        self.assertEqual(self.search_slugs('book-list', 'rings lord'), [self.book.slug])
+        self.assertEqual(self.search_slugs('book-list', 'rings'), sorted([self.book.slug, self.other_book.slug]))
+
+    def test_search_author_and_genre_of_book(self):
+        self.assertEqual(self.search_slugs('book-list', 'tolkien'), [self.book.slug])
+        self.assertEqual(self.search_slugs('book-list', 'fantasy'), [self.book.slug])
+
+    def test_index_follows_updates(self):
+        self.author.name = 'john ronald reuel tolkien'
+        self.author.save()
+        self.assertEqual(self.search_slugs('book-list', 'ronald'), [self.book.slug])
+        self.book.genres.remove(self.genre)
+        self.assertEqual(self.search_slugs('book-list', 'fantasy'), [self.book.slug])  # description
+        self.book.description = ''
+        self.book.save()
+        self.assertEqual(self.search_slugs('book-list', 'fantasy'), [])
+
+    def test_index_follows_deletes(self):
+        self.genre.delete()
+        self.assertEqual(self.search_slugs('genre-list', 'fantasy'), [])
+        self.book.delete()
+        self.assertEqual(self.search_slugs('book-list', 'lord'), [])
+
+    def test_search_authors_and_genres(self):
+        self.assertEqual(self.search_slugs('author-list', 'tolk'), [self.author.slug])
+        self.assertEqual(self.search_slugs('genre-list', 'fan'), [self.genre.slug])
+
+    def test_unified_search_ranks_titles_first(self):
+        response = self.client.get(reverse('search'), {'q': 'ring'})
+        response_data = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([book['slug'] for book in response_data['books']], [self.other_book.slug, self.book.slug])
+        self.assertEqual(response_data['authors'], [])
+
+    def test_unified_search_limit(self):
+        response = self.client.get(reverse('search'), {'q': 'ring', 'limit': 1})
+        self.assertEqual(len(json.loads(response.content)['books']), 1)
+
+    def test_unified_search_empty_query(self):
+        response = self.client.get(reverse('search'), {'q': '  '})
+        self.assertEqual(json.loads(response.content), {'books': [], 'authors': [], 'genres': []})
+
+
+class BookDownloadTestCase(APITestCase):
+    content = bytes(range(256)) * 40
+
+    def setUp(self) -> None:
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        author = Author.objects.create(**author_data)
+        self.book = Book.objects.create(
+            author=author, pdf=SimpleUploadedFile('book.pdf', self.content), **book_data)
+        self.url = reverse('book-download', kwargs={'slug': self.book.slug})
+
+    def test_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertTrue(response['Content-Disposition'].startswith('attachment'))
+
+    def test_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+
+    def test_open_and_suffix_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10000-')
+        self.assertEqual(b''.join(response.streaming_content), self.content[10000:])
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-5:])
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+    def test_if_range(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @override_settings(MEDIA_DOWNLOAD_OFFLOAD='x-accel-redirect')
+    def test_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.book.pdf.name)
+        self.assertEqual(response.content, b'')
+
+    def test_missing_cover(self):
+        response = self.client.get(reverse('book-cover', kwargs={'slug': self.book.slug}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+def image_file(name, size=(1200, 900), image_format='PNG'):
+    output = BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(output, image_format)
+    return SimpleUploadedFile(name, output.getvalue())
+
+
+class CoverRenditionsTestCase(APITestCase):
+
+    def setUp(self) -> None:
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.author = Author.objects.create(**author_data)
+
+    def test_renditions_generated_on_upload(self):
+        book = Book.objects.create(author=self.author, cover=image_file('cover.png'), **book_data)
+        self.assertEqual(len(book.cover_digest), 40)
+        self.assertEqual(Book.objects.get(pk=book.pk).cover_digest, book.cover_digest)
+
+        response = self.client.get(reverse('book-detail', kwargs={'slug': book.slug}))
+        renditions = json.loads(response.content)['cover_renditions']
+        self.assertEqual(set(renditions), {'thumbnail', 'medium', 'webp'})
+        self.assertTrue(renditions['webp'].startswith('http://testserver/media/renditions/'))
+
+        thumbnail = os.path.join(self.media_root, 'renditions', book.cover_digest[:2],
+                                 f'{book.cover_digest}-thumbnail.jpg')
+        with Image.open(thumbnail) as image:
+            self.assertLessEqual(max(image.size), 160)
+
+    def test_build_renditions_changes_the_validators(self):
+        os.makedirs(os.path.join(self.media_root, 'book_covers'))
+        Image.new('RGB', (300, 300)).save(os.path.join(self.media_root, 'book_covers', 'old.png'))
+        book = Book.objects.create(author=self.author, cover='book_covers/old.png', **book_data)
+        url = reverse('book-detail', kwargs={'slug': book.slug})
+        response = self.client.get(url)
+        self.assertIsNone(json.loads(response.content)['cover_renditions'])
+        call_command('build_renditions', stdout=StringIO())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNotNone(json.loads(response.content)['cover_renditions'])
+
+    def test_identical_uploads_share_renditions(self):
+        first = Book.objects.create(author=self.author, cover=image_file('cover.png'), title='first')
+        second = Book.objects.create(author=self.author, cover=image_file('cover.png'), title='second')
+        self.assertEqual(first.cover_digest, second.cover_digest)
+        self.assertEqual(len(os.listdir(os.path.join(self.media_root, 'renditions', first.cover_digest[:2]))), 3)
+
+    def test_no_renditions_without_upload(self):
+        book = Book.objects.create(author=self.author, **book_data)
+        self.assertEqual(book.cover_digest, '')
+        response = self.client.get(reverse('book-detail', kwargs={'slug': book.slug}))
+        self.assertIsNone(json.loads(response.content)['cover_renditions'])
+
+    def test_build_renditions_command(self):
+        os.makedirs(os.path.join(self.media_root, 'book_covers'))
+        Image.new('RGB', (300, 300)).save(os.path.join(self.media_root, 'book_covers', 'old.png'))
+        book = Book.objects.create(author=self.author, cover='book_covers/old.png', **book_data)
+        self.assertEqual(book.cover_digest, '')
+        call_command('build_renditions', stdout=StringIO())
+        book.refresh_from_db()
+        self.assertEqual(len(book.cover_digest), 40)
+
+
+class CatalogImportExportTestCase(APITestCase):
+    csv_content = (
+        'title,author,description,pages,language,published_year,price,genres,cover,pdf\n'
+        'The Hobbit,J. R. R. Tolkien,There and back again,310,English,1937,12.50,Fantasy|Adventure,,\n'
+        'The Silmarillion,J. R. R. Tolkien,,365,,1977,,Fantasy,,pdfs/the-silmarillion.pdf\n'
+        ',Nobody,missing title,,,,,,,\n'
+    )
+
+    def import_file(self, content, suffix='.csv', *args):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False) as file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_catalog', file.name, *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_import_csv(self):
+        stdout, stderr = self.import_file(self.csv_content)
+        self.assertIn('2 books created, 0 updated, 1 rows skipped', stdout)
+        self.assertIn('row 3', stderr)
+
+        hobbit = Book.objects.get(slug='the-hobbit')
+        self.assertEqual(hobbit.title, 'the hobbit')
+        self.assertEqual(hobbit.author.name, 'j. r. r. tolkien')
+        self.assertEqual(str(hobbit.price), '12.50')
+        self.assertEqual(sorted(hobbit.genres.values_list('slug', flat=True)), ['adventure', 'fantasy'])
+        self.assertEqual(Author.objects.count(), 1)
+
+        silmarillion = Book.objects.get(slug='the-silmarillion')
+        self.assertIsNone(silmarillion.description)
+        self.assertEqual(silmarillion.language, 'english')
+        self.assertEqual(silmarillion.pdf.name, 'pdfs/the-silmarillion.pdf')
+
+    def test_import_updates_existing_books(self):
+        author = Author.objects.create(name='J. R. R. Tolkien')
+        genre = Genre.objects.create(title='classics')
+        book = Book.objects.create(author=author, title='The Hobbit', pages=1)
+        book.genres.add(genre)
+        self.import_file(self.csv_content)
+        book.refresh_from_db()
+        self.assertEqual(book.pages, 310)
+        self.assertEqual(sorted(book.genres.values_list('slug', flat=True)), ['adventure', 'fantasy'])
+
+    def test_import_jsonl_in_constant_queries(self):
+        lines = [json.dumps({'title': f'book {i}', 'author': f'author {i % 3}', 'genres': ['a', 'b']})
+                 for i in range(60)]
+        with CaptureQueriesContext(connection) as context:
+            stdout, _ = self.import_file('\n'.join(lines), '.jsonl', '--batch-size', '30')
+        self.assertIn('60 books created', stdout)
+        self.assertLess(len(context), 40)
+        self.assertEqual(Book.genres.through.objects.count(), 120)
+
+    def test_import_skips_invalid_rows(self):
+        rows = [{'title': 'first', 'author': 'someone', 'pages': 100},
+                {'title': 'negative', 'author': 'someone', 'pages': -5},
+                {'title': 'ancient', 'author': 'someone', 'published_year': 1200},
+                {'title': 'pricey', 'author': 'someone', 'price': '12345.999'},
+                {'title': 'last', 'author': 'someone', 'published_year': 1990}]
+        stdout, stderr = self.import_file(''.join(json.dumps(row) + '\n' for row in rows), '.jsonl')
+        self.assertIn('2 books created, 0 updated, 3 rows skipped', stdout)
+        self.assertIn('row 2: pages:', stderr)
+        self.assertIn('row 3: published_year: Invalid Year!', stderr)
+        self.assertIn('row 4: price:', stderr)
+        self.assertEqual(sorted(Book.objects.values_list('slug', flat=True)), ['first', 'last'])
+
+    def test_export_round_trip(self):
+        self.import_file(self.csv_content)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'catalog.jsonl')
+            call_command('export_catalog', '--output', path, '--chunk-size', '1')
+            with open(path) as file:
+                rows = [json.loads(line) for line in file]
+        self.assertEqual([row['title'] for row in rows], ['the hobbit', 'the silmarillion'])
+        self.assertEqual(rows[0]['genres'], ['adventure', 'fantasy'])
+        self.assertEqual(rows[0]['price'], '12.50')
+
+        Book.objects.all().delete()
+        self.import_file(''.join(json.dumps(row) + '\n' for row in rows), '.jsonl')
+        self.assertEqual(Book.objects.count(), 2)
+
+
+class BookBulkTestCase(QueryBudgetMixin, APITestCase):
+
+    def setUp(self) -> None:
+        self.superuser = Account.objects.create_superuser(**superuser_data)
+        self.staff_user = Account.objects.create_user(**staff_user_data)
+        self.client.force_authenticate(user=self.superuser)
+        self.author = Author.objects.create(**author_data)
+        self.genre = Genre.objects.create(**genre_data)
+        self.genre2 = Genre.objects.create(**genre_data2)
+        self.url = reverse('book-bulk')
+
+    def test_bulk_create(self):
+        data = [{'title': f'Book {i}', 'author': self.author.id, 'genres': [self.genre.id, self.genre2.id]}
+                for i in range(20)]
+        response = self.assertQueryBudget(12, self.url, 'post', data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 20)
+        self.assertEqual(response.data[0]['title'], 'book 0')
+        self.assertEqual(Book.objects.get(slug='book-19').genres.count(), 2)
+
+    def test_bulk_create_reports_errors_per_item(self):
+        Book.objects.create(author=self.author, title='taken')
+        data = [
+            {'title': 'fine', 'author': self.author.id},
+            {'title': 'Taken', 'author': self.author.id},
+            {'title': 'other', 'author': 999, 'genres': [998]},
+            {'title': 'FINE', 'author': self.author.id},
+        ]
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('title', response.data[1])
+        self.assertEqual(set(response.data[2]), {'author', 'genres'})
+        self.assertIn('title', response.data[3])
+        self.assertFalse(Book.objects.filter(slug='fine').exists())
+
+    def test_bulk_create_rejects_slugs(self):
+        book = Book.objects.create(author=self.author, title='existing')
+        data = [{'slug': 'custom-slug', 'title': 'new book', 'author': self.author.id},
+                {'slug': book.slug, 'title': 'other book', 'author': self.author.id},
+                {'title': 'fine', 'author': self.author.id}]
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {'slug': ['This field is only allowed when patching.']})
+        self.assertEqual(response.data[1], {'slug': ['This field is only allowed when patching.']})
+        self.assertEqual(response.data[2], {})
+        self.assertEqual(list(Book.objects.values_list('slug', flat=True)), ['existing'])
+
+    def test_bulk_update(self):
+        books = [Book.objects.create(author=self.author, title=f'book {i}') for i in range(3)]
+        data = [{'slug': book.slug, 'price': '9.99', 'genres': [self.genre.id]} for book in books]
+        data[0]['title'] = 'Renamed'
+        response = self.client.patch(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Book.objects.filter(price='9.99').count(), 3)
+        self.assertTrue(Book.objects.filter(slug='renamed', genres=self.genre).exists())
+
+    def test_bulk_update_unknown_slug(self):
+        book = Book.objects.create(author=self.author, title='book')
+        response = self.client.patch(self.url, [{'slug': book.slug, 'pages': 1}, {'slug': 'missing'}, {}],
+                                     format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('slug', response.data[1])
+        self.assertIn('slug', response.data[2])
+        book.refresh_from_db()
+        self.assertEqual(book.pages, 10)
+
+    def test_bulk_delete(self):
+        books = [Book.objects.create(author=self.author, title=f'book {i}') for i in range(3)]
+        response = self.client.delete(self.url, {'slugs': [books[0].slug, books[1].slug]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(list(Book.objects.values_list('slug', flat=True)), [books[2].slug])
+
+    def test_bulk_update_rename_onto_a_kept_slug(self):
+        alpha = Book.objects.create(author=self.author, title='alpha')
+        beta = Book.objects.create(author=self.author, title='beta')
+        response = self.client.patch(self.url, [{'slug': alpha.slug, 'title': 'beta'},
+                                                {'slug': beta.slug, 'price': '1.00'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {'title': ['book with this title already exists.']})
+        self.assertEqual(response.data[1], {})
+        # renaming the other book away frees the slug, a swap included
+        response = self.client.patch(self.url, [{'slug': alpha.slug, 'title': 'beta'},
+                                                {'slug': beta.slug, 'title': 'alpha'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(dict(Book.objects.values_list('id', 'slug')), {alpha.id: 'beta', beta.id: 'alpha'})
+
+    def test_bulk_delete_queries(self):
+        books = [Book.objects.create(author=self.author, title=f'book {i}') for i in range(56)]
+        search.rebuild_index()
+        for count in (5, 50):
+            with self.subTest(count):
+                slugs = [book.slug for book in books[:count]]
+                response = self.assertQueryBudget(8, self.url, 'delete', data={'slugs': slugs}, format='json')
+                self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+                books = books[count:]
+        self.assertEqual(list(Book.objects.values_list('slug', flat=True)), [book.slug for book in books])
+        if search.is_available():
+            self.assertEqual(search.ranked_ids('book', 'book', 100), [books[0].id])
+
+    def test_bulk_delete_unknown_slug(self):
+        book = Book.objects.create(author=self.author, title='book')
+        response = self.client.delete(self.url, {'slugs': [book.slug, 'missing']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, [{}, {'slug': ['No book with slug "missing".']}])
+        self.assertTrue(Book.objects.filter(pk=book.pk).exists())
+
+    def test_bulk_by_staff_user(self):
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.client.post(self.url, [], format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_bulk_expects_a_list(self):
+        response = self.client.post(self.url, {'title': 'book'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class NormalizedFieldsTestCase(APITestCase):
+
+    def setUp(self) -> None:
+        self.superuser = Account.objects.create_superuser(**superuser_data)
+        self.client.force_authenticate(user=self.superuser)
+        self.author = Author.objects.create(name='Author Name')
+
+    def test_save_lowercases_and_keeps_none(self):
+        book = Book.objects.create(author=self.author, title='Book Title', language='French')
+        book.refresh_from_db()
+        self.assertEqual((book.title, book.slug, book.language), ('book title', 'book-title', 'french'))
+        self.assertIsNone(book.description)
+        self.assertIsNone(self.author.description)
+        self.assertEqual(self.author.slug, 'author-name')
+
+    def test_slug_follows_title_changes_only(self):
+        book = Book.objects.create(author=self.author, title='book title')
+        Book.objects.filter(pk=book.pk).update(slug='kept')
+        book = Book.objects.get(pk=book.pk)
+        book.price = 5
+        book.save()
+        self.assertEqual(Book.objects.get(pk=book.pk).slug, 'kept')
+        book.title = 'New Title'
+        book.save()
+        self.assertEqual(Book.objects.values_list('title', 'slug').get(pk=book.pk), ('new title', 'new-title'))
+
+    def test_queryset_update_and_bulk_update(self):
+        book = Book.objects.create(author=self.author, title='book title')
+        Book.objects.filter(pk=book.pk).update(title='Updated Title')
+        self.assertEqual(Book.objects.values_list('title', 'slug').get(pk=book.pk), ('updated title', 'updated-title'))
+        book.title = 'Bulk Title'
+        Book.objects.bulk_update([book], ['title'])
+        self.assertEqual(book.slug, 'bulk-title')
+        self.assertEqual(Book.objects.values_list('title', 'slug').get(pk=book.pk), ('bulk title', 'bulk-title'))
+
+    def test_bulk_create_normalizes(self):
+        Genre.objects.bulk_create([Genre(title='Science Fiction')])
+        self.assertEqual(Genre.objects.values_list('title', 'slug').get(), ('science fiction', 'science-fiction'))
+
+    def test_lookups_are_case_insensitive(self):
+        self.assertEqual(Author.objects.get(name='AUTHOR NAME'), self.author)
+
+    def test_unique_title_validation_ignores_case(self):
+        Genre.objects.create(title='genre title')
+        response = self.client.post(reverse('genre-list'), {'title': 'Genre Title'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('title', response.data)
+
+
+class CatalogIndexesTestCase(APITestCase):
+
+    def test_catalog_queries_use_the_index_plan(self):
+        generate_catalog(books=200, authors=10, genres=5)
+        plans = {name: '\n'.join(line for plan in explain(run) for line in plan)
+                 for name, run in catalog_queries().items()}
+        self.assertIn('book_created_idx', plans['list, first page'])
+        self.assertNotIn('TEMP B-TREE', plans['list, first page'])
+        self.assertIn('book_author_created_idx', plans['author_books'])
+        self.assertIn('book_genres_genre_book_idx', plans['genre_books'])
+        self.assertIn('book_language_created_idx', plans['language filter'])
+
+    def test_explain_catalog_command(self):
+        out = StringIO()
+        call_command('explain_catalog', books=100, repeat=1, stdout=out)
+        self.assertIn('list, first page', out.getvalue())
+        self.assertIn('USE TEMP B-TREE FOR ORDER BY', out.getvalue())
+        self.assertFalse(Book.objects.exists())
+
+
+class BookFilterTestCase(APITestCase):
+
+    def setUp(self) -> None:
+        self.author = Author.objects.create(**author_data)
+        self.fantasy = Genre.objects.create(title='fantasy')
+        self.history = Genre.objects.create(title='history')
+        self.books = {}
+        for title, language, year, price, genres in (
+            ('first', 'English', 1999, '5.00', [self.fantasy]),
+            ('second', 'French', 2005, '15.00', [self.fantasy, self.history]),
+            ('third', 'English', None, '25.00', [self.history]),
+            ('fourth', 'german', 1999, '35.00', []),
+        ):
+            book = Book.objects.create(author=self.author, title=title, language=language,
+                                       published_year=year, price=price)
+            book.genres.set(genres)
+            self.books[title] = book
+        self.url = reverse('book-list')
+
+    def titles(self, params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [book['title'] for book in response.data['results']]
+
+    def test_filters(self):
+        self.assertEqual(set(self.titles({'language': 'english'})), {'first', 'third'})
+        self.assertEqual(set(self.titles({'language': 'French,GERMAN'})), {'second', 'fourth'})
+        self.assertEqual(set(self.titles({'published_year': 1999})), {'first', 'fourth'})
+        self.assertEqual(set(self.titles({'published_year_min': 2000})), {'second'})
+        self.assertEqual(set(self.titles({'price_min': 10, 'price_max': 30})), {'second', 'third'})
+
+    def test_genre_filters(self):
+        self.assertEqual(set(self.titles({'genre': 'fantasy,history'})), {'first', 'second', 'third'})
+        self.assertEqual(self.titles({'genre': ['fantasy', 'history'], 'genre_match': 'all'}), ['second'])
+        self.assertEqual(set(self.titles({'genre': 'fantasy', 'language': 'english'})), {'first'})
+
+    def test_invalid_params(self):
+        for params in ({'price_min': 'cheap'}, {'published_year_min': 2010, 'published_year_max': 2000},
+                       {'genre_match': 'some'}, {'ordering': 'description'}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    def test_ordering(self):
+        self.assertEqual(self.titles({'ordering': 'price'}), ['first', 'second', 'third', 'fourth'])
+        self.assertEqual(self.titles({'ordering': '-price'}), ['fourth', 'third', 'second', 'first'])
+
+    def test_ordering_keyset_pages_with_nulls(self):
+        for ordering in ('published_year', '-published_year'):
+            titles, params = [], {'ordering': ordering, 'page_size': 1}
+            url = self.url
+            while url:
+                response = self.client.get(url, params)
+                titles += [book['title'] for book in response.data['results']]
+                url, params = response.data['next'], None
+            self.assertEqual(len(titles), 4)
+            self.assertEqual(titles[-1], 'third', ordering)
+
+            back = []
+            url = response.data['previous']
+            while url:
+                response = self.client.get(url)
+                back = [book['title'] for book in response.data['results']] + back
+                url = response.data['previous']
+            self.assertEqual(back + ['third'], titles)
+
+    def test_author_books_filters(self):
+        url = reverse('author-books', kwargs={'slug': self.author.slug})
+        response = self.client.get(url, {'language': 'english', 'ordering': 'price'})
+        self.assertEqual([book['title'] for book in response.data['results']], ['first', 'third'])
+
+
+class SparseFieldsetTestCase(QueryBudgetMixin, APITestCase):
+
+    def setUp(self) -> None:
+        self.author = Author.objects.create(**author_data)
+        self.genre = Genre.objects.create(**genre_data)
+        self.book = Book.objects.create(author=self.author, **book_data)
+        self.book.genres.add(self.genre)
+
+    def test_list_is_compact(self):
+        response = self.client.get(reverse('book-list'))
+        book = response.data['results'][0]
+        self.assertNotIn('description', book)
+        self.assertNotIn('genres', book)
+        self.assertEqual(book['book_detail_url'], f'http://testserver/api/books/{self.book.slug}/')
+        detail = self.client.get(book['book_detail_url']).data
+        self.assertEqual(detail['description'], book_data['description'])
+        self.assertEqual(detail['genres'], [self.genre.id])
+
+    def test_fields(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('book-list'), {'fields': 'title,slug'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [{'title': 'book title', 'slug': 'book-title'}])
+        select = next(query['sql'] for query in context.captured_queries if 'LIMIT' in query['sql'])
+        self.assertNotIn('"cover"', select)
+        self.assertNotIn('books_author', select)
+
+    def test_omit(self):
+        response = self.client.get(reverse('book-detail', kwargs={'slug': self.book.slug}),
+                                   {'omit': 'book_detail_url,genres,pdf'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('book_detail_url', response.data)
+        self.assertNotIn('genres', response.data)
+        self.assertIn('description', response.data)
+
+    def test_genres_field_is_prefetched(self):
+        response = self.assertQueryBudget(
+            3, reverse('author-books', kwargs={'slug': self.author.slug}), data={'fields': 'title'})
+        self.assertEqual(response.data['results'], [{'title': 'book title'}])
+        response = self.client.get(reverse('book-detail', kwargs={'slug': self.book.slug}), {'fields': 'genres'})
+        self.assertEqual(response.data, {'genres': [self.genre.id]})
+
+    def test_unknown_field(self):
+        response = self.client.get(reverse('book-list'), {'fields': 'title,secret'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fields', response.data)
+
+    def test_authors_and_genres(self):
+        response = self.client.get(reverse('author-list'), {'fields': 'name'})
+        self.assertEqual(response.data['results'], [{'name': author_data['name']}])
+        response = self.client.get(reverse('genre-detail', kwargs={'slug': self.genre.slug}), {'omit': 'description'})
+        self.assertNotIn('description', response.data)
+        self.assertIn('genre_books_url', response.data)
+
+
+class FastListParityTestCase(APITestCase):
+    """
+    the values() fast path must render byte for byte what the serializers render
+    """
+
+    def setUp(self) -> None:
+        self.superuser = Account.objects.create_superuser(**superuser_data)
+        self.author = Author.objects.create(**author_data)
+        self.author2 = Author.objects.create(name='Ünïcode author')
+        genres = [Genre.objects.create(title=f'genre {i}', description=None if i else 'about') for i in range(3)]
+        for i in range(7):
+            book = Book.objects.create(
+                author=self.author if i % 2 else self.author2, title=f'book {i}', price=f'{i}.5',
+                description=None if i % 3 else f'about book {i}', published_year=None if i % 4 else 1990 + i)
+            book.genres.set(genres[:i % 4])
+        Book.objects.filter(title='book 1').update(cover='book_covers/with space.png', cover_digest='ab' * 20)
+        Book.objects.filter(title='book 2').update(cover='', pdf='pdfs/book 2.pdf')
+
+    def assertSameContent(self, url, params=None):
+        if params:
+            url = f'{url}?{urlencode(params)}'
+        fast = self.client.get(url)
+        slow = self.client.get(f'{url}{"&" if "?" in url else "?"}fast=0')
+        self.assertEqual(fast.status_code, status.HTTP_200_OK)
+        # the links of the slow response carry the extra param
+        self.assertEqual(fast.content, slow.content.replace(b'fast=0&', b'').replace(b'&fast=0', b''))
+        return fast
+
+    def test_lists(self):
+        for url in (reverse('book-list'), reverse('author-list'), reverse('genre-list'),
+                    reverse('author-books', kwargs={'slug': self.author.slug}),
+                    reverse('genre-books', kwargs={'slug': 'genre-1'})):
+            self.assertSameContent(url)
+
+    def test_sparse_fieldsets_ordering_and_pages(self):
+        url = reverse('book-list')
+        self.assertSameContent(url, {'fields': 'title,book_detail_url'})
+        self.assertSameContent(url, {'omit': 'cover,price'})
+        response = self.assertSameContent(url, {'ordering': 'published_year', 'page_size': 3})
+        self.assertSameContent(response.data['next'])
+        self.client.force_authenticate(user=self.superuser)
+        self.assertSameContent(url, {'page': 2, 'page_size': 3})
+
+    def test_detail_serializer(self):
+        request = Request(APIRequestFactory().get('/api/books/', {'format': 'json'}))
+        context = {'request': request, 'format': None}
+        queryset = book_read_queryset(Book.objects.order_by('id'))
+        serializer = BookSerializer(queryset, many=True, context=context)
+        representation = FastRepresentation(BookSerializer(context=context))
+        self.assertTrue(representation.supported)
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(representation.to_representation(representation.values(queryset))),
+                         renderer.render(serializer.data))
+
+    def test_unsupported_serializer(self):
+        class BookTitleSerializer(BookSerializer):
+            upper_title = SerializerMethodField()
+
+            def get_upper_title(self, book):
+                return book.title.upper()
+
+        request = Request(APIRequestFactory().get('/api/books/'))
+        self.assertFalse(FastRepresentation(BookTitleSerializer(context={'request': request})).supported)
+
+    def test_bench_serialization_command(self):
+        out, err = StringIO(), StringIO()
+        call_command('bench_serialization', books=50, repeat=1, stdout=out, stderr=err)
+        self.assertIn('BookListSerializer', out.getvalue())
+        self.assertEqual(err.getvalue(), '')
+
+
+class StreamingExportTestCase(APITestCase):
+
+    def setUp(self) -> None:
+        self.author = Author.objects.create(**author_data)
+        genre = Genre.objects.create(**genre_data)
+        for i in range(25):
+            book = Book.objects.create(author=self.author, title=f'book {i}', language='french' if i % 5 else 'english')
+            book.genres.add(genre)
+
+    def read_pages(self, url, params):
+        results = []
+        response = self.client.get(url, dict(params, page_size=100))
+        while True:
+            results += json.loads(response.content)['results']
+            if not response.data['next']:
+                return results
+            response = self.client.get(response.data['next'])
+
+    def test_ndjson(self):
+        response = self.client.get(reverse('book-list'), HTTP_ACCEPT='application/x-ndjson')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], self.read_pages(reverse('book-list'), {}))
+
+    def test_json_array(self):
+        response = self.client.get(reverse('book-list'), {'format': 'json-stream', 'language': 'english'})
+        self.assertTrue(response.streaming)
+        books = json.loads(b''.join(response.streaming_content))
+        pages = self.read_pages(reverse('book-list'), {'language': 'english'})
+        self.assertEqual([book['title'] for book in books], [book['title'] for book in pages])
+        self.assertEqual(len(books), 5)
+        # like every DRF hyperlink, the links keep the format override
+        self.assertTrue(books[0]['book_detail_url'].endswith('/?format=json-stream'))
+
+    def test_accept_header_and_serializer_path(self):
+        url = reverse('author-books', kwargs={'slug': self.author.slug})
+        response = self.client.get(url, {'fields': 'title'}, HTTP_ACCEPT='application/x-ndjson')
+        fast = b''.join(response.streaming_content)
+        self.assertEqual(len(fast.splitlines()), 25)
+        response = self.client.get(url, {'fields': 'title', 'fast': '0'}, HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(b''.join(response.streaming_content), fast)
+        # the json list of the same url isn't served from the ndjson request's cache entry
+        response = self.client.get(url, {'fields': 'title'})
+        self.assertEqual(len(response.data['results']), 20)
+
+    def test_chunks(self):
+        request = Request(APIRequestFactory().get('/api/books/'))
+        serializer = BookSerializer(context={'request': request})
+        queryset = book_read_queryset(Book.objects.order_by('id'))
+        with CaptureQueriesContext(connection) as context:
+            books = list(stream_representations(queryset, serializer, chunk_size=10))
+        self.assertEqual([book['title'] for book in books], [f'book {i}' for i in range(25)])
+        self.assertEqual(books[0]['genres'], [Genre.objects.get().id])
+        # the genres are prefetched once per chunk
+        self.assertEqual(sum('books_book_genres' in query['sql'] for query in context.captured_queries), 3)
+
+    def test_detail_is_not_streamed(self):
+        response = self.client.get(reverse('book-detail', kwargs={'slug': 'book-1'}), {'format': 'ndjson'})
+        self.assertFalse(response.streaming)
+        self.assertEqual(json.loads(response.content)['title'], 'book 1')
+
+
+class AsyncReadEndpointsTestCase(APITransactionTestCase):
+    # the async views read from pool threads with their own connections, the data must be committed
+
+    def setUp(self) -> None:
+        response_cache.cache.clear()
+        self.author = Author.objects.create(**author_data)
+        self.genre = Genre.objects.create(**genre_data)
+        for i in range(5):
+            book = Book.objects.create(author=self.author, title=f'book {i}')
+            book.genres.add(self.genre)
+
+    def urls(self):
+        slugs = {'author': self.author.slug, 'genre': self.genre.slug, 'book': 'book-1'}
+        return [
+            ('book-list', {}), ('book-detail', {'slug': slugs['book']}),
+            ('author-list', {}), ('author-detail', {'slug': slugs['author']}),
+            ('genre-list', {}), ('genre-detail', {'slug': slugs['genre']}),
+            ('author-books', {'slug': slugs['author']}), ('genre-books', {'slug': slugs['genre']}),
+        ]
+
+    async def test_same_output_as_sync_views(self):
+        for name, kwargs in self.urls():
+            with self.subTest(name):
+                response = await self.async_client.get(reverse(f'async-{name}', kwargs=kwargs), {'fields': 'slug'})
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                expected = await database_sync_to_async(self.client.get)(reverse(name, kwargs=kwargs),
+                                                                         {'fields': 'slug'})
+                self.assertEqual(response.content, expected.content)
+
+    async def test_errors_and_streams(self):
+        response = await self.async_client.get(reverse('async-book-detail', kwargs={'slug': 'missing'}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = await self.async_client.get(reverse('async-book-list'), {'ordering': 'author'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        # the async routes are read only
+        await database_sync_to_async(Account.objects.create_superuser)(**superuser_data)
+        token = (await database_sync_to_async(self.client.post)(reverse('token_obtain_pair'), superuser_data)).data
+        response = await self.async_client.post(reverse('async-author-list'), author_data2,
+                                                AUTHORIZATION='Bearer ' + token['access'])
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        # exports are left to the sync routes, a stream can't be read in the event loop
+        response = await self.async_client.get(reverse('async-book-list'), {'format': 'ndjson'})
+        self.assertEqual(response.status_code, status.HTTP_406_NOT_ACCEPTABLE)
+        self.assertFalse(response.streaming)
+        response = await self.async_client.get(reverse('async-book-list'), ACCEPT='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_406_NOT_ACCEPTABLE)
+        response = await self.async_client.get(reverse('async-book-list'), {'format': 'json-stream'})
+        self.assertEqual(response.status_code, status.HTTP_406_NOT_ACCEPTABLE)
+
+    def test_load_helpers(self):
+        paths = [reverse('book-list'), reverse('async-book-list'),
+                 reverse('async-author-books', kwargs={'slug': self.author.slug})]
+        for load, application in ((wsgi_load, get_wsgi_application()), (asgi_load, get_asgi_application())):
+            with self.subTest(load.__name__):
+                seconds, latencies, statuses = load(application, paths, 9, 3, host='testserver')
+                self.assertEqual(statuses, [status.HTTP_200_OK] * 9)
+                self.assertEqual(len(latencies), 9)
+
+
+@override_settings(THROTTLE_ENABLED=True, THROTTLE_RATES={'catalog': '2/min', 'search': '1/min'})
+class CatalogThrottlingTestCase(APITestCase):
+
+    def setUp(self) -> None:
+        get_store().clear()
+        self.superuser = Account.objects.create_superuser(**superuser_data)
+
+    def test_scopes(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get(reverse('book-list')).status_code, status.HTTP_200_OK)
+        # the viewsets share the catalog bucket, search has its own
+        response = self.client.get(reverse('genre-list'))
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(self.client.get(reverse('search'), {'q': 'book'}).status_code, status.HTTP_200_OK)
+        # an authenticated user isn't counted with the anonymous requests of its address
+        self.client.force_authenticate(self.superuser)
+        self.assertEqual(self.client.get(reverse('book-list')).status_code, status.HTTP_200_OK)
+
+
+def parse_metrics(text):
+    """
+    {'name{labels}': value} of a Prometheus text exposition
+    """
+    return {line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1])
+            for line in text.splitlines() if line and not line.startswith('#')}
+
+
+@override_settings(METRICS_SAMPLE_RATE=1)
+class RequestMetricsTestCase(APITestCase):
+
+    def setUp(self) -> None:
+        registry.reset()
+        response_cache.cache.clear()
+        author = Author.objects.create(**author_data)
+        for i in range(3):
+            Book.objects.create(author=author, title=f'book {i}')
+        self.superuser = Account.objects.create_superuser(**superuser_data)
+
+    def get_metrics(self):
+        self.client.force_authenticate(user=self.superuser)
+        response = self.client.get(reverse('metrics'))
+        self.client.force_authenticate(user=None)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        return parse_metrics(response.content.decode())
+
+    def test_sampled_routes(self):
+        responses = [self.client.get(reverse('book-list'), {'fast': '0'}) for _ in range(2)]
+        self.client.get(reverse('author-detail', kwargs={'slug': 'missing'}))
+        metrics = self.get_metrics()
+        route = '{route="book-list"}'
+        self.assertEqual(metrics['http_request_duration_seconds_count' + route], 2)
+        self.assertEqual(metrics['http_request_duration_seconds_bucket{route="book-list",le="+Inf"}'], 2)
+        self.assertEqual(metrics['http_requests_total{route="book-list",status="200"}'], 2)
+        self.assertEqual(metrics['http_requests_total{route="author-detail",status="404"}'], 1)
+        self.assertEqual(metrics['http_response_bytes_total' + route],
+                         sum(len(response.content) for response in responses))
+        self.assertEqual(metrics['sampled_requests_total' + route], 2)
+        # the second list is served from the response cache, without the count and page queries
+        self.assertGreaterEqual(metrics['db_queries_total' + route], 2)
+        self.assertGreater(metrics['db_query_duration_seconds_total' + route], 0)
+        self.assertGreater(metrics['serializer_duration_seconds_total' + route], 0)
+        self.assertEqual(metrics['response_cache_lookups_total{route="book-list",result="hit"}'], 1)
+        self.assertEqual(metrics['response_cache_lookups_total{route="book-list",result="miss"}'], 1)
+        self.assertIn('response_cache_requests_total{result="hit"}', metrics)
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_unsampled(self):
+        self.client.get(reverse('book-list'))
+        metrics = self.get_metrics()
+        self.assertEqual(metrics['http_requests_total{route="book-list",status="200"}'], 1)
+        self.assertEqual(metrics['sampled_requests_total{route="book-list"}'], 0)
+        self.assertEqual(metrics['db_queries_total{route="book-list"}'], 0)
+        self.assertEqual(metrics['serializer_duration_seconds_total{route="book-list"}'], 0)
+
+    def test_disabled_and_forbidden(self):
+        with override_settings(METRICS_ENABLED=False):
+            self.client.get(reverse('book-list'))
+        self.assertNotIn('http_requests_total{route="book-list",status="200"}', self.get_metrics())
+        # the loopback address is the client of every request behind a local proxy
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.force_authenticate(user=Account.objects.create_user(**staff_user_data))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_signed_up_account_forbidden(self):
+        # signup makes every account staff
+        account = {'username': 'newcomer', 'password': 'newcomer pass'}
+        response = self.client.post(reverse('account-create'), account)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        token = self.client.post(reverse('token_obtain_pair'), account).data['access']
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + token)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(METRICS_ALLOWED_IPS=['203.0.113.9'])
+    def test_allowed_address(self):
+        # the Accept header of a Prometheus scrape
+        accept = 'application/openmetrics-text;version=1.0.0,text/plain;version=0.0.4;q=0.5'
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.9', HTTP_ACCEPT=accept)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('# TYPE http_requests_total counter', response.content.decode())
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.10')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(METRICS_SAMPLE_RATE=1)
+class AsyncRequestMetricsTestCase(APITransactionTestCase):
+
+    def setUp(self) -> None:
+        registry.reset()
+        response_cache.cache.clear()
+        Author.objects.create(**author_data)
+
+    async def test_pool_thread_queries(self):
+        response = await self.async_client.get(reverse('async-author-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        metrics = registry.snapshot()['async-author-list']
+        self.assertEqual(metrics['statuses'], {200: 1})
+        self.assertGreater(metrics['queries'], 0)
+        self.assertGreater(metrics['serializer_seconds'], 0)
+
+
+class QueryGuardTestCase(QueryBudgetMixin, APITestCase):
+
+    def setUp(self) -> None:
+        response_cache.cache.clear()
+        self.author = Author.objects.create(**author_data)
+        for i in range(5):
+            Book.objects.create(author=self.author, title=f'book {i}')
+
+    def test_query_shape(self):
+        self.assertEqual(query_shape('SELECT "id" FROM "t" WHERE "id" IN (%s, %s, %s)\n LIMIT 21'),
+                         'SELECT "id" FROM "t" WHERE "id" IN (...) LIMIT N')
+
+    def test_budgets(self):
+        response = self.client.get(reverse('book-list'))
+        self.assertEqual(response['X-Query-Count'], '2')
+        with override_settings(QUERY_BUDGETS={'book-list': 1}):
+            with self.assertRaisesMessage(QueryBudgetExceeded, 'book-list ran 2 queries, budget is 1'):
+                self.client.get(reverse('book-list'), {'page_size': 2})
+            with override_settings(QUERY_GUARD_RAISE=False), self.assertLogs('core.queryguard', 'WARNING') as logs:
+                self.client.get(reverse('book-list'), {'page_size': 3})
+            self.assertEqual(logs.output, ['WARNING:core.queryguard:book-list ran 2 queries, budget is 1'])
+
+    def test_duplicates(self):
+        with self.assertRaisesMessage(AssertionError, '5 x SELECT'), self.assertMaxQueries(10, duplicates=3):
+            for book in Book.objects.all():
+                book.author.name
+        # search runs its ranked query once per model
+        with override_settings(QUERY_GUARD_DUPLICATES=3), self.assertLogs('core.queryguard', 'WARNING') as logs:
+            self.client.get(reverse('search'), {'q': 'book'})
+        self.assertIn('search ran the same query 3 times, first repeat at books/search.py:', logs.output[0])
+
+    @override_settings(SLOW_QUERY_MS=0)
+    def test_slow_query_log(self):
+        with self.assertLogs('core.queryguard.slow', 'WARNING') as logs:
+            self.client.get(reverse('author-detail', kwargs={'slug': self.author.slug}))
+        self.assertTrue(all(line.startswith('WARNING:core.queryguard.slow:author-detail ') for line in logs.output))
+        self.assertIn(' ms at core/conditional.py:', logs.output[0])
+
+
+class BenchSuiteTestCase(APITransactionTestCase):
+    # the load runs in other threads, the data must be committed
+
+    def test_scenarios(self):
+        generate_catalog(books=30, authors=3, genres=4, accounts=2)
+        self.assertEqual((Book.objects.count(), Author.objects.count(), Account.objects.count()), (30, 3, 2))
+        self.assertTrue(Account.objects.get(username='benchmark_user_1').check_password(BENCHMARK_PASSWORD))
+        search.rebuild_index()
+        superuser = Account.objects.create_superuser(**superuser_data)
+        application = get_wsgi_application()
+        for name, method, url, body, headers, share in bench_scenarios(superuser, Account.objects.first()):
+            with self.subTest(name):
+                seconds, latencies, statuses = wsgi_load(application, [url], 2, 2, host='testserver',
+                                                         method=method, body=body, headers=headers)
+                self.assertEqual(statuses, [status.HTTP_200_OK] * 2)
+
+    def test_latency_percentiles(self):
+        percentiles = latency_percentiles([float(ms) for ms in range(1, 101)])
+        self.assertEqual(percentiles, {'p50': 50.5, 'p95': 95.05, 'p99': 99.01})
+        self.assertEqual(latency_percentiles([3.0]), {'p50': 3.0, 'p95': 3.0, 'p99': 3.0})
+        self.assertGreater(peak_rss_mb(), 0)
+
+
+class SQLiteTuningTestCase(APITransactionTestCase):
+
+    def test_pragmas(self):
+        with connection.cursor() as cursor:
+            # the in-memory test database has no WAL, synchronous keeps its FULL default
+            for pragma, expected in (('synchronous', 2), ('busy_timeout', 5000), ('cache_size', -20000),
+                                     ('temp_store', 2)):
+                cursor.execute(f'PRAGMA {pragma}')
+                self.assertEqual(cursor.fetchone()[0], expected, pragma)
+
+    def test_journal_mode_only_when_configured(self):
+        with tempfile.TemporaryDirectory() as directory:
+            settings_dict = dict(connection.settings_dict, NAME=os.path.join(directory, 'db.sqlite3'))
+            wal_pragmas = {**settings.SQLITE_PRAGMAS, 'journal_mode': 'WAL'}
+            # synchronous=NORMAL only once the file is in WAL mode
+            for pragmas, journal_mode, synchronous in ((settings.SQLITE_PRAGMAS, 'delete', 2),
+                                                       (wal_pragmas, 'wal', 1)):
+                with self.subTest(journal_mode), override_settings(SQLITE_PRAGMAS=pragmas):
+                    wrapper = type(connections['default'])(settings_dict)
+                    try:
+                        with wrapper.cursor() as cursor:
+                            cursor.execute('PRAGMA journal_mode')
+                            self.assertEqual(cursor.fetchone()[0], journal_mode)
+                            cursor.execute('PRAGMA synchronous')
+                            self.assertEqual(cursor.fetchone()[0], synchronous)
+                    finally:
+                        wrapper.close()
+
+    def test_health_check(self):
+        wrapper = connections.create_connection('default')
+        wrapper.ensure_connection()
+        self.assertTrue(wrapper.settings_dict['CONN_HEALTH_CHECKS'])
+        self.assertTrue(is_usable(wrapper))
+        wrapper.connection.close()
+        self.assertFalse(is_usable(wrapper))
+        default = connections['default']
+        connections['default'] = wrapper
+        try:
+            check_connections()
+            self.assertIsNone(wrapper.connection)
+            self.assertEqual(self.client.get(reverse('genre-list')).status_code, status.HTTP_200_OK)
+            self.assertTrue(is_usable(wrapper))
+        finally:
+            connections['default'] = default
+
+    def test_write_load(self):
+        Book.objects.create(author=Author.objects.create(**author_data), title='book')
+        stop = threading.Event()
+        stop.set()
+        self.assertEqual(write_load(stop), [])
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            stop = threading.Event()
+            writes = executor.submit(write_load, stop, 1, 0.001)
+            time.sleep(0.05)
+            stop.set()
+            self.assertTrue(writes.result())
+        self.assertGreater(Book.objects.get().pages, 0)
@@ -1,6 +1,7 @@
-from django.urls import path
+from core.asynchronous import async_view
+from django.urls import include, path
 
-from .views import AuthorViewSet, GenreViewSet, BookViewSet
+from .views import AuthorViewSet, GenreViewSet, BookViewSet, SearchAPIView
 from rest_framework.routers import DefaultRouter
 
 router = DefaultRouter()
@@ -14,8 +15,29 @@ genre_books = BookViewSet.as_view({'get': 'genre_books'})
 urlpatterns = [
     path('author/<slug>/books/', author_books, name='author-books'),
     path('genre/<slug>/books/', genre_books, name='genre-books'),
+    path('search/', SearchAPIView.as_view(), name='search'),
 ]
 
+# the read endpoints as async views for ASGI deployments: /api/async/books/ ...
+async_urlpatterns = [
+    path('books/', async_view(BookViewSet, {'get': 'list'}, basename='book', detail=False),
+         name='async-book-list'),
+    path('books/<slug>/', async_view(BookViewSet, {'get': 'retrieve'}, basename='book', detail=True),
+         name='async-book-detail'),
+    path('authors/', async_view(AuthorViewSet, {'get': 'list'}, basename='author', detail=False),
+         name='async-author-list'),
+    path('authors/<slug>/', async_view(AuthorViewSet, {'get': 'retrieve'}, basename='author', detail=True),
+         name='async-author-detail'),
+    path('genres/', async_view(GenreViewSet, {'get': 'list'}, basename='genre', detail=False),
+         name='async-genre-list'),
+    path('genres/<slug>/', async_view(GenreViewSet, {'get': 'retrieve'}, basename='genre', detail=True),
+         name='async-genre-detail'),
+    path('author/<slug>/books/', async_view(BookViewSet, {'get': 'author_books'}), name='async-author-books'),
+    path('genre/<slug>/books/', async_view(BookViewSet, {'get': 'genre_books'}), name='async-genre-books'),
+]
+
+urlpatterns += [path('async/', include(async_urlpatterns))]
+
 urlpatterns += router.urls
 #
 # for url in urlpatterns:
@@ -1,47 +1,209 @@
+from core.cache import CachedResponseMixin, cache_response, invalidate_model
+from core.conditional import ConditionalGetMixin, conditional_response
+from core.downloads import serve_file
+from core.fastpath import FastListMixin
+from core.fieldsets import SparseFieldsetMixin
 from core.permissions import IsAdminOrReadOnly
-from rest_framework import filters
+from core.renderers import StreamingListMixin
+from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
-from rest_framework.status import HTTP_200_OK
+from rest_framework.status import HTTP_200_OK, HTTP_201_CREATED, HTTP_204_NO_CONTENT, HTTP_400_BAD_REQUEST
+from . import search, signals
+from .filters import BookFilter, BookOrderingFilter
 from .models import Author, Book, Genre
-from .serializers import AuthorSerializer, BookSerializer, GenreSerializer
+from .search import FullTextSearchFilter
+from .serializers import AuthorSerializer, BookBulkSerializer, BookListSerializer, BookSerializer, GenreSerializer
 
 
-class AuthorViewSet(ModelViewSet):
+def book_read_queryset(queryset, sources=None):
+    """
+    the author is joined for Book.__str__, genres are serialized as primary keys only
+    in id order. `sources` narrows the query to the model fields a serializer reads
+    """
+    genres = Prefetch('genres', queryset=Genre.objects.only('id').order_by('id'))
+    if sources is None:
+        return queryset.select_related('author').defer('author__description').prefetch_related(genres)
+    if 'genres' in sources:
+        queryset = queryset.prefetch_related(genres)
+    return queryset.only(*(sources - {'genres'}))
+
+
+class AuthorViewSet(SparseFieldsetMixin, ConditionalGetMixin, CachedResponseMixin, StreamingListMixin,
+                     FastListMixin, ModelViewSet):
     queryset = Author.objects.all()
     serializer_class = AuthorSerializer
     lookup_field = 'slug'
     permission_classes = [IsAdminOrReadOnly]
-    filter_backends = [filters.SearchFilter]
+    throttle_scope = 'catalog'
+    filter_backends = [FullTextSearchFilter]
     search_fields = ['name', ]
+    search_kind = 'author'
+    cache_dependencies = (Author,)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            queryset = self.narrow_queryset(queryset)
+        elif self.action == 'destroy':
+            # deleting only needs the primary key, the cascade loads the books itself
+            queryset = queryset.only('id', 'slug')
+        return queryset
 
 
-class GenreViewSet(ModelViewSet):
+class GenreViewSet(SparseFieldsetMixin, ConditionalGetMixin, CachedResponseMixin, StreamingListMixin,
+                    FastListMixin, ModelViewSet):
     queryset = Genre.objects.all()
     serializer_class = GenreSerializer
     lookup_field = 'slug'
     permission_classes = [IsAdminOrReadOnly]
-    filter_backends = [filters.SearchFilter]
+    throttle_scope = 'catalog'
+    filter_backends = [FullTextSearchFilter]
     search_fields = ['title', ]
+    search_kind = 'genre'
+    cache_dependencies = (Genre,)
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            queryset = self.narrow_queryset(queryset)
+        elif self.action == 'destroy':
+            queryset = queryset.only('id', 'slug')
+        return queryset
 
-class BookViewSet(ModelViewSet):
+
+class BookViewSet(SparseFieldsetMixin, ConditionalGetMixin, CachedResponseMixin, StreamingListMixin,
+                   FastListMixin, ModelViewSet):
     queryset = Book.objects.all()
     serializer_class = BookSerializer
     lookup_field = 'slug'
     permission_classes = [IsAdminOrReadOnly]
-    filter_backends = [filters.SearchFilter]
+    throttle_scope = 'catalog'
+    filter_backends = [FullTextSearchFilter, BookFilter, BookOrderingFilter]
     search_fields = ['title', ]
+    search_kind = 'book'
+    # actions that serialize books, the lists use the compact representation
+    read_actions = ('list', 'retrieve', 'author_books', 'genre_books')
+    list_actions = ('list', 'author_books', 'genre_books')
+    pagination_ordering = ('-created', '-id')
+    ordering_fields = ('created', 'price', 'published_year', 'pages', 'title')
+    cache_dependencies = (Book,)
+    bulk_max_items = 1000
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in self.read_actions:
+            queryset = book_read_queryset(queryset, self.get_serializer_sources())
+        elif self.action == 'destroy':
+            queryset = queryset.only('id', 'slug')
+        elif self.action in ('download', 'cover'):
+            queryset = queryset.only('id', 'slug', 'pdf', 'cover')
+
+        if self.action == 'author_books':
+            queryset = queryset.filter(author__slug=self.kwargs['slug'])
+        elif self.action == 'genre_books':
+            # a subquery on the through table can't return a book twice like a join would
+            book_ids = Book.genres.through.objects.filter(genre__slug=self.kwargs['slug']).values('book_id')
+            queryset = queryset.filter(id__in=book_ids)
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action in self.list_actions:
+            return BookListSerializer
+        return super().get_serializer_class()
 
     @action(detail=False)
+    @conditional_response
+    @cache_response(Book, Author)
     def author_books(self, request, slug):
-        books = self.get_queryset().filter(author__slug=slug)
-        serializer = BookSerializer(books, many=True, context={'request': request})
-        return Response(serializer.data, status=HTTP_200_OK)
+        return self.list_response(self.filter_queryset(self.get_queryset()))
 
     @action(detail=False)
+    @conditional_response
+    @cache_response(Book, Genre)
     def genre_books(self, request, slug):
-        books = self.get_queryset().filter(genres__slug=slug)
+        return self.list_response(self.filter_queryset(self.get_queryset()))
+
+    @action(detail=False, methods=['post', 'patch', 'delete'])
+    @transaction.atomic
+    def bulk(self, request):
+        """
+        POST a list of books, PATCH a list of partial books with their slug,
+        DELETE {"slugs": [...]}. all or nothing, errors are reported per item
+        """
+        if request.method == 'DELETE':
+            return self.bulk_delete(request)
+
+        if not isinstance(request.data, list) or len(request.data) > self.bulk_max_items:
+            return Response({'detail': f'Expected a list of at most {self.bulk_max_items} items.'},
+                            status=HTTP_400_BAD_REQUEST)
+        partial = request.method == 'PATCH'
+        serializer = BookBulkSerializer(Book.objects.all() if partial else None, data=request.data, many=True,
+                                        partial=partial, context={'request': request})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=HTTP_400_BAD_REQUEST)
+        books = serializer.save()
+
+        book_ids = [book.id for book in books]
+        search.index_books(book_ids)
+        invalidate_model(Book)
+        books = book_read_queryset(Book.objects.filter(id__in=book_ids)).order_by('id')
         serializer = BookSerializer(books, many=True, context={'request': request})
-        return Response(serializer.data, status=HTTP_200_OK)
+        return Response(serializer.data, status=HTTP_200_OK if partial else HTTP_201_CREATED)
+
+    def bulk_delete(self, request):
+        slugs = request.data.get('slugs') if isinstance(request.data, dict) else None
+        if not isinstance(slugs, list) or len(slugs) > self.bulk_max_items:
+            return Response({'slugs': [f'Expected a list of at most {self.bulk_max_items} slugs.']},
+                            status=HTTP_400_BAD_REQUEST)
+        found = dict(Book.objects.filter(slug__in=slugs).values_list('slug', 'id'))
+        errors = [{} if slug in found else {'slug': [f'No book with slug "{slug}".']} for slug in slugs]
+        if any(errors):
+            return Response(errors, status=HTTP_400_BAD_REQUEST)
+        # the search rows and the cached responses go once, not per deleted book
+        with signals.bulk_delete():
+            Book.objects.filter(id__in=found.values()).delete()
+        search.remove('book', list(found.values()))
+        invalidate_model(Book)
+        return Response(status=HTTP_204_NO_CONTENT)
+
+    @action(detail=True)
+    def download(self, request, slug):
+        return serve_file(request, self.get_object().pdf, as_attachment=True)
+
+    @action(detail=True)
+    def cover(self, request, slug):
+        return serve_file(request, self.get_object().cover)
+
+
+class SearchAPIView(APIView):
+    """
+    ranked search over books, authors and genres: /api/search/?q=...&limit=10
+    """
+    permission_classes = [IsAdminOrReadOnly]
+    throttle_scope = 'search'
+    default_limit = 10
+    max_limit = 50
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params.get('limit', self.default_limit))
+        except ValueError:
+            return self.default_limit
+        return max(1, min(limit, self.max_limit))
+
+    def get(self, request):
+        text = request.query_params.get('q', '')[:200]
+        limit = self.get_limit(request)
+        context = {'request': request}
+        books = search.ranked(book_read_queryset(Book.objects.all()), 'book', text, limit, 'title')
+        authors = search.ranked(Author.objects.all(), 'author', text, limit, 'name')
+        genres = search.ranked(Genre.objects.all(), 'genre', text, limit, 'title')
+        return Response({
+            'books': BookSerializer(books, many=True, context=context).data,
+            'authors': AuthorSerializer(authors, many=True, context=context).data,
+            'genres': GenreSerializer(genres, many=True, context=context).data,
+        }, status=HTTP_200_OK)
@@ -0,0 +1,69 @@
+"""
+async views for read endpoints served under ASGI. django 4.0 has no async ORM,
+the database work of a request runs in the executor's thread pool instead of
+the single thread every sync view shares under ASGI, so reads run side by side
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.negotiation import DefaultContentNegotiation
+
+from core.db import check_connections
+from core.metrics import sample_queries
+from core.queryguard import record_queries
+from core.renderers import StreamingRenderer
+
+
+def database_sync_to_async(func):
+    """
+    `func` made awaitable, run in a pool thread. the thread's connections are
+    cleaned up like at the start and end of a request, its queries counted
+    in the request metrics and query guard
+    """
+    def run(*args, **kwargs):
+        close_old_connections()
+        check_connections()
+        try:
+            with sample_queries(), record_queries():
+                return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+class NoStreamingNegotiation(DefaultContentNegotiation):
+    """
+    refuses the streaming renderers with 406. a streamed export reads the database
+    while it's sent, which can't happen in the event loop, and reading it whole in
+    the pool thread would hold the entire list in memory
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        renderer, media_type = super().select_renderer(request, renderers, format_suffix)
+        if isinstance(renderer, StreamingRenderer):
+            raise NotAcceptable('Exports are streamed by the sync routes only, the same path without /async.')
+        return renderer, media_type
+
+
+def render_response(view, request, *args, **kwargs):
+    response = view(request, *args, **kwargs)
+    if callable(getattr(response, 'render', None)):
+        response.render()
+    return response
+
+
+def async_view(viewset_class, actions, **initkwargs):
+    """
+    async view of the `actions` ({'get': 'list'}) of a viewset, with the same
+    authentication, permissions, filters, caching and output as the sync view,
+    exports excepted. only meant for safe methods: a write would run outside the request's thread
+    """
+    view = viewset_class.as_view(actions, content_negotiation_class=NoStreamingNegotiation, **initkwargs)
+    render = database_sync_to_async(render_response)
+
+    @wraps(view)
+    async def async_handler(request, *args, **kwargs):
+        return await render(view, request, *args, **kwargs)
+    return async_handler
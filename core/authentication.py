@@ -0,0 +1,122 @@
+"""
+JWT authentication trusting the signed claims of the access token: a request is
+authenticated without loading its account. the claims are added when a token is
+issued, object level permissions load the account with get_account(). revoked
+tokens are rejected from accounts.revocation's in-process copy
+"""
+from collections import OrderedDict
+from threading import Lock
+
+from accounts.revocation import revocations
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTTokenUserAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.models import TokenUser as BaseTokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import aware_utcnow
+
+# account fields copied into the tokens, what the permissions and views read.
+# changing one revokes the tokens of the account, see accounts.signals
+ACCOUNT_CLAIMS = ('username', 'is_staff', 'is_superuser')
+
+
+def add_account_claims(token, user):
+    for claim in ACCOUNT_CLAIMS:
+        token[claim] = getattr(user, claim)
+    # to the microsecond, a token issued right after a revocation stays valid
+    token['iat'] = token.current_time.timestamp()
+    return token
+
+
+class TokenUser(BaseTokenUser):
+    """
+    user backed by the claims of a validated token, TOKEN_USER_CLASS of SIMPLE_JWT
+    """
+
+    @cached_property
+    def account(self):
+        # the claims are as old as the token, the row is read when that matters
+        return get_user_model().objects.filter(**{api_settings.USER_ID_FIELD: self.id}, is_active=True).first()
+
+
+def get_account(user, obj=None):
+    """
+    the active account row of an authenticated user, None when it's gone or
+    inactive. `obj` is used instead of a query when it's that account
+    """
+    if not isinstance(user, TokenUser):
+        return user
+    if 'account' not in user.__dict__ and isinstance(obj, get_user_model()) \
+            and getattr(obj, api_settings.USER_ID_FIELD) == user.id:
+        user.account = obj if obj.is_active else None
+    return user.account
+
+
+class VerifiedTokenCache:
+    """
+    validated tokens by their encoded form, the least recently used are dropped
+    past `max_size`. only the signature check is skipped, expiry is checked on every use
+    """
+
+    def __init__(self, max_size=None):
+        self._max_size = max_size
+        self._tokens = OrderedDict()
+        self._lock = Lock()
+
+    @property
+    def max_size(self):
+        return self._max_size or getattr(settings, 'JWT_VERIFIED_TOKEN_CACHE_SIZE', 4096)
+
+    def get(self, raw_token):
+        with self._lock:
+            token = self._tokens.get(raw_token)
+            if token is not None:
+                self._tokens.move_to_end(raw_token)
+            return token
+
+    def set(self, raw_token, token):
+        with self._lock:
+            self._tokens[raw_token] = token
+            self._tokens.move_to_end(raw_token)
+            while len(self._tokens) > self.max_size:
+                self._tokens.popitem(last=False)
+
+    def discard(self, raw_token):
+        with self._lock:
+            self._tokens.pop(raw_token, None)
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+
+    def __len__(self):
+        return len(self._tokens)
+
+
+verified_tokens = VerifiedTokenCache()
+
+
+class JWTClaimsAuthentication(JWTTokenUserAuthentication):
+    """
+    JWTAuthentication without the account query: request.user is a TokenUser
+    built from the token's claims
+    """
+    token_cache = verified_tokens
+
+    def get_validated_token(self, raw_token):
+        token = self.token_cache.get(raw_token)
+        if token is None:
+            token = super().get_validated_token(raw_token)
+            self.token_cache.set(raw_token, token)
+        else:
+            try:
+                token.check_exp(current_time=aware_utcnow())
+            except TokenError as error:
+                self.token_cache.discard(raw_token)
+                raise InvalidToken({'detail': error.args[0]})
+        if revocations.is_revoked(token):
+            self.token_cache.discard(raw_token)
+            raise InvalidToken({'detail': 'Token is revoked'})
+        return token
@@ -0,0 +1,158 @@
+import hashlib
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+from core.metrics import record_cache_lookup
+
+
+class ResponseCache:
+    """
+    caches serialized response data of read only endpoints.
+    every model has a generation number that is part of the cache key,
+    a write bumps the generation so stale entries are never read again
+    and age out of the LRU backend on their own
+    """
+
+    def __init__(self, alias=None):
+        self._alias = alias
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache(self):
+        return caches[self._alias or getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+    @staticmethod
+    def generation_key(model):
+        return f'generation:{model._meta.label_lower}'
+
+    def get_generations(self, models):
+        keys = [self.generation_key(model) for model in models]
+        generations = self.cache.get_many(keys)
+        for key in keys:
+            if key not in generations:
+                # a fresh number, never one that was used before the key got evicted
+                self.cache.add(key, time.time_ns(), None)
+                generations[key] = self.cache.get(key)
+        return [generations[key] for key in keys]
+
+    def make_key(self, request, models):
+        generations = ':'.join(str(generation) for generation in self.get_generations(models))
+        # hyperlinks are absolute, the scheme and host are part of the payload
+        url = f'{request.scheme}://{request.get_host()}{request.get_full_path()}'
+        # superusers may get a different representation, like numbered pages
+        role = 'superuser' if request.user.is_superuser else 'user'
+        # the same url may be negotiated to another renderer through the Accept header
+        renderer = getattr(request, 'accepted_renderer', None)
+        media_type = renderer.media_type if renderer is not None else ''
+        digest = hashlib.md5(f'{generations}|{role}|{media_type}|{url}'.encode()).hexdigest()
+        return f'response:{digest}'
+
+    def get(self, key):
+        cached = self.cache.get(key)
+        with self._lock:
+            if cached is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        record_cache_lookup(hit=cached is not None)
+        return cached
+
+    def set(self, key, data):
+        self.cache.set(key, plain_data(data))
+
+    def invalidate(self, model):
+        self.cache.set(self.generation_key(model), time.time_ns(), None)
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else 0.0,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+
+response_cache = ResponseCache()
+
+
+def plain_data(data):
+    """
+    serializer output with builtins only. a DRF Hyperlink pickles str() of the
+    object it links to, which can cost a query per row
+    """
+    if isinstance(data, dict):
+        return {key: plain_data(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [plain_data(value) for value in data]
+    if isinstance(data, str):
+        return str(data)
+    return data
+
+
+def invalidate_model(model):
+    """
+    bump the model generation now and again once the transaction commits,
+    so a read racing the write can't cache the old rows under the new generation
+    """
+    response_cache.invalidate(model)
+    transaction.on_commit(lambda: response_cache.invalidate(model))
+
+
+def cache_response(*models):
+    """
+    cache GET responses of a view method, keyed on the generations of `models`
+    (the view `cache_dependencies` by default)
+    """
+
+    def decorator(view_method):
+
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method != 'GET':
+                return view_method(self, request, *args, **kwargs)
+
+            key = response_cache.make_key(request, models or self.cache_dependencies)
+            data = response_cache.get(key)
+            if data is not None:
+                response = Response(data)
+                response['X-Cache'] = 'HIT'
+                return response
+
+            response = view_method(self, request, *args, **kwargs)
+            if isinstance(response, Response) and response.status_code == 200:
+                response_cache.set(key, response.data)
+                response['X-Cache'] = 'MISS'
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+class CachedResponseMixin:
+    """
+    cache list and retrieve of a viewset, `cache_dependencies` lists the
+    models whose writes change the output
+    """
+    cache_dependencies = ()
+
+    @cache_response()
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_response()
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
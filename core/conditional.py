@@ -0,0 +1,79 @@
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def get_validators(request, queryset):
+    """
+    ETag and Last-Modified of a queryset representation from one aggregate
+    query, the max `updated` changes on every write and the count on deletes
+    """
+    aggregate = queryset.select_related(None).prefetch_related(None).order_by().aggregate(
+        last_modified=Max('updated'), count=Count('pk'))
+    last_modified = aggregate['last_modified']
+    # the representation also depends on the url, the media type and the role
+    parts = (
+        last_modified.isoformat() if last_modified else '',
+        aggregate['count'],
+        request.build_absolute_uri(),
+        request.accepted_renderer.media_type,
+        request.user.is_superuser,
+    )
+    etag = quote_etag(hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest())
+    return etag, last_modified, aggregate['count']
+
+
+def conditional_response(view_method):
+    """
+    answer GET and HEAD with 304 Not Modified when the client validators match,
+    without running the view. the view provides `get_validator_queryset()`
+    """
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view_method(self, request, *args, **kwargs)
+
+        etag, last_modified, count = get_validators(request, self.get_validator_queryset())
+        if self.detail and not count:
+            # let the view answer with its 404
+            return view_method(self, request, *args, **kwargs)
+
+        # deleting a row of a list leaves its max `updated` as it was, so
+        # If-Modified-Since can't tell, lists are validated by their ETag only
+        timestamp = int(last_modified.timestamp()) if last_modified and self.detail else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = view_method(self, request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    return wrapper
+
+
+class ConditionalGetMixin:
+    """
+    ETag validators for list and retrieve of a viewset, Last-Modified for retrieve
+    only. the model needs an `updated` auto timestamp
+    """
+
+    def get_validator_queryset(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.detail:
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        return queryset
+
+    @conditional_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
@@ -0,0 +1,61 @@
+"""
+SQLite tuning. every new connection gets SQLITE_PRAGMAS: mmap and a larger page
+cache save reads. the journal mode is kept in the database file, WAL (readers
+run while a write is in flight) is set only when SQLITE_PRAGMAS asks for it.
+synchronous is applied in WAL mode only, NORMAL syncs at checkpoints there but
+can corrupt a rollback journal database on power loss. persistent
+connections (CONN_MAX_AGE) are checked at the start of a request when the
+database sets CONN_HEALTH_CHECKS, like django 4.1 does, and reopened when broken
+"""
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import DatabaseError, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def set_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    # on the driver connection, connection setup isn't a query of the request
+    pragmas = dict(getattr(settings, 'SQLITE_PRAGMAS', {}))
+    if 'journal_mode' in pragmas:
+        connection.connection.execute(f'PRAGMA journal_mode = {pragmas.pop("journal_mode")}')
+    if connection.connection.execute('PRAGMA journal_mode').fetchone()[0] != 'wal':
+        pragmas.pop('synchronous', None)
+    for name, value in pragmas.items():
+        connection.connection.execute(f'PRAGMA {name} = {value}')
+
+
+def is_usable(connection):
+    """
+    the SQLite backend takes every connection as usable, a query tells
+    """
+    if connection.vendor != 'sqlite':
+        return connection.is_usable()
+    try:
+        connection.connection.execute('SELECT 1')
+    except Exception:
+        return False
+    return True
+
+
+@receiver(request_started)
+def check_connections(**kwargs):
+    """
+    closes the open connections of this thread that fail the health check,
+    the next query opens a new one. a connection in a transaction is left alone
+    """
+    for connection in connections.all():
+        if (connection.connection is None or connection.in_atomic_block
+                or not connection.settings_dict.get('CONN_HEALTH_CHECKS')):
+            continue
+        if not is_usable(connection):
+            try:
+                connection.close()
+            except DatabaseError:
+                pass
+            # the SQLite backend ignores closing an in-memory database
+            connection.connection = None
+
@@ -0,0 +1,132 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """
+    file wrapper that reads at most `length` bytes from `start`
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    (start, end) of a single `bytes=start-end` range, inclusive.
+    None when the header should be ignored (missing, malformed or multiple ranges),
+    raises ValueError when it can't be satisfied
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # suffix range, the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError('empty suffix range')
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError('range out of bounds')
+    return start, end
+
+
+def if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == int(last_modified)
+
+
+def offload_response(field_file, content_type, filename, as_attachment):
+    """
+    let the front web server send the file, nginx X-Accel-Redirect or apache/lighttpd X-Sendfile
+    """
+    response = HttpResponse(content_type=content_type)
+    if settings.MEDIA_DOWNLOAD_OFFLOAD == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + field_file.name
+    else:
+        response['X-Sendfile'] = field_file.path
+    disposition = 'attachment' if as_attachment else 'inline'
+    response['Content-Disposition'] = f'{disposition}; filename="{filename}"'
+    return response
+
+
+def serve_file(request, field_file, as_attachment=False):
+    """
+    stream a FileField in chunks with Range/If-Range support for resumable downloads,
+    memory use doesn't depend on the file size
+    """
+    if not field_file:
+        raise Http404('No file.')
+    storage, name = field_file.storage, field_file.name
+    if not storage.exists(name):
+        raise Http404('No file.')
+
+    filename = os.path.basename(name)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    if settings.MEDIA_DOWNLOAD_OFFLOAD:
+        return offload_response(field_file, content_type, filename, as_attachment)
+
+    size = storage.size(name)
+    last_modified = storage.get_modified_time(name).timestamp()
+    etag = quote_etag(f'{size:x}-{int(last_modified * 1000000):x}')
+    response = get_conditional_response(request, etag=etag, last_modified=int(last_modified))
+    if response is not None:
+        return response
+
+    try:
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if byte_range is not None and not if_range_matches(request, etag, last_modified):
+        byte_range = None
+
+    file = storage.open(name, 'rb')
+    if byte_range is None:
+        response = FileResponse(RangeFile(file, 0, size), as_attachment=as_attachment, filename=filename)
+        response['Content-Length'] = size
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(
+            RangeFile(file, start, length), status=206, as_attachment=as_attachment, filename=filename)
+        response['Content-Length'] = length
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    response['Content-Type'] = content_type
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
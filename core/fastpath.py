@@ -0,0 +1,191 @@
+"""
+read only fast path for list endpoints: the representation of a serializer built
+from values() rows instead of model instances, with the same output
+"""
+from types import SimpleNamespace
+from urllib.parse import quote
+
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.utils.http import RFC3986_SUBDELIMS
+from rest_framework.fields import FileField
+from rest_framework.relations import HyperlinkedIdentityField, ManyRelatedField, PrimaryKeyRelatedField
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from core.metrics import measure_serializer
+
+# stand in for the lookup value while reversing the url template once,
+# the digits for url patterns that only take numbers
+URL_PLACEHOLDERS = ('fastpathlookupvalue', '9876543210123456789')
+# what django's reverse() leaves unquoted in a path
+URL_SAFE = RFC3986_SUBDELIMS + '/~:@'
+
+
+class FastRepresentation:
+    """
+    plans how to build every field of a (child) serializer from a values() row.
+    fields it can't plan for, like method fields or nested serializers, leave
+    `supported` False and the caller keeps the serializer
+    """
+
+    def __init__(self, serializer):
+        self.serializer = serializer
+        self.model = serializer.Meta.model
+        self.columns = {self.model._meta.pk.name}
+        self.many_related = {}
+        self.plan = []
+        self.supported = all(self.plan_field(field) for field in serializer._readable_fields)
+
+    def get_model_field(self, source):
+        if '.' in source or source == '*':
+            return None
+        try:
+            return self.model._meta.get_field(source)
+        except FieldDoesNotExist:
+            return None
+
+    def plan_field(self, field):
+        name = field.field_name
+        if isinstance(field, HyperlinkedIdentityField):
+            get_url = self.identity_url(field)
+            if get_url is None:
+                return False
+            self.columns.add(field.lookup_field)
+            self.plan.append((name, get_url))
+            return True
+
+        model_field = self.get_model_field(field.source)
+        if model_field is None:
+            return False
+        if isinstance(field, ManyRelatedField):
+            child = field.child_relation
+            if not model_field.many_to_many or not isinstance(child, PrimaryKeyRelatedField) or child.pk_field:
+                return False
+            self.many_related[name] = model_field
+            self.plan.append((name, lambda row, name=name: row[name]))
+            return True
+        if model_field.is_relation:
+            if not model_field.many_to_one or not isinstance(field, PrimaryKeyRelatedField) or field.pk_field:
+                return False
+            # the foreign key column is the primary key the field would show
+            self.columns.add(field.source)
+            self.plan.append((name, lambda row, source=field.source: row[source]))
+            return True
+        if not model_field.concrete:
+            return False
+
+        self.columns.add(field.source)
+        if isinstance(field, FileField):
+            self.plan.append((name, self.file_url(field, model_field)))
+        else:
+            self.plan.append((name, self.value(field)))
+        return True
+
+    @staticmethod
+    def value(field):
+        source, to_representation = field.source, field.to_representation
+
+        def get(row):
+            value = row[source]
+            return None if value is None else to_representation(value)
+        return get
+
+    @staticmethod
+    def identity_url(field):
+        # reverse once, every row only fills in its quoted lookup value
+        lookup = field.lookup_field
+        for placeholder in URL_PLACEHOLDERS:
+            try:
+                template = field.to_representation(SimpleNamespace(**{lookup: placeholder}))
+            except ImproperlyConfigured:
+                continue
+            if template is None:
+                return lambda row: None
+            template = str(template)
+            return lambda row: template.replace(placeholder, quote(str(row[lookup]), safe=URL_SAFE))
+        return None
+
+    @staticmethod
+    def file_url(field, model_field):
+        # FileField.to_representation on the stored name, urls of shared files are built once
+        request = field.context.get('request')
+        storage, source, urls = model_field.storage, field.source, {}
+        use_url = getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL)
+
+        def get(row):
+            name = row[source]
+            if not name:
+                return None
+            if not use_url:
+                return name
+            if name not in urls:
+                url = storage.url(name)
+                urls[name] = request.build_absolute_uri(url) if request is not None else url
+            return urls[name]
+        return get
+
+    def values(self, queryset, *extra):
+        """
+        the rows of `queryset` with the planned columns and `extra` ones,
+        like the ordering fields the paginator needs
+        """
+        columns = sorted(self.columns | {name.lstrip('-') for name in extra})
+        return queryset.prefetch_related(None).values(*columns)
+
+    def add_many_related(self, rows):
+        pk_name = self.model._meta.pk.name
+        ids = [row[pk_name] for row in rows]
+        for name, model_field in self.many_related.items():
+            through = model_field.remote_field.through
+            source = through._meta.get_field(model_field.m2m_field_name()).attname
+            target = through._meta.get_field(model_field.m2m_reverse_field_name()).attname
+            related = {}
+            for row_id, target_id in (through.objects.filter(**{f'{source}__in': ids})
+                                      .order_by(target).values_list(source, target)):
+                related.setdefault(row_id, []).append(target_id)
+            for row in rows:
+                row[name] = related.get(row[pk_name], [])
+
+    def to_representation(self, rows):
+        rows = list(rows)
+        if self.many_related:
+            self.add_many_related(rows)
+        plan = self.plan
+        with measure_serializer():
+            return [{name: get(row) for name, get in plan} for row in rows]
+
+
+class FastListMixin:
+    """
+    list actions of a viewset answered from values() rows when the serializer
+    allows it, with the same output as the serializer. `fast_list = False` or
+    ?fast=0 turns it off
+    """
+    fast_list = True
+
+    def get_fast_representation(self):
+        if not self.fast_list or self.request.query_params.get('fast') == '0':
+            return None
+        representation = FastRepresentation(self.get_serializer())
+        return representation if representation.supported else None
+
+    def get_ordering_columns(self):
+        # keyset pagination reads the ordering fields from the rows
+        return [*getattr(self, 'pagination_ordering', ()), *getattr(self, 'ordering_fields', ())]
+
+    def list_response(self, queryset):
+        representation = self.get_fast_representation()
+        if representation is None:
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                return self.get_paginated_response(self.get_serializer(page, many=True).data)
+            return Response(self.get_serializer(queryset, many=True).data)
+
+        rows = representation.values(queryset, *self.get_ordering_columns())
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(representation.to_representation(page))
+        return Response(representation.to_representation(rows))
+
+    def list(self, request, *args, **kwargs):
+        return self.list_response(self.filter_queryset(self.get_queryset()))
@@ -0,0 +1,111 @@
+"""
+model fields that normalize their own values, so bulk_create, bulk_update,
+QuerySet.update() and lookups see the same values as Model.save()
+"""
+from django.db import models
+from django.db.models.signals import post_init
+from django.utils.text import slugify
+
+
+class LowerCaseMixin:
+    """
+    stores strings lowercased, None stays None
+    """
+
+    def pre_save(self, model_instance, add):
+        value = getattr(model_instance, self.attname)
+        if isinstance(value, str) and not value.islower():
+            value = value.lower()
+            setattr(model_instance, self.attname, value)
+        return value
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        return value.lower() if isinstance(value, str) else value
+
+
+class LowerCaseCharField(LowerCaseMixin, models.CharField):
+    pass
+
+
+class LowerCaseTextField(LowerCaseMixin, models.TextField):
+    pass
+
+
+class LowerCaseEmailField(LowerCaseMixin, models.EmailField):
+    pass
+
+
+class AutoSlugField(models.SlugField):
+    """
+    slug of the `populate_from` field, recomputed on save only when that field
+    changed since the instance was loaded or last saved
+    """
+
+    def __init__(self, *args, populate_from, **kwargs):
+        self.populate_from = populate_from
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['populate_from'] = self.populate_from
+        return name, path, args, kwargs
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        super().contribute_to_class(cls, name, **kwargs)
+        if not cls._meta.abstract:
+            post_init.connect(self.remember_source, sender=cls, weak=False)
+
+    @property
+    def source_cache_name(self):
+        return f'_{self.attname}_source'
+
+    def remember_source(self, instance, **kwargs):
+        # deferred sources aren't in __dict__, the slug is then recomputed on save
+        instance.__dict__[self.source_cache_name] = instance.__dict__.get(self.populate_from)
+
+    def slugify(self, value):
+        return slugify(str(value)) if value is not None else ''
+
+    def pre_save(self, model_instance, add):
+        source = getattr(model_instance, self.populate_from)
+        slug = getattr(model_instance, self.attname)
+        if not slug or model_instance.__dict__.get(self.source_cache_name) != source:
+            slug = self.slugify(source)
+            setattr(model_instance, self.attname, slug)
+        model_instance.__dict__[self.source_cache_name] = source
+        return slug
+
+
+class NormalizedQuerySet(models.QuerySet):
+    """
+    keeps AutoSlugFields in step with their source in update() and bulk_update(),
+    which don't call pre_save()
+    """
+
+    def slug_fields(self):
+        return [field for field in self.model._meta.concrete_fields if isinstance(field, AutoSlugField)]
+
+    def update(self, **kwargs):
+        for field in self.slug_fields():
+            value = kwargs.get(field.populate_from)
+            # expressions can't be slugified in Python
+            if field.populate_from in kwargs and field.name not in kwargs and isinstance(value, str):
+                kwargs[field.name] = field.slugify(value)
+        return super().update(**kwargs)
+
+    update.alters_data = True
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        objs, fields = tuple(objs), list(fields)
+        for field in self.slug_fields():
+            if field.populate_from in fields and field.name not in fields:
+                fields.append(field.name)
+        # normalize the instances too, not only the stored values
+        for field in self.model._meta.concrete_fields:
+            if field.name in fields and isinstance(field, (LowerCaseMixin, AutoSlugField)):
+                for obj in objs:
+                    field.pre_save(obj, add=False)
+        return super().bulk_update(objs, fields, batch_size=batch_size)
+
+    bulk_update.alters_data = True
@@ -0,0 +1,81 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.utils.functional import cached_property
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+
+class SparseFieldsSerializerMixin:
+    """
+    serializer taking a `fields` argument, the names of the fields to keep
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class SparseFieldsetMixin:
+    """
+    ?fields=a,b or ?omit=a,b on the reads of a viewset. the serializer only
+    builds the kept fields and narrow_queryset() only loads the columns they read
+    """
+    fields_param = 'fields'
+    omit_param = 'omit'
+
+    def get_param_names(self, param):
+        value = self.request.query_params.get(param, '')
+        return [name.strip() for name in value.split(',') if name.strip()]
+
+    @cached_property
+    def sparse_fields(self):
+        """
+        names of the fields to serialize, None for all of them
+        """
+        if self.request is None or self.request.method not in SAFE_METHODS:
+            return None
+        fields, omit = self.get_param_names(self.fields_param), self.get_param_names(self.omit_param)
+        if not fields and not omit:
+            return None
+        available = list(self.get_serializer_class()(context=self.get_serializer_context()).fields)
+        for param, names in ((self.fields_param, fields), (self.omit_param, omit)):
+            unknown = [name for name in names if name not in available]
+            if unknown:
+                raise ValidationError({param: [f'Unknown fields: {", ".join(unknown)}.']})
+        return [name for name in available if (not fields or name in fields) and name not in omit]
+
+    def get_serializer(self, *args, **kwargs):
+        if self.sparse_fields is not None:
+            kwargs.setdefault('fields', self.sparse_fields)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_serializer_sources(self):
+        """
+        model fields read by the serializer, None when one of its fields
+        isn't backed by a model field
+        """
+        serializer = self.get_serializer()
+        model = serializer.Meta.model
+        sources = {model._meta.pk.name}
+        for field in serializer.fields.values():
+            if field.source == '*':
+                # identity fields only need their lookup field
+                if not hasattr(field, 'lookup_field'):
+                    return None
+                sources.add(field.lookup_field)
+                continue
+            name = field.source.split('.')[0]
+            try:
+                model._meta.get_field(name)
+            except FieldDoesNotExist:
+                return None
+            sources.add(name)
+        return sources
+
+    def narrow_queryset(self, queryset):
+        sources = self.get_serializer_sources()
+        if sources is None:
+            return queryset
+        meta = queryset.model._meta
+        return queryset.only(*(name for name in sources if meta.get_field(name).concrete))
@@ -0,0 +1,133 @@
+import hashlib
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+from rest_framework.serializers import Field
+
+from core.cache import invalidate_model
+
+# Pillow 9.1 moved the filters to Image.Resampling
+LANCZOS = getattr(Image, 'Resampling', Image).LANCZOS
+
+# name: (max width and height, pillow format, file extension)
+DEFAULT_RENDITIONS = {
+    'thumbnail': ((160, 160), 'JPEG', 'jpg'),
+    'medium': ((640, 640), 'JPEG', 'jpg'),
+    'webp': ((640, 640), 'WEBP', 'webp'),
+}
+
+
+def get_renditions():
+    return getattr(settings, 'IMAGE_RENDITIONS', DEFAULT_RENDITIONS)
+
+
+def file_digest(field_file):
+    sha1 = hashlib.sha1()
+    with field_file.storage.open(field_file.name, 'rb') as file:
+        for chunk in iter(lambda: file.read(64 * 1024), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def rendition_name(digest, rendition):
+    extension = get_renditions()[rendition][2]
+    return f'renditions/{digest[:2]}/{digest}-{rendition}.{extension}'
+
+
+def render(image, size, image_format):
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail(size, LANCZOS)
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    output = BytesIO()
+    image.save(output, image_format, quality=85, optimize=True)
+    return ContentFile(output.getvalue())
+
+
+def generate_renditions(field_file):
+    """
+    write the renditions of an image next to the media, named after the
+    content hash so identical uploads share them and nothing is rendered twice.
+    returns the digest, or '' when there is no readable image
+    """
+    if not field_file or not field_file.storage.exists(field_file.name):
+        return ''
+    storage = field_file.storage
+    digest = file_digest(field_file)
+    missing = [name for name in get_renditions() if not storage.exists(rendition_name(digest, name))]
+    if not missing:
+        return digest
+
+    try:
+        with storage.open(field_file.name, 'rb') as file:
+            image = Image.open(file)
+            image.load()
+    except (UnidentifiedImageError, OSError):
+        return ''
+    for name in missing:
+        size, image_format, _ = get_renditions()[name]
+        storage.save(rendition_name(digest, name), render(image, size, image_format))
+    return digest
+
+
+def mark_upload(instance, field_name):
+    """
+    pre_save helper, remembers whether the image field holds a new upload
+    """
+    field_file = getattr(instance, field_name)
+    setattr(instance, f'_{field_name}_uploaded', bool(field_file) and not field_file._committed)
+
+
+def process_upload(instance, field_name, digest_field):
+    """
+    post_save helper, renders a new upload and stores its digest
+    """
+    if not getattr(instance, f'_{field_name}_uploaded', False):
+        return
+    setattr(instance, f'_{field_name}_uploaded', False)
+    digest = generate_renditions(getattr(instance, field_name))
+    setattr(instance, digest_field, digest)
+    # a queryset update, saving again would run the signals again
+    values = store_digest(type(instance), instance.pk, digest_field, digest)
+    if 'updated' in values:
+        instance.updated = values['updated']
+    invalidate_model(type(instance))
+
+
+def store_digest(model, pk, digest_field, digest):
+    """
+    writes a digest with a queryset update and bumps `updated` with it when the
+    model has one, the renditions are part of the representation its validators cover.
+    the caller invalidates the cached responses of the model
+    """
+    values = {digest_field: digest}
+    if any(field.name == 'updated' for field in model._meta.concrete_fields):
+        values['updated'] = timezone.now()
+    model.objects.filter(pk=pk).update(**values)
+    return values
+
+
+class RenditionsField(Field):
+    """
+    read only {rendition: url} of an image from its digest field,
+    `image_field` is the model ImageField the renditions come from
+    """
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, digest):
+        if not digest:
+            return None
+        request = self.context.get('request')
+        storage = self.parent.Meta.model._meta.get_field(self.image_field).storage
+        urls = {}
+        for name in get_renditions():
+            url = storage.url(rendition_name(digest, name))
+            urls[name] = request.build_absolute_uri(url) if request is not None else url
+        return urls
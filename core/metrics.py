@@ -0,0 +1,298 @@
+"""
+request metrics per resolved route name, exposed at /api/_metrics in the
+Prometheus text format. every request counts its latency, status and response
+size. METRICS_SAMPLE_RATE of them also count their SQL queries, serializer time
+and response cache lookups, the other requests skip that instrumentation.
+the metrics are per process, a scraper sees the worker it reaches
+"""
+import asyncio
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.renderers import BaseRenderer
+
+from core.permissions import IsAdminOrMetricsAddress
+
+# upper bounds of the latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+current_sample = ContextVar('current_sample', default=None)
+
+
+class Sample:
+    """
+    what one sampled request spent, filled in while it runs
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.serializer_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper() hook
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_seconds += time.perf_counter() - start
+
+
+@contextmanager
+def measure_serializer():
+    """
+    adds the time of the block to the sampled request, nested blocks count once
+    """
+    sample = current_sample.get()
+    if sample is None:
+        yield
+        return
+    sample.serializer_depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        sample.serializer_depth -= 1
+        if not sample.serializer_depth:
+            sample.serializer_seconds += time.perf_counter() - start
+
+
+def record_cache_lookup(hit):
+    sample = current_sample.get()
+    if sample is not None:
+        if hit:
+            sample.cache_hits += 1
+        else:
+            sample.cache_misses += 1
+
+
+class TimedSerializerMixin:
+    """
+    to_representation() counted as serializer time of a sampled request
+    """
+
+    def to_representation(self, instance):
+        if current_sample.get() is None:
+            return super().to_representation(instance)
+        with measure_serializer():
+            return super().to_representation(instance)
+
+
+class RouteMetrics:
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.seconds = 0.0
+        self.statuses = {}
+        self.response_bytes = 0
+        self.sampled = 0
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, route, seconds, status, response_bytes, sample=None):
+        with self._lock:
+            metrics = self._routes.get(route)
+            if metrics is None:
+                metrics = self._routes[route] = RouteMetrics()
+            metrics.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            metrics.seconds += seconds
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+            metrics.response_bytes += response_bytes
+            if sample is not None:
+                metrics.sampled += 1
+                metrics.queries += sample.queries
+                metrics.query_seconds += sample.query_seconds
+                metrics.serializer_seconds += sample.serializer_seconds
+                metrics.cache_hits += sample.cache_hits
+                metrics.cache_misses += sample.cache_misses
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {route: vars(metrics).copy() | {'buckets': list(metrics.buckets),
+                                                   'statuses': dict(metrics.statuses)}
+                    for route, metrics in self._routes.items()}
+
+    def render(self):
+        """
+        the Prometheus text exposition format
+        """
+        routes = sorted(self.snapshot().items())
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(f'{name}{labels} {value}' for labels, value in samples)
+
+        def histogram():
+            for route, metrics in routes:
+                count = 0
+                for bound, bucket in zip((*LATENCY_BUCKETS, '+Inf'), metrics['buckets']):
+                    count += bucket
+                    yield f'_bucket{{route="{route}",le="{bound}"}}', count
+                yield f'_sum{{route="{route}"}}', metrics['seconds']
+                yield f'_count{{route="{route}"}}', count
+
+        lines.append('# HELP http_request_duration_seconds Request latency by route.')
+        lines.append('# TYPE http_request_duration_seconds histogram')
+        lines.extend(f'http_request_duration_seconds{suffix} {value}' for suffix, value in histogram())
+        family('http_requests_total', 'counter', 'Requests by route and status.',
+               ((f'{{route="{route}",status="{status}"}}', count)
+                for route, metrics in routes for status, count in sorted(metrics['statuses'].items())))
+        family('http_response_bytes_total', 'counter', 'Response body bytes by route, streams excluded.',
+               ((f'{{route="{route}"}}', metrics['response_bytes']) for route, metrics in routes))
+        for name, key, help_text in (
+                ('sampled_requests_total', 'sampled', 'Requests that were sampled for the metrics below.'),
+                ('db_queries_total', 'queries', 'SQL queries of the sampled requests.'),
+                ('db_query_duration_seconds_total', 'query_seconds', 'SQL time of the sampled requests.'),
+                ('serializer_duration_seconds_total', 'serializer_seconds',
+                 'Serializer time of the sampled requests.'),
+        ):
+            family(name, 'counter', help_text, ((f'{{route="{route}"}}', metrics[key]) for route, metrics in routes))
+        family('response_cache_lookups_total', 'counter', 'Response cache lookups of the sampled requests.',
+               ((f'{{route="{route}",result="{result}"}}', metrics[key])
+                for route, metrics in routes for result, key in (('hit', 'cache_hits'), ('miss', 'cache_misses'))
+                if metrics['cache_hits'] or metrics['cache_misses']))
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+@contextmanager
+def sample_queries():
+    """
+    counts the queries of this thread's connections into the sampled request.
+    the async views run their database work in pool threads, which enter it too
+    """
+    sample = current_sample.get()
+    if sample is None:
+        yield
+        return
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(sample))
+        yield
+
+
+class MetricsMiddleware:
+    """
+    first in MIDDLEWARE, so the latency covers the other middleware too.
+    sync and async capable, an async view isn't pushed to a thread for it
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    @staticmethod
+    def start_sample():
+        if random.random() < getattr(settings, 'METRICS_SAMPLE_RATE', 0):
+            return current_sample.set(Sample())
+        return None
+
+    @staticmethod
+    def record(request, response, start, token):
+        seconds = time.perf_counter() - start
+        sample = None
+        if token is not None:
+            sample = current_sample.get()
+            current_sample.reset(token)
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match is not None else 'unresolved'
+        response_bytes = 0 if response.streaming else len(response.content)
+        registry.record(route, seconds, response.status_code, response_bytes, sample)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            return self.get_response(request)
+        start, token = time.perf_counter(), self.start_sample()
+        try:
+            with sample_queries():
+                response = self.get_response(request)
+        except BaseException:
+            if token is not None:
+                current_sample.reset(token)
+            raise
+        self.record(request, response, start, token)
+        return response
+
+    async def __acall__(self, request):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            return await self.get_response(request)
+        start, token = time.perf_counter(), self.start_sample()
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            if token is not None:
+                current_sample.reset(token)
+            raise
+        self.record(request, response, start, token)
+        return response
+
+
+class PlainTextRenderer(BaseRenderer):
+    # renders the errors of metrics_view, the exposition is an HttpResponse of its own
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict) and 'detail' in data:
+            data = data['detail']
+        return f'{data}\n'.encode(self.charset)
+
+
+@api_view(['GET'])
+@renderer_classes([PlainTextRenderer])
+@permission_classes([IsAdminOrMetricsAddress])
+def metrics_view(request):
+    """
+    GET /api/_metrics, for superusers and the addresses in METRICS_ALLOWED_IPS
+    """
+    lines = [registry.render()]
+
+    # process wide counters of the subsystems
+    from core.cache import response_cache
+    from core.throttling import throttle_stats
+    cache = response_cache.stats()
+    lines.append('# HELP response_cache_requests_total Response cache lookups of every request.\n'
+                 '# TYPE response_cache_requests_total counter\n'
+                 f'response_cache_requests_total{{result="hit"}} {cache["hits"]}\n'
+                 f'response_cache_requests_total{{result="miss"}} {cache["misses"]}\n')
+    throttles = throttle_stats.stats()
+    lines.append('# HELP throttle_requests_total Throttle decisions by scope.\n'
+                 '# TYPE throttle_requests_total counter\n' + ''.join(
+                     f'throttle_requests_total{{scope="{scope}",result="{result}"}} {count}\n'
+                     for scope, counts in sorted(throttles.items()) for result, count in sorted(counts.items())))
+    return HttpResponse(''.join(lines), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,225 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class PagePagination(PageNumberPagination):
+    """
+    classic ?page=N pagination, runs a COUNT and an OFFSET scan per page
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class KeysetPagination(BasePagination):
+    """
+    cursor pagination on a unique ordering like ('-created', '-id')
+    every page is a single indexed range query, no matter how deep it is.
+    views choose the ordering with a `pagination_ordering` attribute, or a filter
+    backend with a `get_ordering(request, view)` method. NULLs sort last
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('id',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        self.page_size = api_settings.PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, view)
+        position, reverse = self.decode_cursor(request, queryset.model)
+
+        ordering = self.reverse_ordering(self.ordering) if reverse else self.ordering
+        nullable = self.get_nullable(queryset.model, ordering)
+        queryset = queryset.order_by(*self.order_expressions(ordering, nullable, reverse))
+        if position is not None:
+            queryset = queryset.filter(self.build_position_filter(ordering, position, nullable, reverse))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_previous, self.has_next = position is not None, has_more
+
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, request, view):
+        ordering = None
+        for backend in getattr(view, 'filter_backends', ()):
+            if hasattr(backend, 'get_ordering'):
+                ordering = backend().get_ordering(request, view)
+                if ordering:
+                    break
+        ordering = ordering or getattr(view, 'pagination_ordering', None) or self.ordering
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+        return tuple(ordering)
+
+    @staticmethod
+    def reverse_ordering(ordering):
+        return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+    @staticmethod
+    def get_nullable(model, ordering):
+        return {field.lstrip('-') for field in ordering if model._meta.get_field(field.lstrip('-')).null}
+
+    @staticmethod
+    def order_expressions(ordering, nullable=(), reverse=False):
+        """
+        order_by() arguments, NULLs last going forward and first going backward
+        """
+        expressions = []
+        for field in ordering:
+            name = field.lstrip('-')
+            if name not in nullable:
+                expressions.append(field)
+                continue
+            expression = F(name).desc if field.startswith('-') else F(name).asc
+            expressions.append(expression(nulls_first=True) if reverse else expression(nulls_last=True))
+        return expressions
+
+    @staticmethod
+    def build_position_filter(ordering, position, nullable=(), reverse=False):
+        """
+        (a, b) > (x, y) spelled out as a > x OR (a = x AND b > y), NULLs of the
+        `nullable` fields placed like order_expressions() places them
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            nulls_last = name in nullable and not reverse
+            if value is None:
+                if not nulls_last:
+                    condition |= equal & Q(**{f'{name}__isnull': False})
+                equal &= Q(**{f'{name}__isnull': True})
+                continue
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            after = Q(**{f'{name}__{lookup}': value})
+            if nulls_last:
+                after |= Q(**{f'{name}__isnull': True})
+            condition |= equal & after
+            equal &= Q(**{name: value})
+        return condition
+
+    def get_position(self, item):
+        names = [field.lstrip('-') for field in self.ordering]
+        if isinstance(item, dict):
+            return [item[name] for name in names]
+        return [getattr(item, name) for name in names]
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            values = cursor['p']
+            if len(values) != len(self.ordering):
+                raise ValueError
+            position = [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+            return position, bool(cursor.get('r'))
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position, reverse):
+        cursor = {'p': [value if value is None else str(value) for value in position]}
+        if reverse:
+            cursor['r'] = 1
+        encoded = urlsafe_b64encode(json.dumps(cursor, separators=(',', ':')).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.get_position(self.page[0]), reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class CatalogPagination(BasePagination):
+    """
+    keyset pagination for everyone, superusers may ask for ?page=N
+    to get numbered pages and a total count for admin tooling
+    """
+    keyset_class = KeysetPagination
+    page_class = PagePagination
+
+    def __init__(self):
+        self.paginator = self.keyset_class()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.page_class.page_query_param in request.query_params and request.user.is_superuser:
+            ordering = self.paginator.get_ordering(request, view)
+            nullable = self.paginator.get_nullable(queryset.model, ordering)
+            queryset = queryset.order_by(*self.paginator.order_expressions(ordering, nullable))
+            self.paginator = self.page_class()
+        return self.paginator.paginate_queryset(queryset, request, view=view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.paginator.get_paginated_response_schema(schema)
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+    @property
+    def display_page_controls(self):
+        return getattr(self.paginator, 'display_page_controls', False)
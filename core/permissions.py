@@ -1,5 +1,8 @@
+from django.conf import settings
 from rest_framework.permissions import BasePermission, SAFE_METHODS
 
+from .authentication import get_account
+
 
 class IsAdmin(BasePermission):
     
@@ -8,17 +11,36 @@ class IsAdmin(BasePermission):
 
 
 class IsAdminOrOwner(BasePermission):
+    """
+    checked against the account row, not the token's claims
+    """
 
     def has_object_permission(self, request, view, obj):
-        if request.user.is_superuser:
+        account = get_account(request.user, obj)
+        if account is None:
+            return False
+        if account.is_superuser:
             return True
-        return request.user == obj
+        return account == obj
 
 
 class IsOwner(BasePermission):
 
     def has_object_permission(self, request, view, obj):
-        return request.user == obj
+        account = get_account(request.user, obj)
+        return account is not None and account == obj
+
+
+class IsAdminOrMetricsAddress(BasePermission):
+    """
+    superusers, or any client from an address of METRICS_ALLOWED_IPS (none by default).
+    every signed up account is staff, is_staff doesn't set an operator apart
+    """
+
+    def has_permission(self, request, view):
+        if request.user and request.user.is_superuser:
+            return True
+        return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ())
 
 
 class AllowAny(BasePermission):
@@ -0,0 +1,172 @@
+"""
+query guard for development and CI. records the SQL of every request, warns
+about query shapes repeated within it (the N+1 pattern), checks the count
+against the route budget in QUERY_BUDGETS and logs slow queries with the line
+of the project that ran them. on when QUERY_GUARD_ENABLED, DEBUG by default
+"""
+import asyncio
+import logging
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('core.queryguard')
+slow_logger = logging.getLogger('core.queryguard.slow')
+
+current_recorder = ContextVar('current_recorder', default=None)
+
+# placeholder lists of any length and literal numbers (LIMIT 21) are the same shape
+PLACEHOLDERS = re.compile(r'\((?:%s, )*%s\)')
+NUMBERS = re.compile(r'\b\d+\b')
+# frames of these files never are the origin of a query
+GUARD_FILES = ('queryguard.py', 'metrics.py', 'asynchronous.py', 'testing.py')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_shape(sql):
+    return NUMBERS.sub('N', PLACEHOLDERS.sub('(...)', ' '.join(sql.split())))
+
+
+def query_origin():
+    """
+    'file:line in function' of the innermost project frame outside site-packages
+    """
+    base_dir = str(settings.BASE_DIR)
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (filename.startswith(base_dir) and 'site-packages' not in filename
+                and not filename.endswith(GUARD_FILES)):
+            return f'{filename[len(base_dir) + 1:]}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return 'unknown'
+
+
+class QueryRecorder:
+    """
+    connection.execute_wrapper() hook keeping the shape and time of every query.
+    the origin is looked up for slow queries and the first repeat of a shape only
+    """
+
+    def __init__(self, slow_ms=None):
+        self.slow_ms = slow_ms
+        self.count = 0
+        self.shapes = Counter()
+        self.origins = {}
+        self.slow = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            shape = query_shape(sql)
+            self.count += 1
+            self.shapes[shape] += 1
+            if self.shapes[shape] == 2:
+                self.origins[shape] = query_origin()
+            if self.slow_ms is not None and ms >= self.slow_ms:
+                self.slow.append((ms, sql, params, query_origin()))
+
+    def duplicates(self, threshold):
+        """
+        [(count, shape, origin of the first repeat)] of the shapes run `threshold` times or more
+        """
+        return [(count, shape, self.origins[shape]) for shape, count in self.shapes.most_common()
+                if count >= threshold > 1]
+
+
+@contextmanager
+def record_queries(recorder=None, using=None):
+    """
+    records the queries of this thread's connections (or `using`) into `recorder`,
+    by default the recorder of the guarded request if there is one
+    """
+    recorder = recorder or current_recorder.get()
+    if recorder is None:
+        yield None
+        return
+    with ExitStack() as stack:
+        for connection in ([connections[using]] if using else connections.all()):
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield recorder
+
+
+def check_request(route, recorder):
+    """
+    logs the duplicate shapes and slow queries of a request, then the budget
+    is checked: QueryBudgetExceeded with QUERY_GUARD_RAISE, else a warning
+    """
+    threshold = getattr(settings, 'QUERY_GUARD_DUPLICATES', 3)
+    for count, shape, origin in recorder.duplicates(threshold):
+        logger.warning('%s ran the same query %d times, first repeat at %s: %s', route, count, origin, shape)
+    for ms, sql, params, origin in recorder.slow:
+        slow_logger.warning('%s %.1f ms at %s: %s %r', route, ms, origin, sql, params)
+
+    budget = getattr(settings, 'QUERY_BUDGETS', {}).get(route)
+    if budget is not None and recorder.count > budget:
+        message = f'{route} ran {recorder.count} queries, budget is {budget}'
+        if getattr(settings, 'QUERY_GUARD_RAISE', False):
+            shapes = '\n'.join(f'{count} x {shape}' for shape, count in recorder.shapes.most_common())
+            raise QueryBudgetExceeded(f'{message}:\n{shapes}')
+        logger.warning(message)
+
+
+class QueryGuardMiddleware:
+    """
+    guards the queries of each request when QUERY_GUARD_ENABLED. the async
+    views record the queries of their pool threads through record_queries()
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    @staticmethod
+    def enabled():
+        return getattr(settings, 'QUERY_GUARD_ENABLED', settings.DEBUG)
+
+    @staticmethod
+    def check(request, response, recorder):
+        match = getattr(request, 'resolver_match', None)
+        check_request(match.view_name if match is not None else 'unresolved', recorder)
+        response['X-Query-Count'] = str(recorder.count)
+        return response
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not self.enabled():
+            return self.get_response(request)
+        recorder = QueryRecorder(getattr(settings, 'SLOW_QUERY_MS', None))
+        token = current_recorder.set(recorder)
+        try:
+            with record_queries(recorder):
+                response = self.get_response(request)
+        finally:
+            current_recorder.reset(token)
+        return self.check(request, response, recorder)
+
+    async def __acall__(self, request):
+        if not self.enabled():
+            return await self.get_response(request)
+        recorder = QueryRecorder(getattr(settings, 'SLOW_QUERY_MS', None))
+        token = current_recorder.set(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_recorder.reset(token)
+        return self.check(request, response, recorder)
@@ -0,0 +1,115 @@
+"""
+streaming renderers for full list exports, a list is written item by item
+while the queryset is read in chunks, memory use doesn't grow with the list
+"""
+from itertools import islice
+
+from django.db.models import prefetch_related_objects
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.settings import api_settings
+
+
+class StreamingRenderer(BaseRenderer):
+    """
+    views check for this class and hand stream() an iterator of items,
+    render() is used for everything else, like error responses
+    """
+    item_renderer = JSONRenderer()
+
+    def render_item(self, item):
+        return self.item_renderer.render(item)
+
+    def stream(self, items):
+        raise NotImplementedError
+
+
+class NDJSONRenderer(StreamingRenderer):
+    """
+    one JSON document per line
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return b''.join(self.stream(data if isinstance(data, list) else [data]))
+
+    def stream(self, items):
+        for item in items:
+            yield self.render_item(item) + b'\n'
+
+
+class JSONArrayRenderer(StreamingRenderer):
+    """
+    a plain JSON array written item by item, ?format=json-stream
+    """
+    media_type = 'application/json'
+    format = 'json-stream'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return self.render_item(data)
+
+    def stream(self, items):
+        yield b'['
+        for index, item in enumerate(items):
+            yield (b',' if index else b'') + self.render_item(item)
+        yield b']'
+
+
+STREAMING_RENDERER_CLASSES = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer, JSONArrayRenderer]
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def stream_representations(queryset, serializer, chunk_size=1000, representation=None):
+    """
+    representations of every object of `queryset`, read with iterator(). from
+    values() rows when a FastRepresentation is given, else through `serializer`
+    (a child serializer) with the prefetches done per chunk
+    """
+    if representation is not None:
+        rows = representation.values(queryset).iterator(chunk_size=chunk_size)
+        for chunk in chunked(rows, chunk_size):
+            yield from representation.to_representation(chunk)
+        return
+
+    # iterator() skips prefetch_related() before Django 4.1
+    lookups = queryset._prefetch_related_lookups
+    for chunk in chunked(queryset.iterator(chunk_size=chunk_size), chunk_size):
+        prefetch_related_objects(chunk, *lookups)
+        for instance in chunk:
+            yield serializer.to_representation(instance)
+
+
+def streaming_response(renderer, items):
+    return StreamingHttpResponse(renderer.stream(items), content_type=renderer.media_type)
+
+
+class StreamingListMixin:
+    """
+    list actions of a viewset stream every object, unpaginated, when a
+    streaming renderer was negotiated (?format=ndjson or ?format=json-stream)
+    """
+    renderer_classes = STREAMING_RENDERER_CLASSES
+    stream_chunk_size = 1000
+
+    def list_response(self, queryset):
+        renderer = self.request.accepted_renderer
+        if not isinstance(renderer, StreamingRenderer):
+            return super().list_response(queryset)
+        if not queryset.ordered:
+            queryset = queryset.order_by(*(getattr(self, 'pagination_ordering', None) or ('pk',)))
+        get_fast_representation = getattr(self, 'get_fast_representation', None)
+        representation = get_fast_representation() if get_fast_representation else None
+        items = stream_representations(queryset, self.get_serializer(), self.stream_chunk_size, representation)
+        return streaming_response(renderer, items)
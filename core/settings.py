@@ -26,6 +26,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'core',
     'accounts',
     'books',
 
@@ -33,6 +34,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
+    'core.queryguard.QueryGuardMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -70,9 +73,109 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # a connection per thread kept between requests, checked at the start of each, see core.db
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# set on every new SQLite connection, see core.db. the journal mode is stored in the
+# database file, a deployment adds 'journal_mode': 'WAL' for reads concurrent with
+# writes. it's left out here so the committed development db.sqlite3 keeps its mode
+SQLITE_PRAGMAS = {
+    # in WAL mode only, see core.db
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    # KiB when negative
+    'cache_size': -20000,
+    'mmap_size': 256 * 2 ** 20,
+    'temp_store': 'MEMORY',
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # serialized catalog responses, least recently used entries are culled first
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+}
+
+RESPONSE_CACHE_ALIAS = 'catalog'
+
+# request metrics at /api/_metrics. latency, status and response size are counted
+# for every request, SQL and serializer time and response cache lookups for the
+# sampled share of them
+METRICS_ENABLED = True
+METRICS_SAMPLE_RATE = 0.1
+# besides superusers, clients of these addresses may read /api/_metrics without
+# a token. behind a reverse proxy on the same host every request comes from the
+# proxy, so listing 127.0.0.1 there would open the metrics to anyone
+METRICS_ALLOWED_IPS = []
+
+# query guard, see core.queryguard. a route running more queries than its budget
+# is logged, or fails with QUERY_GUARD_RAISE like it does in the test runner
+QUERY_GUARD_ENABLED = DEBUG
+QUERY_GUARD_RAISE = False
+# a query shape run this many times in one request is logged as a likely N+1,
+# search runs its ranked query once per model
+QUERY_GUARD_DUPLICATES = 4
+SLOW_QUERY_MS = 100
+# most queries a request to the route may run, whatever the method. they leave
+# room for the 2 queries of the token revocation list reload
+QUERY_BUDGETS = {
+    'book-list': 5, 'book-detail': 5, 'author-books': 4, 'genre-books': 4,
+    'author-list': 7, 'author-detail': 8, 'genre-list': 7, 'genre-detail': 8,
+    'book-bulk': 14, 'book-cover': 3, 'book-download': 3, 'search': 7,
+    'async-book-list': 4, 'async-book-detail': 4, 'async-author-books': 4, 'async-genre-books': 4,
+    'async-author-list': 4, 'async-author-detail': 4, 'async-genre-list': 4, 'async-genre-detail': 4,
+    'accounts': 3, 'account-detail': 5, 'account-create': 6, 'account-update': 12,
+    'account-change-password': 13, 'account-delete': 16,
+    'token_obtain_pair': 4, 'token_refresh': 4, 'token_revoke': 14,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+        'slow_queries': {'class': 'logging.FileHandler', 'filename': BASE_DIR / 'slow_queries.log', 'delay': True},
+    },
+    'loggers': {
+        'core.queryguard': {'handlers': ['console'], 'level': 'WARNING'},
+        'core.queryguard.slow': {'handlers': ['slow_queries'], 'level': 'WARNING', 'propagate': False},
+    },
+}
+
+
+# Password hashing, see accounts.hashing. hashes made by the other hashers are
+# upgraded to the first one at the next login
+
+PASSWORD_HASHERS = [
+    'accounts.hashing.ScryptPasswordHasher',
+    'accounts.hashing.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+
+# cost parameters per algorithm, scrypt's take about 75ms a hash on one core. retune with
+# python manage.py bench_hashing, hashes with other parameters are upgraded at login
+PASSWORD_HASHER_PARAMS = {
+    'scrypt': {'work_factor': 2 ** 14, 'block_size': 8, 'parallelism': 1},
+    'argon2': {'time_cost': 2, 'memory_cost': 65536, 'parallelism': 1},
+}
+
+# processes hashing passwords, 0 hashes in the request's thread
+PASSWORD_HASHING_WORKERS = 0
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -121,12 +224,49 @@ AUTH_USER_MODEL = "accounts.Account"
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media/'
 
+# book downloads are streamed by django unless a front server sends them:
+# 'x-accel-redirect' for nginx (internal location at MEDIA_ACCEL_REDIRECT_PREFIX) or 'x-sendfile'
+MEDIA_DOWNLOAD_OFFLOAD = None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+        'core.authentication.JWTClaimsAuthentication',
+    ),
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.CatalogPagination',
+    'PAGE_SIZE': 20,
+    'DEFAULT_THROTTLE_CLASSES': (
+        'core.throttling.ClientThrottle',
+        'core.throttling.ScopedThrottle',
+    ),
+    # clients are told apart by REMOTE_ADDR, a spoofed X-Forwarded-For is ignored.
+    # behind a reverse proxy set the number of proxies
+    'NUM_PROXIES': 0,
+}
+
+# token bucket throttles, see core.throttling. the buckets are kept in this SQLite
+# file, shared by the worker processes of the host. None keeps them per process
+THROTTLE_STORE_PATH = BASE_DIR / 'throttle.sqlite3'
+THROTTLE_RATES = {
+    # every request of a client
+    'anon': '600/min',
+    'user': '1200/min',
+    # throttle_scope of the views
+    'catalog': '300/min',
+    'search': '60/min',
+    'login': '10/min',
+    'signup': '10/hour',
+    # login attempts on one username from one address
+    'login_username': '5/min',
 }
 
+TEST_RUNNER = 'core.testing.TestRunner'
+
+# validated access tokens kept by core.authentication, least recently used dropped first
+JWT_VERIFIED_TOKEN_CACHE_SIZE = 4096
+# seconds between reloads of the revoked tokens from the database, see accounts.revocation
+TOKEN_REVOCATION_REFRESH = 30
+
 SIMPLE_JWT = {
 'ACCESS_TOKEN_LIFETIME': timedelta(days=10),
 'REFRESH_TOKEN_LIFETIME': timedelta(days=20),
@@ -147,7 +287,9 @@ SIMPLE_JWT = {
 'TOKEN_TYPE_CLAIM': 'token_type',
 
 'JTI_CLAIM': 'jti',
-'TOKEN_USER_CLASS': 'rest_framework_simplejwt.models.TokenUser',
+'TOKEN_USER_CLASS': 'core.authentication.TokenUser',
+'TOKEN_OBTAIN_SERIALIZER': 'accounts.serializers.AccountTokenObtainPairSerializer',
+'TOKEN_REFRESH_SERIALIZER': 'accounts.serializers.AccountTokenRefreshSerializer',
 
 'SLIDING_TOKEN_REFRESH_EXP_CLAIM': 'refresh_exp',
 'SLIDING_TOKEN_LIFETIME': timedelta(days=10),
@@ -0,0 +1,48 @@
+from contextlib import contextmanager
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from core.queryguard import QueryRecorder, record_queries
+
+
+class TestRunner(DiscoverRunner):
+    """
+    throttling is off, tests of it turn it on with override_settings(THROTTLE_ENABLED=True).
+    the query guard is on and a request over its route budget fails the test
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.test_settings = override_settings(THROTTLE_ENABLED=False, THROTTLE_STORE_PATH=None,
+                                               QUERY_GUARD_ENABLED=True, QUERY_GUARD_RAISE=True, SLOW_QUERY_MS=None)
+        self.test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.test_settings.disable()
+        super().teardown_test_environment(**kwargs)
+
+
+class QueryBudgetMixin:
+    """
+    test case mixin to assert how many SQL queries an endpoint or a block may run,
+    and that no query shape repeats `duplicates` times or more
+    """
+
+    @contextmanager
+    def assertMaxQueries(self, budget, duplicates=None, using='default', name='the block'):
+        recorder = QueryRecorder()
+        with record_queries(recorder, using=using):
+            yield recorder
+        shapes = '\n'.join(f'{count} x {shape}' for shape, count in recorder.shapes.most_common())
+        self.assertLessEqual(recorder.count, budget,
+                             f'{name} ran {recorder.count} queries, budget is {budget}:\n{shapes}')
+        if duplicates is not None:
+            repeated = [f'{count} x {shape}, first repeat at {origin}'
+                        for count, shape, origin in recorder.duplicates(duplicates)]
+            self.assertFalse(repeated, f'{name} repeated queries:\n' + '\n'.join(repeated))
+
+    def assertQueryBudget(self, budget, url, method='get', duplicates=None, **kwargs):
+        with self.assertMaxQueries(budget, duplicates, name=f'{method.upper()} {url}'):
+            response = getattr(self.client, method)(url, **kwargs)
+        return response
@@ -0,0 +1,230 @@
+"""
+token bucket throttling. a bucket per scope and client holds `capacity` requests
+and refills at capacity per period: bursts pass up to the capacity, the sustained
+rate is capped. buckets live in a SQLite file shared by the worker processes of
+a host, no external server needed, or in process memory
+"""
+import math
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """
+    '10/min' -> (10, 60)
+    """
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+class MemoryBucketStore:
+    """
+    buckets of this process only
+    """
+    prune_every = 1000
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._consumed = 0
+
+    def consume(self, key, capacity, period, now=None):
+        """
+        take a request from the bucket, returns 0 or the seconds until one is available
+        """
+        now = time.time() if now is None else now
+        rate = capacity / period
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            # when the bucket is full again it's the same as no bucket
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            self._consumed += 1
+            if self._consumed % self.prune_every == 0:
+                self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[2] > now}
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLiteBucketStore:
+    """
+    buckets in a SQLite file, every process and thread of the host opening the
+    same `path` shares them. a bucket is read and written in one write
+    transaction, the requests of all workers are counted exactly
+    """
+    prune_every = 1000
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+        self._consumed = 0
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            # losing buckets in a crash only forgets some requests
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS buckets '
+                '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL) '
+                'WITHOUT ROWID')
+            self._local.connection = connection
+        return connection
+
+    def consume(self, key, capacity, period, now=None):
+        now = time.time() if now is None else now
+        rate = capacity / period
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            connection.execute('INSERT OR REPLACE INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)',
+                               (key, tokens, now, now + (capacity - tokens) / rate))
+            self._consumed += 1
+            if self._consumed % self.prune_every == 0:
+                connection.execute('DELETE FROM buckets WHERE full_at <= ?', (now,))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return wait
+
+    def clear(self):
+        self.connection.execute('DELETE FROM buckets')
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """
+    the SQLite store at THROTTLE_STORE_PATH, a memory store when it's None
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            path = getattr(settings, 'THROTTLE_STORE_PATH', None)
+            _store = SQLiteBucketStore(path) if path else MemoryBucketStore()
+        return _store
+
+
+@receiver(setting_changed)
+def reset_store(setting, **kwargs):
+    global _store
+    if setting == 'THROTTLE_STORE_PATH':
+        with _store_lock:
+            _store = None
+
+
+class ThrottleStats:
+    """
+    allowed and throttled requests per scope since the process started
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: {'allowed': 0, 'throttled': 0})
+
+    def record(self, scope, allowed):
+        with self._lock:
+            self._counts[scope]['allowed' if allowed else 'throttled'] += 1
+
+    def stats(self):
+        with self._lock:
+            return {scope: dict(counts) for scope, counts in self._counts.items()}
+
+    def reset_stats(self):
+        with self._lock:
+            self._counts.clear()
+
+
+throttle_stats = ThrottleStats()
+
+
+class BucketThrottle(BaseThrottle):
+    """
+    a token bucket per client with the rate THROTTLE_RATES[scope]. clients are
+    users when authenticated, else IP addresses. no rate, no throttling
+    """
+    scope = None
+
+    def get_scope(self, request, view):
+        return self.scope
+
+    def get_client(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+    def allow_request(self, request, view):
+        self.wait_seconds = 0.0
+        if not getattr(settings, 'THROTTLE_ENABLED', True):
+            return True
+        scope = self.get_scope(request, view)
+        rate = getattr(settings, 'THROTTLE_RATES', {}).get(scope)
+        client = self.get_client(request, view) if rate else None
+        if client is None:
+            return True
+        capacity, period = parse_rate(rate)
+        self.wait_seconds = get_store().consume(f'{scope}:{client}', capacity, period)
+        throttle_stats.record(scope, allowed=not self.wait_seconds)
+        return not self.wait_seconds
+
+    def wait(self):
+        # Retry-After is sent in whole seconds
+        return math.ceil(self.wait_seconds)
+
+
+class ClientThrottle(BucketThrottle):
+    """
+    every request of a client, the 'user' or 'anon' rate
+    """
+
+    def get_scope(self, request, view):
+        return 'user' if request.user and request.user.is_authenticated else 'anon'
+
+
+class ScopedThrottle(BucketThrottle):
+    """
+    the requests of a client to the views with the same `throttle_scope`
+    """
+
+    def get_scope(self, request, view):
+        return getattr(view, 'throttle_scope', None)
+
+
+class LoginThrottle(BucketThrottle):
+    """
+    login attempts on one username from one address. keyed on the username
+    alone, a client could lock the user out of every other address
+    """
+    scope = 'login_username'
+
+    def get_client(self, request, view):
+        username = request.data.get('username') if hasattr(request.data, 'get') else None
+        if not username:
+            return None
+        return f'username:{str(username).lower()}:ip:{self.get_ident(request)}'
@@ -3,8 +3,11 @@ from django.urls import path, include
 from django.conf.urls.static import static
 from django.conf import settings
 
+from core.metrics import metrics_view
+
 urlpatterns = [
                   path('admin/', admin.site.urls),
+                  path('api/_metrics', metrics_view, name='metrics'),
                   path('api/accounts/', include('accounts.urls')),
                   path('api/', include('books.urls'))
               ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)